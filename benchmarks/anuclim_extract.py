@@ -0,0 +1,303 @@
+"""Check and time the ANUClim point extract against local NetCDF files.
+
+The fixture in data/anuclim holds a small grid (60 days, 60 x 80 cells
+at 0.01 degree, partly masked) of every ANUClim variable, in the layout of
+the published files. Occurrences are drawn at random (seeded) within it.
+
+The extract process (ANUClimDailyExtractNetCDF4) is run against the
+fixture via [anuclim:sources], and its output compared with a naive
+reference reading one point per row and variable. Grid reads are counted,
+to show how point reads are coalesced into hyperslab reads.
+
+It then extracts all variables with 1 and 5 worker threads ([anuclim]
+max_workers), with latency injected into every dataset open and slab
+read to mimic a remote OPeNDAP server, in two ways:
+
+- netcdf4: the latency is added while holding the netCDF library lock.
+  This is how the 'opendap' backend behaves: netCDF4 waits for the
+  network inside the C library call, under the process wide lock, so
+  netCDF4 opens and variable reads stay serialised and extra worker
+  threads gain (next to) nothing.
+- pydap: the latency is added outside the lock, like network waits of
+  the 'pydap' backend (plain Python HTTP requests), which overlap between
+  worker threads.
+
+Usage:
+
+    python benchmarks/anuclim_extract.py [--rows 2000] [--open-latency 0.3] [--read-latency 0.02]
+    python benchmarks/anuclim_extract.py --make-fixture
+"""
+import argparse
+import csv
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+import time
+import types
+
+from netCDF4 import Dataset
+import numpy as np
+
+from pywps import configuration as config
+
+from ecocloud_wps_demo.anuclim import backends
+from ecocloud_wps_demo.anuclim.backends import VARIABLES
+
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'anuclim')
+
+# fixture grid
+START_DATE = datetime.date(1980, 1, 1)
+DAYS = 60
+LATS = -10 - 0.01 * np.arange(60)
+LONS = 140 + 0.01 * np.arange(80)
+FILL_VALUE = -999.0
+
+
+def make_fixture(folder=FIXTURE):
+    """Write one NetCDF file per ANUClim variable into folder."""
+    os.makedirs(folder, exist_ok=True)
+    epoch = datetime.date(1970, 1, 1)
+    days = (START_DATE - epoch).days + np.arange(DAYS)
+    t, y, x = np.meshgrid(np.arange(DAYS), np.arange(len(LATS)), np.arange(len(LONS)), indexing='ij')
+    for offset, var in enumerate(sorted(VARIABLES)):
+        values = 10 + offset + 5 * np.sin(t / 9.0 + offset) + 0.1 * y - 0.05 * x
+        # mask a corner, like the sea in the published grids
+        values[:, :10, :10] = FILL_VALUE
+        with Dataset(os.path.join(folder, '{}.nc'.format(var)), 'w') as ds:
+            ds.createDimension('time', DAYS)
+            ds.createDimension('lat', len(LATS))
+            ds.createDimension('lon', len(LONS))
+            ds.createVariable('time', 'f8', ('time',))[:] = days
+            ds['time'].units = 'days since 1970-01-01 00:00:00'
+            ds.createVariable('lat', 'f8', ('lat',))[:] = LATS
+            ds.createVariable('lon', 'f8', ('lon',))[:] = LONS
+            grid = ds.createVariable(VARIABLES[var]['variable'], 'f4', ('time', 'lat', 'lon'),
+                                     fill_value=FILL_VALUE, zlib=True, least_significant_digit=1)
+            grid[:] = np.ma.masked_equal(values, FILL_VALUE)
+
+
+def make_occurrences(filename, rows, seed=0):
+    """Write rows random occurrences within the fixture grid."""
+    rng = np.random.RandomState(seed)
+    with open(filename, 'w', newline='') as fp:
+        writer = csv.writer(fp)
+        writer.writerow(['id', 'lat', 'lon', 'date'])
+        for row in range(rows):
+            date = START_DATE + datetime.timedelta(days=int(rng.randint(DAYS)))
+            writer.writerow([row, round(rng.uniform(LATS[-1], LATS[0]), 4),
+                             round(rng.uniform(LONS[0], LONS[-1]), 4), date.isoformat()])
+
+
+def extract_reference(filename, variables, folder=FIXTURE):
+    """Return the values of variables at each row of csv file, read one
+    point at a time (nearest cell, '' if masked)."""
+    grids = {}
+    for var in variables:
+        ds = Dataset(os.path.join(folder, '{}.nc'.format(var)))
+        epoch = datetime.date(1970, 1, 1)
+        grids[var] = (ds, ds['time'][:], ds['lat'][:], ds['lon'][:], epoch)
+    result = []
+    with open(filename, newline='') as fp:
+        for row in csv.DictReader(fp):
+            values = []
+            for var in variables:
+                ds, times, lats, lons, epoch = grids[var]
+                day = (datetime.datetime.strptime(row['date'], '%Y-%m-%d').date() - epoch).days
+                value = ds[VARIABLES[var]['variable']][
+                    np.abs(times - day).argmin(),
+                    np.abs(lats - float(row['lat'])).argmin(),
+                    np.abs(lons - float(row['lon'])).argmin()]
+                values.append('' if value is np.ma.masked else value.item())
+            result.append(values)
+    for ds, _, _, _, _ in grids.values():
+        ds.close()
+    return result
+
+
+class ReadCounter(object):
+    """Count point and slab reads of NetCDF grids."""
+
+    def __init__(self):
+        self.values = 0
+        self.slabs = 0
+        self._read_value = backends.NetCDFGrid.read_value
+        self._read_slab = backends.NetCDFGrid.read_slab
+
+    def __enter__(self):
+        counter = self
+
+        def read_value(grid, t, y, x):
+            counter.values += 1
+            return counter._read_value(grid, t, y, x)
+
+        def read_slab(grid, start, stop):
+            counter.slabs += 1
+            return counter._read_slab(grid, start, stop)
+
+        backends.NetCDFGrid.read_value = read_value
+        backends.NetCDFGrid.read_slab = read_slab
+        return self
+
+    def __exit__(self, *exc):
+        backends.NetCDFGrid.read_value = self._read_value
+        backends.NetCDFGrid.read_slab = self._read_slab
+
+
+def configure(workdir, folder=FIXTURE, max_workers=5, max_slab_cells=None):
+    """Point all variables at the fixture, without caches or shards."""
+    config.load_configuration()
+    config.CONFIG.set('server', 'workdir', workdir)
+    for section in ('anuclim', 'anuclim:sources'):
+        if not config.CONFIG.has_section(section):
+            config.CONFIG.add_section(section)
+    config.CONFIG.set('anuclim', 'processes', '1')
+    config.CONFIG.set('anuclim', 'chunk_cache_size_mb', '0')
+    config.CONFIG.set('anuclim', 'max_workers', str(max_workers))
+    if max_slab_cells is not None:
+        config.CONFIG.set('anuclim', 'max_slab_cells', str(max_slab_cells))
+    for var in VARIABLES:
+        config.CONFIG.set('anuclim:sources', var, 'netcdf:{}'.format(os.path.join(folder, '{}.nc'.format(var))))
+
+
+def run_extract(filename, variables, workdir):
+    """Run the extract process on csv file, returns its output rows
+    (values of variables only)."""
+    from ecocloud_wps_demo.processes.anuclim_daily_extract_netcdf4 import ANUClimDailyExtractNetCDF4
+
+    process = ANUClimDailyExtractNetCDF4()
+    process.workdir = tempfile.mkdtemp(dir=workdir)
+    request = types.SimpleNamespace(inputs={
+        'variables': [types.SimpleNamespace(data=var) for var in variables],
+        'csv': [types.SimpleNamespace(file=filename)],
+    })
+    output = types.SimpleNamespace(file=None, data_format=types.SimpleNamespace(mime_type='text/csv'))
+    response = types.SimpleNamespace(outputs={'output': output},
+                                     update_status=lambda message, percent: None)
+    process._handler(request, response)
+    with open(output.file, newline='') as fp:
+        rows = list(csv.reader(fp))
+    return [row[-len(variables):] for row in rows[1:]]
+
+
+class Latency(object):
+    """Sleep open_latency seconds per dataset open, read_latency per slab
+    read.
+
+    If locked is True the sleep holds the netCDF library lock, like network
+    waits within netCDF4 (OPeNDAP), otherwise it runs concurrently, like
+    network waits of pydap.
+    """
+
+    def __init__(self, open_latency, read_latency, locked):
+        self.open_latency = open_latency
+        self.read_latency = read_latency
+        self.locked = locked
+        self._backends = dict(backends.BACKENDS)
+        self._read_slab = backends.NetCDFGrid.read_slab
+
+    def wait(self, seconds):
+        if self.locked:
+            with backends.netcdf_lock:
+                time.sleep(seconds)
+        else:
+            time.sleep(seconds)
+
+    def __enter__(self):
+        latency = self
+
+        def slow(open_backend):
+            def open_slowly(location, variable):
+                latency.wait(latency.open_latency)
+                return open_backend(location, variable)
+            return open_slowly
+
+        def read_slab(grid, start, stop):
+            latency.wait(latency.read_latency)
+            return latency._read_slab(grid, start, stop)
+
+        for name, open_backend in self._backends.items():
+            backends.BACKENDS[name] = slow(open_backend)
+        backends.NetCDFGrid.read_slab = read_slab
+        return self
+
+    def __exit__(self, *exc):
+        backends.BACKENDS.update(self._backends)
+        backends.NetCDFGrid.read_slab = self._read_slab
+
+
+def _same(expected, actual):
+    return all(
+        len(a) == len(b) and all((x == '' and y == '') or (x != '' and y != '' and float(x) == float(y))
+                                 for x, y in zip(a, b))
+        for a, b in zip(expected, actual)
+    ) and len(expected) == len(actual)
+
+
+def check_reads(filename, variables, workdir, max_slab_cells):
+    configure(workdir, max_slab_cells=max_slab_cells)
+    expected = extract_reference(filename, variables)
+    with ReadCounter() as counter:
+        actual = run_extract(filename, variables, workdir)
+    masked = sum(value == '' for row in expected for value in row)
+    print('{} rows x {} variables ({} masked): {} point reads, {} slab reads (naive: {} point reads), output {}'.format(
+        len(expected), len(variables), masked, counter.values, counter.slabs, len(expected) * len(variables),
+        'identical' if _same(expected, actual) else 'DIFFERS'))
+    return _same(expected, actual)
+
+
+def time_workers(filename, workdir, max_slab_cells, workers, open_latency, read_latency):
+    from ecocloud_wps_demo.anuclim.handles import get_handle_pool
+
+    variables = sorted(VARIABLES)
+    for model, locked in (('netcdf4', True), ('pydap', False)):
+        for max_workers in workers:
+            configure(workdir, max_workers=max_workers, max_slab_cells=max_slab_cells)
+            # open every dataset again, rather than reusing the previous run's handles
+            get_handle_pool().clear()
+            with Latency(open_latency, read_latency, locked), ReadCounter() as counter:
+                start = time.time()
+                run_extract(filename, variables, workdir)
+                elapsed = time.time() - start
+            print('{} latency, {} variables, {} workers: {:.2f}s ({} slab reads)'.format(
+                model, len(variables), max_workers, elapsed, counter.slabs))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rows', type=int, default=2000, help='number of occurrences (default: %(default)s)')
+    parser.add_argument('--variables', default='temp_max,temp_min',
+                        help='comma separated variables to extract (default: %(default)s)')
+    parser.add_argument('--max-slab-cells', type=int, default=4096,
+                        help='hyperslab budget, small to match the fixture size (default: %(default)s)')
+    parser.add_argument('--workers', default='1,5',
+                        help='comma separated max_workers to time (default: %(default)s)')
+    parser.add_argument('--open-latency', type=float, default=0.3,
+                        help='seconds added to every dataset open (default: %(default)s)')
+    parser.add_argument('--read-latency', type=float, default=0.02,
+                        help='seconds added to every slab read (default: %(default)s)')
+    parser.add_argument('--make-fixture', action='store_true', help='(re)write the fixture and exit')
+    args = parser.parse_args(argv)
+
+    if args.make_fixture:
+        make_fixture()
+        print('Wrote fixture to {}'.format(FIXTURE))
+        return 0
+
+    variables = args.variables.split(',')
+    workdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(workdir, 'occurrences.csv')
+        make_occurrences(filename, args.rows)
+        ok = check_reads(filename, variables, workdir, args.max_slab_cells)
+        time_workers(filename, workdir, args.max_slab_cells, [int(w) for w in args.workers.split(',')],
+                     args.open_latency, args.read_latency)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
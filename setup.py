@@ -39,7 +39,13 @@ setup(
         'python-swiftclient',
         'python-keystoneclient'
     ],
+    extras_require={
+        'test': ['pytest', 'netCDF4', 'pyarrow'],
+    },
     entry_points={
+        'console_scripts': [
+            'anuclim-materialize = ecocloud_wps_demo.anuclim.materialize:main',
+        ],
         'paste.app_factory': [
             'main = ecocloud_wps_demo:main',
         ],
@@ -27,6 +27,12 @@ def main(global_config, **settings):
         if not os.path.exists(dirname):
             os.makedirs(dirname)
 
+    # start plot render workers, so that they are ready for the first plot
+    from ecocloud_wps_demo.exploratory.render import get_render_pool
+    render_pool = get_render_pool()
+    if render_pool is not None:
+        render_pool.warm()
+
     # TODO: init swift container here?
     # initialize swift storage container if active
     if wpsconfig.get_config_value('server', 'storage') == 'SwiftStorage':
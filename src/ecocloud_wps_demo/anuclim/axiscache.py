@@ -0,0 +1,80 @@
+import hashlib
+import json
+import logging
+import os
+import os.path
+import tempfile
+
+import numpy as np
+
+from pywps import configuration as config
+
+
+def get_axis_cache():
+    """Return the AxisCache configured in pywps.cfg.
+
+    The cache lives in [anuclim] axis_cache_dir, or in a folder within the
+    pywps workdir if not set.
+    """
+    path = config.get_config_value('anuclim', 'axis_cache_dir')
+    if not path:
+        path = os.path.join(config.get_config_value('server', 'workdir'), 'anuclim_axes')
+    return AxisCache(path)
+
+
+class AxisCache(object):
+    """On disk cache for coordinate axes of remote datasets.
+
+    Axes are stored as .npy files and loaded memory mapped. The file name is
+    a hash of dataset url, axis name and the axis metadata (shape, dtype,
+    units ...) as reported by the remote dataset. If the metadata changes,
+    the cached file no longer matches and the axis is fetched again.
+
+    Files are written to a temporary name and renamed into place, so
+    several threads or processes can safely share the same cache folder.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _filename(self, url, name, meta):
+        key = json.dumps([url, name, meta], sort_keys=True, default=str)
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, '{}.npy'.format(digest))
+
+    def get(self, url, name, meta, fetch):
+        """Return axis name of dataset url.
+
+        meta is a json serialisable dict describing the axis, and has to
+        contain the axis 'shape'. fetch() is called to download the axis if
+        there is no valid cached copy.
+        """
+        log = logging.getLogger(__name__)
+        filename = self._filename(url, name, meta)
+        try:
+            axis = np.load(filename, mmap_mode='r')
+            if list(axis.shape) == list(meta['shape']):
+                return axis
+            log.warn('Cached axis {} for {} has wrong shape'.format(name, url))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            log.warn('Failed to load cached axis {} for {}: {}'.format(name, url, e))
+        axis = np.asarray(np.ma.getdata(fetch()))
+        try:
+            self._store(filename, axis)
+        except Exception as e:
+            # caching is best effort
+            log.warn('Failed to cache axis {} for {}: {}'.format(name, url, e))
+        return axis
+
+    def _store(self, filename, axis):
+        os.makedirs(self.path, exist_ok=True)
+        fd, tmpname = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                np.save(fp, axis)
+            os.replace(tmpname, filename)
+        except Exception:
+            os.unlink(tmpname)
+            raise
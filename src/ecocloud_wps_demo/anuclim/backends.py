@@ -0,0 +1,382 @@
+import logging
+import os
+import threading
+
+import numpy as np
+
+from pywps import configuration as config
+
+from ecocloud_wps_demo.anuclim.axiscache import get_axis_cache
+from ecocloud_wps_demo.anuclim.handles import get_handle_pool
+
+
+# the netCDF C library is not thread safe, so all calls into it from the
+# per variable worker threads are serialised (OPeNDAP requests of netCDF4
+# wait for the network within these calls, so they don't overlap either)
+netcdf_lock = threading.Lock()
+
+
+def _reset_lock():
+    # another thread may have held the lock at fork time, it would never
+    # be released in the child
+    global netcdf_lock
+    netcdf_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_lock)
+
+VARIABLES = {
+    'rainfall': {
+        'url': 'http://dapds00.nci.org.au/thredds/dodsC/rr9/eMAST_data/ANUClimate/ANUClimate_v1-0_rainfall_daily_0-01deg_1970-2014',
+        'variable': 'lwe_thickness_of_precipitation_amount',
+    },
+    'temp_max': {
+        'url': 'http://dapds00.nci.org.au/thredds/dodsC/rr9/eMAST_data/ANUClimate/ANUClimate_v1-1_temperature-max_daily_0-01deg_1970-2014',
+        'variable': 'air_temperature',
+    },
+    'temp_min': {
+        'url': 'http://dapds00.nci.org.au/thredds/dodsC/rr9/eMAST_data/ANUClimate/ANUClimate_v1-1_temperature-min_daily_0-01deg_1970-2014',
+        'variable': 'air_temperature',
+    },
+    'vapour_pressure_mean': {
+        'url': 'http://dapds00.nci.org.au/thredds/dodsC/rr9/eMAST_data/ANUClimate/ANUClimate_v1-1_vapour-pressure_daily_0-01deg_1970-2014',
+        'variable': 'vapour_pressure',
+    },
+    'solar_radiation_mean': {
+        'url': 'http://dapds00.nci.org.au/thredds/dodsC/rr9/eMAST_data/ANUClimate/ANUClimate_v1-1_solar-radiation_daily_0-01deg_1970-2014',
+        'variable': 'solar_radiation',
+    }
+}
+
+
+def get_source(var, backend):
+    """Return (backend, location) to read variable var from.
+
+    Variables are served from their THREDDS url via backend by default.
+    The [anuclim:sources] section in pywps.cfg can point single variables
+    at another backend and location, e.g.
+    rainfall = zarr:/data/anuclim/rainfall.zarr
+    """
+    source = config.get_config_value('anuclim:sources', var)
+    if not source:
+        return backend, VARIABLES[var]['url']
+    backend, location = source.split(':', 1)
+    if backend not in BACKENDS:
+        raise Exception('Unknown backend {} for variable {}'.format(backend, var))
+    return backend, location
+
+
+def open_dataset(var, backend):
+    """Open the grid and coordinate axes of variable var.
+
+    Returns a dict with the grid as 'data' (a *Grid object with shape, key,
+    meta, remote, read_value and read_slab), the axes 'lats', 'lons', 'times' and
+    the 'time_units' of the time axis. Dataset handles are borrowed from
+    the handle pool and have to be returned via release_dataset.
+    """
+    backend, location = get_source(var, backend)
+    return BACKENDS[backend](location, VARIABLES[var]['variable'])
+
+
+def release_dataset(dataset):
+    """Return the dataset handle borrowed by open_dataset to the pool."""
+    dataset['data'].release()
+
+
+def _is_remote(location):
+    return '://' in location
+
+
+class _PooledGrid(object):
+    """Grid variable of a dataset handle borrowed from the handle pool.
+
+    Handles are pooled per grid class and location, as backends open the
+    same urls with different libraries. Reads that fail with one of errors
+    discard the handle, reconnect and are retried once.
+    """
+
+    errors = (OSError,)
+
+    def __init__(self, location, variable):
+        self.location = location
+        self.variable = variable
+        self.pool_key = (type(self).__name__, location)
+        self._lock = threading.Lock()
+        pool = get_handle_pool()
+        self.ds = pool.acquire(self.pool_key, self._open, self._close)
+        try:
+            try:
+                self.grid = self._get_grid(self.ds)
+                self.shape = tuple(self.grid.shape)
+            except self.errors as e:
+                # pooled handle went stale while idle
+                self._reconnect(self.ds, e)
+                self.shape = tuple(self.grid.shape)
+        except BaseException:
+            # return the handle, whatever went wrong
+            pool.release(self.pool_key, self.ds)
+            raise
+
+    def _reconnect(self, ds, error):
+        with self._lock:
+            if self.ds is not ds:
+                # another thread reconnected already
+                return
+            logging.getLogger(__name__).warn('Reconnecting to {}: {}'.format(self.location, error))
+            pool = get_handle_pool()
+            pool.discard(self.pool_key, ds)
+            # no handle held until reconnected
+            self.ds = None
+            self.ds = pool.acquire(self.pool_key, self._open, self._close)
+            self.grid = self._get_grid(self.ds)
+
+    def _retry(self, read):
+        ds, grid = self.ds, self.grid
+        try:
+            return read(grid)
+        except self.errors as e:
+            self._reconnect(ds, e)
+            return read(self.grid)
+
+    def release(self):
+        get_handle_pool().release(self.pool_key, self.ds)
+
+
+class NetCDFGrid(_PooledGrid):
+    """Grid variable read via netCDF4, either from OPeNDAP or a local file."""
+
+    errors = (OSError, RuntimeError)
+
+    def __init__(self, location, variable):
+        super().__init__(location, variable)
+        self.key = '{}#{}'.format(location, variable)
+        self.remote = _is_remote(location)
+        with netcdf_lock:
+            self.meta = {
+                'shape': list(self.shape),
+                'dtype': str(self.grid.dtype),
+                'attributes': {attr: self.grid.getncattr(attr) for attr in self.grid.ncattrs()},
+            }
+
+    def _open(self):
+        from netCDF4 import Dataset
+        with netcdf_lock:
+            return Dataset(self.location)
+
+    def _close(self, ds):
+        with netcdf_lock:
+            ds.close()
+
+    def _get_grid(self, ds):
+        with netcdf_lock:
+            return ds[self.variable]
+
+    def read_value(self, t, y, x):
+        def read(grid):
+            with netcdf_lock:
+                return grid[t, y, x]
+        value = self._retry(read)
+        if value is np.ma.masked:
+            # no data at this location
+            return ''
+        return value.item()
+
+    def read_slab(self, start, stop):
+        def read(grid):
+            with netcdf_lock:
+                return grid[start[0]:stop[0], start[1]:stop[1], start[2]:stop[2]]
+        return self._retry(read)
+
+
+def _fetch_netcdf_axis(axis_cache, url, ds, name):
+    axis = ds[name]
+    if axis_cache is None:
+        return axis[:]
+    meta = {
+        'shape': list(axis.shape),
+        'dtype': str(axis.dtype),
+        'attributes': {attr: axis.getncattr(attr) for attr in axis.ncattrs()},
+    }
+    return axis_cache.get(url, name, meta, lambda: axis[:])
+
+
+def open_netcdf(location, variable):
+    # open dataset, or reuse an open handle
+    grid = NetCDFGrid(location, variable)
+    ds = grid.ds
+    # local axes are quick to read, only cache remote ones
+    axis_cache = get_axis_cache() if grid.remote else None
+    try:
+        with netcdf_lock:
+            return {
+                'ds': ds,
+                # get grid data
+                'data': grid,
+                # fetch the actual index data, or load it from the local cache
+                'lats': _fetch_netcdf_axis(axis_cache, location, ds, 'lat'),
+                'lons': _fetch_netcdf_axis(axis_cache, location, ds, 'lon'),
+                'times': _fetch_netcdf_axis(axis_cache, location, ds, 'time'),
+                'time_units': getattr(ds['time'], 'units', None),
+            }
+    except Exception:
+        grid.release()
+        raise
+
+
+class PydapGrid(_PooledGrid):
+    """Grid variable read via pydap from OPeNDAP.
+
+    pydap returns raw values, so cells equal to the _FillValue or
+    missing_value of the variable are masked here (as netCDF4 does).
+    """
+
+    remote = True
+
+    def __init__(self, location, variable):
+        from pydap.exceptions import ServerError
+        self.errors = (OSError, ServerError)
+        super().__init__(location, variable)
+        self.key = '{}#{}'.format(self.grid.data.baseurl, self.grid.id)
+        attributes = self.grid.attributes
+        self.meta = {
+            'shape': list(self.shape),
+            'dtype': str(self.grid.dtype),
+            'attributes': attributes,
+        }
+        self.fill_values = [float(value) for name in ('_FillValue', 'missing_value')
+                            if name in attributes for value in np.ravel(attributes[name])]
+
+    def _open(self):
+        from pydap.client import open_url
+        return open_url(self.location)
+
+    def _close(self, ds):
+        # pydap datasets hold no open connection
+        pass
+
+    def _get_grid(self, ds):
+        # TODO: could als use grid.array?
+        #       also check grid.maps, and grid.dimensions to get axis order
+        #          e.g. ('time', 'lat', 'lon')
+        return ds[self.variable][self.variable]
+
+    def _mask(self, data):
+        data = np.asarray(data)
+        mask = np.zeros(data.shape, dtype=bool)
+        for fill_value in self.fill_values:
+            if np.isnan(fill_value):
+                mask |= np.isnan(data)
+            else:
+                # compare in the type of the data, like netCDF4
+                mask |= data == np.array(fill_value, dtype=data.dtype)
+        return np.ma.masked_array(data, mask=mask)
+
+    def read_value(self, t, y, x):
+        value = self.read_slab((t, y, x), (t + 1, y + 1, x + 1))[0, 0, 0]
+        if value is np.ma.masked:
+            # no data at this location
+            return ''
+        return value.item()
+
+    def read_slab(self, start, stop):
+        value = self._retry(lambda grid: grid[start[0]:stop[0], start[1]:stop[1], start[2]:stop[2]])
+        return self._mask(value.data)
+
+
+def _fetch_pydap_axis(axis_cache, url, ds, name):
+    axis = ds[name]
+    meta = {
+        'shape': list(axis.shape),
+        'dtype': str(axis.dtype),
+        'attributes': axis.attributes,
+    }
+    return axis_cache.get(url, name, meta, lambda: axis[:].data)
+
+
+def open_pydap(location, variable):
+    # open dataset, or reuse an open handle
+    grid = PydapGrid(location, variable)
+    ds = grid.ds
+    # fetch index arrays, or load them from the local cache
+    axis_cache = get_axis_cache()
+    try:
+        lats = _fetch_pydap_axis(axis_cache, location, ds, 'lat')
+        lons = _fetch_pydap_axis(axis_cache, location, ds, 'lon')
+        times = _fetch_pydap_axis(axis_cache, location, ds, 'time')
+    except Exception:
+        grid.release()
+        raise
+    return {
+        'ds': ds,
+        'data': grid,
+        'var': variable,
+        'lats': lats,
+        'lons': lons,
+        'times': times,
+        'time_units': ds['time'].attributes.get('units'),
+    }
+
+
+class ZarrGrid(object):
+    """Grid variable read from a local Zarr store.
+
+    Cells equal to the array fill value are masked.
+    """
+
+    remote = False
+
+    def __init__(self, grid, key):
+        self.grid = grid
+        self.key = key
+        self.shape = tuple(grid.shape)
+        self.fill_value = grid.fill_value
+        self.meta = {
+            'shape': list(self.shape),
+            'dtype': str(grid.dtype),
+            'attributes': dict(grid.attrs),
+        }
+
+    def release(self):
+        pass
+
+    def read_value(self, t, y, x):
+        value = self.read_slab((t, y, x), (t + 1, y + 1, x + 1))[0, 0, 0]
+        if value is np.ma.masked:
+            # no data at this location
+            return ''
+        return value.item()
+
+    def read_slab(self, start, stop):
+        data = self.grid[start[0]:stop[0], start[1]:stop[1], start[2]:stop[2]]
+        if self.fill_value is None:
+            return np.ma.masked_array(data)
+        if np.isnan(self.fill_value):
+            return np.ma.masked_invalid(data)
+        return np.ma.masked_equal(data, self.fill_value)
+
+
+def open_zarr(location, variable):
+    try:
+        import zarr
+    except ImportError:
+        # the zarr backend is only available if zarr is installed
+        raise Exception('zarr is not installed, can not open {}'.format(location))
+    group = zarr.open_group(location, mode='r')
+    return {
+        'ds': group,
+        'data': ZarrGrid(group[variable], '{}#{}'.format(location, variable)),
+        'lats': group['lat'][:],
+        'lons': group['lon'][:],
+        'times': group['time'][:],
+        'time_units': group['time'].attrs.get('units'),
+    }
+
+
+# backends by name, netCDF4 serves OPeNDAP urls as well as local files
+BACKENDS = {
+    'opendap': open_netcdf,
+    'netcdf': open_netcdf,
+    'pydap': open_pydap,
+    'zarr': open_zarr,
+}
@@ -0,0 +1,316 @@
+import csv
+import io
+from itertools import islice
+import logging
+import os
+import threading
+
+import numpy as np
+
+from pywps import configuration as config
+
+from ecocloud_wps_demo.anuclim.dates import DateParser, time_axis_days
+from ecocloud_wps_demo.anuclim.grid import GridIndex
+
+
+# number of csv rows resolved and extracted in one go
+CHUNK_SIZE = 10000
+
+# buffer size used to read and write csv files
+BUFFER_SIZE = 4 * 1024 * 1024
+
+# default number of worker threads used to open and read variables concurrently
+MAX_WORKERS = 5
+
+
+def get_max_workers():
+    return int(config.get_config_value('anuclim', 'max_workers') or MAX_WORKERS)
+
+
+class _RangeFileIO(io.FileIO):
+    """Raw binary file that only reads bytes start ... stop."""
+
+    def __init__(self, filename, start=0, stop=None):
+        super().__init__(filename, 'r')
+        self.seek(start)
+        self.remaining = None if stop is None else stop - start
+
+    def readinto(self, buffer):
+        if self.remaining is None:
+            return super().readinto(buffer)
+        if self.remaining <= 0:
+            return 0
+        view = memoryview(buffer)[:self.remaining]
+        count = super().readinto(view)
+        self.remaining -= count or 0
+        return count
+
+
+class _CountingReader(io.BufferedReader):
+    """Buffered binary reader that counts the bytes handed out to its consumer."""
+
+    consumed = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.consumed += len(data)
+        return data
+
+    def read1(self, size=-1):
+        data = super().read1(size)
+        self.consumed += len(data)
+        return data
+
+
+class CSVInput(object):
+    """Text lines of a (large) csv file, read in a single buffered pass.
+
+    Iterate over it with csv.reader; consumed is the number of bytes read
+    so far, to report progress against size.
+    If start / stop are given, only lines within this byte range are read;
+    both have to be at the start of a line.
+    """
+
+    def __init__(self, filename, start=0, stop=None, bufsize=BUFFER_SIZE):
+        if stop is None:
+            stop = os.path.getsize(filename)
+        self.size = stop - start
+        self._buffer = _CountingReader(_RangeFileIO(filename, start, stop), bufsize)
+        self._fp = io.TextIOWrapper(self._buffer, newline='')
+
+    def __iter__(self):
+        return iter(self._fp)
+
+    @property
+    def consumed(self):
+        """Number of bytes consumed so far."""
+        return self._buffer.consumed
+
+    def close(self):
+        self._fp.close()
+
+
+def read_header(filename):
+    """Read the header line of a csv file.
+
+    Returns the parsed header and the byte offset of the first data line.
+    """
+    with open(filename, 'rb') as fp:
+        line = fp.readline()
+    header = next(csv.reader([line.decode('utf-8')]), [])
+    return header, len(line)
+
+
+def shard_file(filename, start, count):
+    """Split a file from byte offset start into count byte ranges.
+
+    Range boundaries are moved to the start of the next line, so each range
+    holds whole lines (csv fields with embedded newlines are not supported
+    when sharding). Returns a list of (start, stop) tuples, empty ranges are
+    dropped.
+    """
+    size = os.path.getsize(filename)
+    bounds = [start]
+    with open(filename, 'rb') as fp:
+        for i in range(1, count):
+            offset = start + (size - start) * i // count
+            if offset <= bounds[-1]:
+                continue
+            fp.seek(offset - 1)
+            # skip to start of next line, unless offset already is one
+            fp.readline()
+            bounds.append(min(fp.tell(), size))
+    bounds.append(size)
+    return [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+
+def read_chunks(csv_reader, chunksize=CHUNK_SIZE):
+    """Yield lists of up to chunksize rows from csv_reader."""
+    while True:
+        rows = list(islice(csv_reader, chunksize))
+        if not rows:
+            return
+        yield rows
+
+
+def read_points(read_value, grid, tidx, yidx, xidx):
+    """Read one value per (time, lat, lon) index triple from grid.
+
+    read_value(grid, t, y, x) is called for each point and should return the
+    value to write into the csv, or raise an exception.
+
+    Returns an object array of values and a boolean array flagging failed reads.
+    """
+    log = logging.getLogger(__name__)
+    values = np.full(len(tidx), '', dtype=object)
+    failed = np.zeros(len(tidx), dtype=bool)
+    for i, (t, y, x) in enumerate(zip(tidx, yidx, xidx)):
+        try:
+            values[i] = read_value(grid, t, y, x)
+        except Exception as e:
+            log.warn('Failed to read value at {}: {}'.format((t, y, x), e))
+            failed[i] = True
+    return values, failed
+
+
+def _column(rows, col):
+    return [row[col] if col < len(row) else '' for row in rows]
+
+
+def _floats(values):
+    """Convert strings to a float array, with an error message per bad value."""
+    try:
+        return np.array(values, dtype=np.float64), [None] * len(values)
+    except ValueError:
+        pass
+    result = np.full(len(values), np.nan)
+    errors = [None] * len(values)
+    for i, value in enumerate(values):
+        try:
+            result[i] = float(value)
+        except ValueError as e:
+            errors[i] = str(e)
+    return result, errors
+
+
+def unique_points(tidx, yidx, xidx):
+    """Find distinct (time, lat, lon) index triples.
+
+    Returns positions of the first occurrence of each distinct triple and
+    an inverse array that maps every point to its distinct triple.
+    """
+    if not len(tidx):
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+    dims = (int(tidx.max()) + 1, int(yidx.max()) + 1, int(xidx.max()) + 1)
+    keys = np.ravel_multi_index((tidx, yidx, xidx), dims)
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    return first, inverse.ravel()
+
+
+class BatchExtractor(object):
+    """Extract values for whole chunks of csv rows at once.
+
+    All coordinates in a chunk are parsed into numpy arrays, data indices are
+    resolved in one vectorised step per variable and values are fetched per
+    variable via read_points(grid, tidx, yidx, xidx). If an executor is
+    given, variables are read concurrently on it.
+
+    datasets[var] must provide the grid as 'data' and its coordinate axes
+    as 'times', 'lats' and 'lons', and should provide the CF units of the
+    time axis as 'time_units'.
+    """
+
+    def __init__(self, datasets, variables, read_points, executor=None):
+        self.datasets = datasets
+        self.variables = variables
+        self.read_points = read_points
+        self.executor = executor
+        # build index resolvers per variable, but share them between
+        # variables with identical axes
+        self.indexes = {}
+        resolvers = []
+        for var in variables:
+            axes = (
+                time_axis_days(datasets[var]['times'], datasets[var].get('time_units')),
+                np.asarray(datasets[var]['lats']),
+                np.asarray(datasets[var]['lons']),
+            )
+            for other, index in resolvers:
+                if all(np.array_equal(a, b) for a, b in zip(axes, other)):
+                    break
+            else:
+                index = tuple(GridIndex(axis) for axis in axes)
+                resolvers.append((axes, index))
+            self.indexes[var] = index
+        self.parse_dates = DateParser()
+        # number of point lookups requested / actually fetched
+        self.points = 0
+        self.unique_points = 0
+        self._lock = threading.Lock()
+
+    def parse(self, rows, header_idx):
+        """Parse lat/lon/date columns of rows into float arrays.
+
+        Dates are converted to days since 1970-01-01.
+        Returns lats, lons, times and a list with an error message for each
+        row that can't be used (None for good rows).
+        """
+        times, errors = self.parse_dates(_column(rows, header_idx['date']))
+        lats, lat_errors = _floats(_column(rows, header_idx['lat']))
+        lons, lon_errors = _floats(_column(rows, header_idx['lon']))
+        errors = [date_error or lat_error or lon_error
+                  for date_error, lat_error, lon_error in zip(errors, lat_errors, lon_errors)]
+        return lats, lons, times, errors
+
+    def resolve(self, var, lats, lons, times, valid, errors):
+        """Resolve data indices of var for all coordinates.
+
+        Rows outside the data area get an error message in errors and are
+        removed from valid.
+        Returns time, lat and lon index arrays (-1 for unusable rows).
+        """
+        tindex, yindex, xindex = self.indexes[var]
+        indices = []
+        for name, index, values in (('lat', yindex, lats),
+                                    ('lon', xindex, lons),
+                                    ('time', tindex, times)):
+            idx = np.full(len(values), -1, dtype=np.intp)
+            # look up each distinct value only once
+            uniq, inverse = np.unique(values[valid], return_inverse=True)
+            idx[valid] = index(uniq)[inverse]
+            outside = valid & (idx < 0)
+            for i in np.flatnonzero(outside):
+                errors[i] = '{} outside data area'.format(name)
+            valid &= ~outside
+            indices.append(idx)
+        yidx, xidx, tidx = indices
+        return tidx, yidx, xidx
+
+    def extract(self, rows, header_idx):
+        """Append extracted values for all variables to each row in rows.
+
+        Rows that can't be extracted are filled with empty values.
+        """
+        log = logging.getLogger(__name__)
+        lats, lons, times, errors = self.parse(rows, header_idx)
+        valid = np.array([e is None for e in errors], dtype=bool)
+        indices = {}
+        for var in self.variables:
+            indices[var] = self.resolve(var, lats, lons, times, valid, errors)
+
+        def read_var(var):
+            tidx, yidx, xidx = (idx[valid] for idx in indices[var])
+            # fetch each distinct grid cell only once and broadcast the
+            # values back to all rows
+            uniq, inverse = unique_points(tidx, yidx, xidx)
+            var_values, var_failed = self.read_points(
+                self.datasets[var]['data'], tidx[uniq], yidx[uniq], xidx[uniq])
+            with self._lock:
+                self.points += len(tidx)
+                self.unique_points += len(uniq)
+            return var_values[inverse], var_failed[inverse]
+
+        if self.executor is not None:
+            results = self.executor.map(read_var, self.variables)
+        else:
+            results = map(read_var, self.variables)
+        # values[i, j] is the value of variables[j] at the i-th valid row
+        values = np.full((np.count_nonzero(valid), len(self.variables)), '', dtype=object)
+        failed = np.zeros(len(values), dtype=bool)
+        for col, (var_values, var_failed) in enumerate(results):
+            values[:, col] = var_values
+            failed |= var_failed
+        values[failed] = ''
+        for i in np.flatnonzero(valid)[failed]:
+            errors[i] = 'failed to read data'
+        # append values to rows
+        empty = [''] * len(self.variables)
+        valid_rows = iter(values.tolist())
+        for row, is_valid, error in zip(rows, valid, errors):
+            if is_valid:
+                row.extend(next(valid_rows))
+            else:
+                row.extend(empty)
+            if error is not None:
+                log.warn('Filling Row with empty values: {}'.format(error))
+        return rows
@@ -0,0 +1,217 @@
+import fcntl
+import hashlib
+import json
+from itertools import product
+import logging
+import os
+import os.path
+import tempfile
+import threading
+
+import numpy as np
+
+from pywps import configuration as config
+
+
+# default (time, lat, lon) shape of cached blocks
+BLOCK_SHAPE = (8, 64, 64)
+
+# default size limit of the chunk cache in MB, disabled unless configured
+CACHE_SIZE_MB = 0
+
+
+def get_chunk_cache():
+    """Return the ChunkCache configured in pywps.cfg, or None if disabled.
+
+    The cache lives in [anuclim] chunk_cache_dir (default: a folder within the
+    pywps workdir) and is limited to chunk_cache_size_mb. The cache is
+    disabled by default (size 0): cold blocks widen reads, so it only pays
+    off where the same areas are extracted repeatedly.
+    """
+    size_mb = config.get_config_value('anuclim', 'chunk_cache_size_mb')
+    size_mb = CACHE_SIZE_MB if size_mb in ('', None) else int(size_mb)
+    if size_mb <= 0:
+        return None
+    path = config.get_config_value('anuclim', 'chunk_cache_dir')
+    if not path:
+        path = os.path.join(config.get_config_value('server', 'workdir'), 'anuclim_chunks')
+    return ChunkCache(path, size_mb * 1024 * 1024)
+
+
+class ChunkCache(object):
+    """Disk backed LRU cache of fixed size (time, lat, lon) grid blocks.
+
+    Hyperslab reads are widened to block boundaries; blocks are stored as
+    one .npz file each (data and mask) below a folder per grid key. Keys
+    include the grid metadata (shape, dtype, attributes) as reported by the
+    remote dataset, so blocks of republished grids are fetched again rather
+    than served stale. Access times are tracked via file mtime, and when the cache
+    grows beyond max_bytes the least recently used blocks are removed.
+
+    Files are written to a temporary name and renamed into place, and
+    eviction holds an exclusive lock on the cache folder, so a cache folder
+    can be shared between threads and processes.
+
+    hits, misses and evictions count blocks served from cache, blocks
+    fetched remotely and blocks removed from the cache.
+    """
+
+    def __init__(self, path, max_bytes, block_shape=BLOCK_SHAPE):
+        self.max_bytes = max_bytes
+        self.block_shape = tuple(block_shape)
+        # different block shapes must not share files
+        self.path = os.path.join(path, 'x'.join(str(size) for size in self.block_shape))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # estimated size of the cache folder, None until first scanned
+        self._size = None
+        self._lock = threading.Lock()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+    def reader(self, read_slab, grid_key):
+        """Wrap read_slab(grid, start, stop) to go through this cache.
+
+        grid_key(grid) has to return a json serialisable value identifying
+        the grid and its version (e.g. dataset url, variable name and grid
+        metadata).
+        """
+        def cached_read_slab(grid, start, stop):
+            return self.read(grid_key(grid), read_slab, grid, start, stop)
+        return cached_read_slab
+
+    def _blockdir(self, key):
+        key = json.dumps(key, sort_keys=True, default=str)
+        return os.path.join(self.path, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def _load(self, filename):
+        try:
+            with np.load(filename) as npz:
+                block = np.ma.masked_array(npz['data'], npz['mask'])
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.getLogger(__name__).warn('Failed to load cached block {}: {}'.format(filename, e))
+            return None
+        try:
+            # mark as recently used
+            os.utime(filename)
+        except OSError:
+            pass
+        return block
+
+    def _store(self, blockdir, filename, block):
+        os.makedirs(blockdir, exist_ok=True)
+        fd, tmpname = tempfile.mkstemp(dir=blockdir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                np.savez(fp, data=np.ma.getdata(block), mask=np.ma.getmaskarray(block))
+            size = os.path.getsize(tmpname)
+            os.replace(tmpname, filename)
+        except Exception:
+            os.unlink(tmpname)
+            raise
+        with self._lock:
+            if self._size is not None:
+                self._size += size
+            full = self._size is None or self._size > self.max_bytes
+        if full:
+            self.evict()
+
+    def evict(self):
+        """Remove least recently used blocks until the cache is within max_bytes.
+
+        Removes blocks down to 90% of max_bytes, so that eviction doesn't
+        run on every single store.
+        """
+        log = logging.getLogger(__name__)
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, '.lock'), 'w') as lockfp:
+            fcntl.flock(lockfp, fcntl.LOCK_EX)
+            files = []
+            total = 0
+            for dirpath, dirnames, filenames in os.walk(self.path):
+                for name in filenames:
+                    if not name.endswith('.npz'):
+                        continue
+                    filename = os.path.join(dirpath, name)
+                    try:
+                        stat = os.stat(filename)
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, filename))
+                    total += stat.st_size
+            evicted = 0
+            if total > self.max_bytes:
+                files.sort()
+                for mtime, size, filename in files:
+                    if total <= self.max_bytes * 0.9:
+                        break
+                    try:
+                        os.unlink(filename)
+                    except OSError:
+                        continue
+                    total -= size
+                    evicted += 1
+                log.debug('Evicted {} blocks from chunk cache {}'.format(evicted, self.path))
+        with self._lock:
+            self._size = total
+            self.evictions += evicted
+
+    def read(self, key, read_slab, grid, start, stop):
+        """Read hyperslab start:stop of grid through the cache.
+
+        Blocks not in the cache are fetched with a single
+        read_slab(grid, start, stop) call for their bounding box.
+        """
+        log = logging.getLogger(__name__)
+        shape = grid.shape
+        bs = self.block_shape
+        blockdir = self._blockdir(key)
+        # block numbers covering the requested slab along each axis
+        ranges = [range(start[d] // bs[d], (stop[d] - 1) // bs[d] + 1) for d in range(3)]
+        blocks = {}
+        missing = []
+        for bidx in product(*ranges):
+            filename = os.path.join(blockdir, '{}_{}_{}.npz'.format(*bidx))
+            block = self._load(filename)
+            if block is None:
+                missing.append((bidx, filename))
+            else:
+                blocks[bidx] = block
+        if missing:
+            # fetch bounding box of all missing blocks in one go
+            fstart = tuple(min(b[d] for b, _ in missing) * bs[d] for d in range(3))
+            fstop = tuple(min((max(b[d] for b, _ in missing) + 1) * bs[d], shape[d]) for d in range(3))
+            fetched = read_slab(grid, fstart, fstop)
+            for bidx, filename in missing:
+                bstart = [b * s for b, s in zip(bidx, bs)]
+                bstop = [min(b + s, n) for b, s, n in zip(bstart, bs, shape)]
+                block = fetched[tuple(slice(b0 - f0, b1 - f0) for b0, b1, f0 in zip(bstart, bstop, fstart))]
+                blocks[bidx] = block
+                try:
+                    self._store(blockdir, filename, block)
+                except Exception as e:
+                    # caching is best effort
+                    log.warn('Failed to cache block {}: {}'.format(filename, e))
+        with self._lock:
+            self.hits += len(blocks) - len(missing)
+            self.misses += len(missing)
+        # assemble requested slab from blocks
+        out_shape = tuple(b - a for a, b in zip(start, stop))
+        data = None
+        mask = np.zeros(out_shape, dtype=bool)
+        for bidx, block in blocks.items():
+            bstart = [b * s for b, s in zip(bidx, bs)]
+            lo = [max(a, b) for a, b in zip(start, bstart)]
+            hi = [min(a, b + n) for a, b, n in zip(stop, bstart, block.shape)]
+            if data is None:
+                data = np.empty(out_shape, dtype=block.dtype)
+            dst = tuple(slice(l - a, h - a) for l, h, a in zip(lo, hi, start))
+            src = tuple(slice(l - b, h - b) for l, h, b in zip(lo, hi, bstart))
+            data[dst] = np.ma.getdata(block)[src]
+            mask[dst] = np.ma.getmaskarray(block)[src]
+        return np.ma.masked_array(data, mask)
@@ -0,0 +1,85 @@
+import datetime
+import logging
+import re
+
+import numpy as np
+
+
+EPOCH = np.datetime64('1970-01-01', 'D')
+
+# length of time units in days
+_UNITS = {
+    'day': 1.0, 'days': 1.0, 'd': 1.0,
+    'hour': 1 / 24.0, 'hours': 1 / 24.0, 'h': 1 / 24.0, 'hr': 1 / 24.0, 'hrs': 1 / 24.0,
+    'minute': 1 / 1440.0, 'minutes': 1 / 1440.0, 'min': 1 / 1440.0, 'mins': 1 / 1440.0,
+    'second': 1 / 86400.0, 'seconds': 1 / 86400.0, 's': 1 / 86400.0, 'sec': 1 / 86400.0, 'secs': 1 / 86400.0,
+}
+
+_UNITS_RE = re.compile(
+    r'^\s*(?P<unit>\w+)\s+since\s+(?P<date>\d{1,4}-\d{1,2}-\d{1,2})'
+    r'(?:[T\s]+(?P<time>\d{1,2}:\d{1,2}(?::\d{1,2}(?:\.\d*)?)?))?'
+)
+
+
+def time_axis_days(times, units):
+    """Convert a CF time axis to whole days since 1970-01-01 (UTC).
+
+    units is the CF units attribute of the axis, e.g.
+    'days since 1800-01-01 00:00:00'. Each time step is mapped to the
+    calendar day it falls on, so that daily values stamped at e.g. noon
+    match their date exactly.
+
+    Without units the axis is assumed to hold seconds since 1970-01-01 UTC,
+    which is what the extract processes used to compare against.
+    """
+    times = np.asarray(np.ma.getdata(times), dtype=np.float64)
+    if not units:
+        logging.getLogger(__name__).warn('Time axis has no units, assuming seconds since 1970-01-01')
+        units = 'seconds since 1970-01-01'
+    match = _UNITS_RE.match(units)
+    if not match or match.group('unit').lower() not in _UNITS:
+        raise ValueError('Unsupported time units: {}'.format(units))
+    year, month, day = (int(part) for part in match.group('date').split('-'))
+    origin = (np.datetime64(datetime.date(year, month, day), 'D') - EPOCH).astype(np.float64)
+    if match.group('time'):
+        parts = [float(part) for part in match.group('time').split(':')]
+        parts += [0.0] * (3 - len(parts))
+        origin += (parts[0] * 3600 + parts[1] * 60 + parts[2]) / 86400.0
+    days = origin + times * _UNITS[match.group('unit').lower()]
+    # tolerate float rounding just below midnight
+    return np.floor(days + 1e-6)
+
+
+class DateParser(object):
+    """Parse date strings ('%Y-%m-%d') to days since 1970-01-01.
+
+    Occurrence data repeats the same dates many times, so every distinct
+    string is parsed only once per chunk and the result is memoized across
+    chunks.
+    """
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._cache = {}
+
+    def _parse(self, value):
+        try:
+            date = datetime.datetime.strptime(value.strip(), '%Y-%m-%d').date()
+            return float((np.datetime64(date, 'D') - EPOCH).astype(np.int64)), None
+        except Exception as e:
+            return np.nan, str(e)
+
+    def __call__(self, values):
+        """Return an array of days and a list of error messages (None if ok)."""
+        uniq, inverse = np.unique(np.asarray(values, dtype=object).astype(str), return_inverse=True)
+        if len(self._cache) > self.maxsize:
+            self._cache.clear()
+        parsed = []
+        for value in uniq:
+            result = self._cache.get(value)
+            if result is None:
+                result = self._cache[value] = self._parse(value)
+            parsed.append(result)
+        days = np.array([day for day, error in parsed], dtype=np.float64)
+        errors = [error for day, error in parsed]
+        return days[inverse], [errors[i] for i in inverse]
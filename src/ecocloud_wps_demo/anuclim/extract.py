@@ -0,0 +1,316 @@
+from concurrent.futures import FIRST_EXCEPTION, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+import csv
+import logging
+import multiprocessing
+import os
+import sys
+
+from pywps import configuration as config
+
+from ecocloud_wps_demo.anuclim import backends, handles
+from ecocloud_wps_demo.anuclim.backends import open_dataset, release_dataset
+from ecocloud_wps_demo.anuclim.batch import (
+    BatchExtractor, CSVInput, get_max_workers, read_chunks, read_header, shard_file)
+from ecocloud_wps_demo.anuclim.chunkcache import get_chunk_cache
+from ecocloud_wps_demo.anuclim.handles import get_handle_pool
+from ecocloud_wps_demo.anuclim.output import get_writer
+from ecocloud_wps_demo.anuclim.planner import SlabReader, WindowReader, get_max_slab_cells
+from ecocloud_wps_demo.pywps.processing import get_worker_config, init_worker
+
+
+# default number of worker processes used to extract shards of large inputs
+PROCESSES = 1
+
+# inputs smaller than this (in MB) are never split into shards
+SHARD_MIN_SIZE_MB = 16
+
+
+def get_processes():
+    return int(config.get_config_value('anuclim', 'processes') or PROCESSES)
+
+
+def get_shard_min_size():
+    size_mb = config.get_config_value('anuclim', 'shard_min_size_mb')
+    size_mb = SHARD_MIN_SIZE_MB if size_mb in ('', None) else int(size_mb)
+    return size_mb * 1024 * 1024
+
+
+def _extract_shard(process_class, *args):
+    if not hasattr(os, 'register_at_fork'):
+        # workers are forked (Python < 3.7) without fork hooks, so locks
+        # held by other threads of the job process at fork time are copied
+        # as held, and pooled dataset handles (and their connections) are
+        # shared with the job process; no other thread runs in the worker
+        # at this point
+        backends._reset_lock()
+        handles._reset_pool()
+    # process instances hold references to the running service, so a fresh
+    # instance is created in the worker process rather than pickling self
+    return process_class()._extract_shard(*args)
+
+
+def _shard_pool(max_workers):
+    """Return a ProcessPoolExecutor to extract shards on.
+
+    Workers are started via a fork server where supported (Python >= 3.7),
+    so they don't inherit locks or dataset handles held by other threads
+    of the job process (e.g. other jobs in threads processing mode), and
+    are given the pywps configuration and logging setup of the service.
+    """
+    if sys.version_info < (3, 7):
+        return ProcessPoolExecutor(max_workers=max_workers)
+    context = multiprocessing.get_context('forkserver')
+    # imported once by the fork server (when it starts) rather than by
+    # every worker, missing modules are skipped
+    context.set_forkserver_preload([__name__, 'netCDF4', 'pydap.client'])
+    return ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=context,
+        initializer=init_worker, initargs=(get_worker_config(),))
+
+
+class _StatusProgress(object):
+    """Report shard progress directly via response.update_status."""
+
+    def __init__(self, response, size):
+        self.response = response
+        self.size = size
+        self.next_update = 0
+
+    def __setitem__(self, shard, value):
+        lines, consumed = value
+        percent = min(100, int(consumed * 100 / self.size)) if self.size else 100
+        # don't re-generate status doc after every single chunk
+        if percent >= self.next_update:
+            self.next_update = percent + 5
+            self.response.update_status(
+                'Processed lines {} so far...'.format(lines),
+                percent
+            )
+
+
+class ExtractMixin(object):
+    """Shared handler for the ANUClim point extract processes.
+
+    Variables are read via backend (see anuclim.backends), unless
+    pywps.cfg configures another source for a variable.
+
+    Large inputs are split into row range shards, which are extracted on a
+    process pool (each worker with its own dataset handles) and merged
+    back in original row order.
+    """
+
+    # default backend to read variables from
+    backend = 'opendap'
+
+    def _open_dataset(self, var):
+        return open_dataset(var, self.backend)
+
+    def _read_value(self, grid, t, y, x):
+        return grid.read_value(t, y, x)
+
+    def _read_slab(self, grid, start, stop):
+        return grid.read_slab(start, stop)
+
+    def _grid_key(self, grid):
+        # cached blocks are only valid for the same version of the grid
+        return [grid.key, grid.meta]
+
+    def _slab_reader(self, chunk_cache):
+        """Return read_slab(grid, start, stop), which serves slab reads of
+        remote grids through chunk_cache if it is enabled (not None)."""
+        if chunk_cache is None:
+            return self._read_slab
+        cached_read_slab = chunk_cache.reader(self._read_slab, self._grid_key)
+
+        def read_slab(grid, start, stop):
+            if grid.remote:
+                return cached_read_slab(grid, start, stop)
+            return self._read_slab(grid, start, stop)
+        return read_slab
+
+    @contextmanager
+    def _borrow_datasets(self, executor, variables):
+        """Open datasets of all variables concurrently.
+
+        Dataset handles are returned to the handle pool when done.
+        """
+        futures = [executor.submit(self._open_dataset, var) for var in variables]
+        try:
+            yield {var: future.result() for var, future in zip(variables, futures)}
+        finally:
+            for future in futures:
+                if not future.exception():
+                    release_dataset(future.result())
+
+    def _extract_shard(self, csv_file, start, stop, out_file, params, progress=None, shard=0):
+        """Extract csv rows within byte range start ... stop into out_file.
+
+        out_file gets the extracted rows in the requested output format,
+        without header (csv) so it can be merged. Progress is
+        reported as progress[shard] = (lines, bytes consumed).
+        Returns a dict of statistics for the job summary.
+        """
+        variables = params['variables']
+        window_length = params['window_length']
+        count = 0
+
+        # stream through input csv in a single pass
+        csv_input = CSVInput(csv_file, start, stop)
+        csv_reader = csv.reader(csv_input)
+
+        # open datasets and fetch values for all variables concurrently
+        max_workers = min(get_max_workers(), len(variables))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # open opendap datasets
+            with self._borrow_datasets(executor, variables) as datasets:
+                chunk_cache = get_chunk_cache()
+                read_slab = self._slab_reader(chunk_cache)
+                if window_length:
+                    reader = WindowReader(read_slab, window_length, params['window_offset'],
+                                          params['window_stat'], get_max_slab_cells())
+                else:
+                    reader = SlabReader(read_slab, self._read_value, get_max_slab_cells())
+                extractor = BatchExtractor(datasets, variables, reader, executor=executor)
+
+                writer = get_writer(params['mime_type'])(
+                    out_file, params['header'], len(variables), with_header=False)
+                try:
+                    # iterate through input csv in chunks of rows
+                    for rows in read_chunks(csv_reader):
+                        count += len(rows)  # incr. line read counter
+                        extractor.extract(rows, params['header_idx'])
+                        writer.write(rows)
+                        # done processing current chunk ...
+                        if progress is not None:
+                            progress[shard] = (count, csv_input.consumed)
+                finally:
+                    writer.close()
+        csv_input.close()
+        return {
+            'lines': count,
+            'points': extractor.points,
+            'unique_points': extractor.unique_points,
+            'cache': chunk_cache.stats() if chunk_cache is not None else None,
+            'handles': get_handle_pool().stats(),
+        }
+
+    def _run_shards(self, csv_file, shards, out_files, params, response):
+        """Extract shards on a process pool, returns stats of all shards."""
+        log = logging.getLogger(__name__)
+        total = sum(stop - start for start, stop in shards)
+        manager = multiprocessing.Manager()
+        try:
+            progress = manager.dict()
+            with _shard_pool(min(get_processes(), len(shards))) as pool:
+                futures = [
+                    pool.submit(_extract_shard, type(self), csv_file, start, stop, out_file,
+                                params, progress, shard)
+                    for shard, ((start, stop), out_file) in enumerate(zip(shards, out_files))
+                ]
+                next_update = 0
+                pending = futures
+                while pending:
+                    done, pending = wait(pending, timeout=5, return_when=FIRST_EXCEPTION)
+                    if any(future.exception() for future in done):
+                        for future in pending:
+                            future.cancel()
+                        break
+                    # aggregate progress of all shards
+                    state = progress.copy()
+                    lines = sum(value[0] for value in state.values())
+                    percent = min(100, int(sum(value[1] for value in state.values()) * 100 / total))
+                    if percent >= next_update:
+                        next_update = percent + 5
+                        response.update_status(
+                            'Processed lines {} so far ({} shards)...'.format(lines, len(shards)),
+                            percent
+                        )
+                # re-raise first failure
+                stats = [future.result() for future in futures]
+        finally:
+            manager.shutdown()
+        log.info('Extracted {} shards on {} processes'.format(len(shards), get_processes()))
+        return stats
+
+    def _handler(self, request, response):
+        # import pdb; pdb.set_trace()
+        # Get the NetCDF file
+        log = logging.getLogger(__name__)
+        variables = [v.data for v in request.inputs['variables']]  # Note that all input parameters require index access
+        dataset_csv = request.inputs['csv'][0]
+        mime_type = response.outputs['output'].data_format.mime_type
+        writer = get_writer(mime_type)
+        # optional temporal window aggregation
+        window_length = request.inputs['window_length'][0].data if 'window_length' in request.inputs else None
+        window_offset = request.inputs['window_offset'][0].data if 'window_offset' in request.inputs else 0
+        window_stat = request.inputs['window_stat'][0].data if 'window_stat' in request.inputs else 'mean'
+
+        csv_header, data_start = read_header(dataset_csv.file)
+        csv_header_idx = {col: csv_header.index(col) for col in csv_header}
+        if any(col not in csv_header for col in ('lat', 'lon', 'date')):
+            raise Exception('Bad trait data: Missing lat/lon/date column')
+
+        # append variables to csv header, e.g. temp_max_mean_5d_off2 for
+        # the mean over 5 days ending 2 days before date
+        for var in variables:
+            if window_length:
+                column = '{}_{}_{}d'.format(var, window_stat, window_length)
+                if window_offset:
+                    column += '_off{}'.format(window_offset)
+                csv_header.append(column)
+            else:
+                csv_header.append(var)
+
+        params = {
+            'variables': variables,
+            'header': csv_header,
+            'mime_type': mime_type,
+            'header_idx': csv_header_idx,
+            'window_length': window_length,
+            'window_offset': window_offset,
+            'window_stat': window_stat,
+        }
+
+        # split large inputs into shards for the process pool
+        size = os.path.getsize(dataset_csv.file) - data_start
+        processes = get_processes()
+        if processes > 1 and size >= get_shard_min_size():
+            # a few more shards than processes to even out slow shards
+            shards = shard_file(dataset_csv.file, data_start, processes * 2)
+        else:
+            shards = [(data_start, data_start + size)]
+
+        out_files = [os.path.join(self.workdir, 'shard_{:04d}.{}'.format(i, writer.extension))
+                     for i in range(len(shards))]
+        if len(shards) > 1:
+            stats = self._run_shards(dataset_csv.file, shards, out_files, params, response)
+        else:
+            stats = [self._extract_shard(dataset_csv.file, data_start, data_start + size,
+                                         out_files[0], params, _StatusProgress(response, size))]
+
+        # produce output file, merging shards in row order
+        # TODO: may want to use resoponse.outputs['output'].workdir here
+        out_file = os.path.join(self.workdir, 'out.{}'.format(writer.extension))
+        writer.merge(out_file, csv_header, len(variables), out_files)
+        for filename in out_files:
+            os.remove(filename)
+
+        count = sum(stat['lines'] for stat in stats)
+        points = sum(stat['points'] for stat in stats)
+        unique_points = sum(stat['unique_points'] for stat in stats)
+        log.info('Extracted {} lines, fetched {} distinct of {} point lookups ({:.1%} deduplicated)'.format(
+            count, unique_points, points, 1 - unique_points / points if points else 0.0))
+        # handle pools are per process, so only show the last state of each
+        log.info('Dataset handles: {}'.format(stats[-1]['handles'] if len(stats) == 1 else
+                                               [stat['handles'] for stat in stats]))
+        cache_stats = [stat['cache'] for stat in stats if stat['cache'] is not None]
+        if cache_stats:
+            log.info('Chunk cache: {}'.format(
+                {key: sum(stat[key] for stat in cache_stats) for key in cache_stats[0]}))
+        # set output file
+        # NOTE: assigning to output.file needs to be done after output file
+        #       is finished. Assignment here copies the file to the outputs
+        #       folder.
+        response.outputs['output'].file = out_file
+        return response
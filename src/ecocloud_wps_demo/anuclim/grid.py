@@ -0,0 +1,103 @@
+import numpy as np
+
+
+def nearest_index(axis, values):
+    """Vectorised version of np.abs(axis - value).argmin() for a monotonic axis.
+
+    axis may be ascending or descending.
+    """
+    axis = np.asarray(axis)
+    values = np.asarray(values)
+    if axis.size == 1:
+        return np.zeros(values.shape, dtype=np.intp)
+    descending = axis[0] > axis[-1]
+    if descending:
+        axis = axis[::-1]
+    right = np.clip(np.searchsorted(axis, values), 1, axis.size - 1)
+    left = right - 1
+    # pick the closer neighbour, prefer the lower original index on a tie
+    dleft = np.abs(values - axis[left])
+    dright = np.abs(axis[right] - values)
+    if descending:
+        idx = axis.size - 1 - np.where(dleft < dright, left, right)
+    else:
+        idx = np.where(dleft <= dright, left, right)
+    return idx
+
+
+class GridIndex(object):
+    """Map coordinate values to indices on a monotonic coordinate axis.
+
+    If the axis is regular (every value within rtol cells of origin + i *
+    cell size), indices are computed arithmetically from origin and cell
+    size, otherwise with a binary search. Either way the result is the index of the nearest axis
+    value, same as np.abs(axis - value).argmin().
+
+    Values further than half a cell outside the first / last axis value are
+    out of bounds and get index -1.
+    """
+
+    def __init__(self, axis, rtol=1e-3):
+        self.axis = np.asarray(axis, dtype=np.float64)
+        self.size = self.axis.size
+        if self.size > 1:
+            self.origin = self.axis[0]
+            self.step = (self.axis[-1] - self.axis[0]) / (self.size - 1)
+            diffs = np.diff(self.axis)
+            # bound the drift from the arithmetic position rather than the
+            # variation of single steps, which may add up to several cells
+            offsets = self.axis - (self.origin + self.step * np.arange(self.size))
+            self.regular = bool(
+                self.step != 0 and np.abs(offsets).max() <= rtol * abs(self.step))
+            # half cell tolerance at both ends
+            first = abs(diffs[0]) / 2
+            last = abs(diffs[-1]) / 2
+        else:
+            self.origin = self.axis[0] if self.size else np.nan
+            self.step = 0
+            self.regular = False
+            first = last = 0
+        if self.size > 1 and self.axis[0] > self.axis[-1]:
+            self.lower = self.axis[-1] - last
+            self.upper = self.axis[0] + first
+        elif self.size:
+            self.lower = self.axis[0] - first
+            self.upper = self.axis[-1] + last
+        else:
+            self.lower, self.upper = np.inf, -np.inf
+
+    def __repr__(self):
+        return '<GridIndex size={} regular={} origin={} step={}>'.format(
+            self.size, self.regular, self.origin, self.step)
+
+    def __call__(self, values):
+        """Return indices for values, -1 for values out of bounds."""
+        values = np.asarray(values, dtype=np.float64)
+        inside = self.contains(values)
+        idx = np.full(values.shape, -1, dtype=np.intp)
+        if not inside.any():
+            return idx
+        vals = values[inside]
+        if self.regular:
+            # nearest cell by arithmetic, lower index on a tie
+            guess = np.ceil((vals - self.origin) / self.step - 0.5).astype(np.intp)
+            guess = np.clip(guess, 0, self.size - 1)
+            # irregularities within rtol may put the guess off by one,
+            # so pick the closest of guess and its neighbours
+            best = guess
+            bestdist = np.abs(self.axis[guess] - vals)
+            for offset in (-1, 1):
+                cand = np.clip(guess + offset, 0, self.size - 1)
+                dist = np.abs(self.axis[cand] - vals)
+                better = (dist < bestdist) | ((dist == bestdist) & (cand < best))
+                best = np.where(better, cand, best)
+                bestdist = np.where(better, dist, bestdist)
+            idx[inside] = best
+        else:
+            idx[inside] = nearest_index(self.axis, vals)
+        return idx
+
+    def contains(self, values):
+        """Boolean array flagging values within half a cell of the axis."""
+        values = np.asarray(values, dtype=np.float64)
+        return (values >= self.lower) & (values <= self.upper)
@@ -0,0 +1,198 @@
+import logging
+import os
+import threading
+import time
+
+from pywps import configuration as config
+
+
+# default maximum number of open dataset handles kept per process
+POOL_SIZE = 16
+
+# default number of seconds an unused handle is kept open
+IDLE_TIMEOUT = 300
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_handle_pool():
+    """Return the process wide HandlePool, configured via pywps.cfg.
+
+    [anuclim] handle_pool_size limits the number of open handles,
+    handle_idle_timeout closes handles unused for that many seconds.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = HandlePool(
+                int(config.get_config_value('anuclim', 'handle_pool_size') or POOL_SIZE),
+                float(config.get_config_value('anuclim', 'handle_idle_timeout') or IDLE_TIMEOUT),
+            )
+        return _pool
+
+
+def _reset_pool():
+    # handles (and their connections) must not be shared with forked
+    # children, so children start with an empty pool
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_pool)
+
+
+class _Entry(object):
+
+    def __init__(self, handle, close):
+        self.handle = handle
+        self.close = close
+        self.users = 0
+        self.last_used = time.monotonic()
+
+
+class HandlePool(object):
+    """Thread safe pool of open dataset handles keyed by dataset.
+
+    Keys identify a dataset and the library it is opened with (e.g.
+    backend and url). Jobs acquire a handle for a key, which opens it or
+    reuses an already open handle, and release it when done. Handles not
+    used by any job are closed after idle_timeout seconds, or when the
+    pool holds more than max_size handles (least recently used first). A
+    handle that failed with an I/O error is discarded, so the next
+    acquire reconnects.
+
+    opened, reused, reconnects and closed count handle life cycle events.
+    """
+
+    def __init__(self, max_size=POOL_SIZE, idle_timeout=IDLE_TIMEOUT):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.opened = 0
+        self.reused = 0
+        self.reconnects = 0
+        self.closed = 0
+        self._entries = {}
+        # discarded handles still in use by other jobs, by id(handle)
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'open': len(self._entries),
+                'opened': self.opened,
+                'reused': self.reused,
+                'reconnects': self.reconnects,
+                'closed': self.closed,
+            }
+
+    def acquire(self, key, opener, closer=None):
+        """Return an open handle for key, calling opener() if there is none.
+
+        closer(handle) is used to close the handle once it is evicted.
+        Every acquire has to be matched by a release (or discard).
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.users += 1
+                entry.last_used = time.monotonic()
+                self.reused += 1
+                return entry.handle
+        # open outside the lock, so that slow opens don't block other urls
+        handle = opener()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                # another thread opened the same url in the mean time
+                entry.users += 1
+                entry.last_used = time.monotonic()
+                self.reused += 1
+                duplicate = _Entry(handle, closer)
+            else:
+                entry = self._entries[key] = _Entry(handle, closer)
+                entry.users += 1
+                self.opened += 1
+                duplicate = None
+            expired = self._expire()
+        if duplicate is not None:
+            expired.append(duplicate)
+        self._close(expired)
+        return entry.handle
+
+    def release(self, key, handle):
+        """Return a handle acquired for key to the pool."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.handle is not handle:
+                # handle was discarded while in use, close it after last use
+                entry = self._retired.get(id(handle))
+                if entry is None:
+                    return
+                entry.users -= 1
+                if entry.users > 0:
+                    return
+                expired = [self._retired.pop(id(handle))]
+            else:
+                entry.users -= 1
+                entry.last_used = time.monotonic()
+                expired = self._expire()
+        self._close(expired)
+
+    def discard(self, key, handle):
+        """Drop a failed handle for key from the pool.
+
+        The next acquire for key opens a new handle. Callers release their
+        use of the failed handle with this as well; the handle is closed
+        once no other job uses it anymore.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.handle is not handle:
+                # already discarded by another user
+                entry = self._retired.get(id(handle))
+                if entry is None:
+                    return
+            else:
+                del self._entries[key]
+                self.reconnects += 1
+                self._retired[id(handle)] = entry
+            entry.users -= 1
+            if entry.users > 0:
+                return
+            del self._retired[id(handle)]
+        self._close([entry])
+
+    def clear(self):
+        """Close all handles not in use."""
+        with self._lock:
+            expired = [entry for entry in self._entries.values() if not entry.users]
+            self._entries = {key: entry for key, entry in self._entries.items() if entry.users}
+        self._close(expired)
+
+    def _expire(self):
+        # needs to be called with self._lock held
+        now = time.monotonic()
+        idle = sorted((entry.last_used, key) for key, entry in self._entries.items()
+                      if not entry.users)
+        expired = []
+        for last_used, key in idle:
+            if len(self._entries) <= self.max_size and now - last_used < self.idle_timeout:
+                break
+            expired.append(self._entries.pop(key))
+        return expired
+
+    def _close(self, entries):
+        for entry in entries:
+            if entry.close is None:
+                continue
+            try:
+                entry.close(entry.handle)
+            except Exception as e:
+                logging.getLogger(__name__).warn('Failed to close dataset handle: {}'.format(e))
+        with self._lock:
+            self.closed += len(entries)
@@ -0,0 +1,180 @@
+"""Copy an ANUClim variable into a local store for fast extraction.
+
+The local copy is chunked for point and time series access (long time
+chunks, small spatial chunks), as opposed to the time slice layout of the
+published files. Point the extract processes at it via pywps.cfg, e.g.
+
+    [anuclim:sources]
+    rainfall = zarr:/data/anuclim/rainfall.zarr
+
+Usage:
+
+    anuclim-materialize rainfall /data/anuclim/rainfall.zarr
+"""
+import argparse
+import logging
+import sys
+
+import numpy as np
+
+from pywps import configuration as config
+
+from ecocloud_wps_demo.anuclim import backends
+from ecocloud_wps_demo.anuclim.backends import VARIABLES, open_dataset, release_dataset
+from ecocloud_wps_demo.anuclim.dates import EPOCH, time_axis_days
+
+
+# default (time, lat, lon) chunk shape of materialized stores
+CHUNKS = (365, 16, 16)
+
+# maximum number of grid cells copied in one go
+COPY_CELLS = 64 * 1024 * 1024
+
+FILL_VALUE = -9999.0
+
+
+def _index_range(axis, lo, hi):
+    """Return start, stop of axis indices with values within lo ... hi."""
+    inside = np.nonzero((axis >= min(lo, hi)) & (axis <= max(lo, hi)))[0]
+    if not len(inside):
+        raise Exception('Requested area outside data area')
+    return int(inside[0]), int(inside[-1]) + 1
+
+
+class _NetCDFStore(object):
+
+    def __init__(self, filename, variable, axes, time_units, shape, chunks, dtype):
+        from netCDF4 import Dataset
+        with backends.netcdf_lock:
+            self.ds = Dataset(filename, 'w')
+            self.ds.Conventions = 'CF-1.6'
+            for name, units in (('time', time_units), ('lat', 'degrees_north'), ('lon', 'degrees_east')):
+                self.ds.createDimension(name, len(axes[name]))
+                axis = self.ds.createVariable(name, axes[name].dtype, (name,))
+                axis.units = units
+                axis[:] = axes[name]
+            self.grid = self.ds.createVariable(
+                variable, dtype, ('time', 'lat', 'lon'),
+                zlib=True, chunksizes=chunks, fill_value=np.array(FILL_VALUE, dtype=dtype))
+
+    def write(self, start, stop, block):
+        with backends.netcdf_lock:
+            self.grid[start[0]:stop[0], start[1]:stop[1], start[2]:stop[2]] = block
+
+    def close(self):
+        with backends.netcdf_lock:
+            self.ds.close()
+
+
+class _ZarrStore(object):
+
+    def __init__(self, path, variable, axes, time_units, shape, chunks, dtype):
+        try:
+            import zarr
+        except ImportError:
+            # the zarr store is only available if zarr is installed
+            raise Exception('zarr is not installed, can not create {}'.format(path))
+        zarr.open_group(path, mode='w')
+        for name, units in (('time', time_units), ('lat', 'degrees_north'), ('lon', 'degrees_east')):
+            axis = zarr.open_array(store=path, path=name, mode='w', shape=axes[name].shape,
+                                   chunks=axes[name].shape, dtype=axes[name].dtype)
+            axis[:] = axes[name]
+            axis.attrs['units'] = units
+        self.grid = zarr.open_array(store=path, path=variable, mode='w', shape=shape,
+                                    chunks=chunks, dtype=dtype, fill_value=FILL_VALUE)
+
+    def write(self, start, stop, block):
+        self.grid[start[0]:stop[0], start[1]:stop[1], start[2]:stop[2]] = \
+            np.ma.filled(block, FILL_VALUE)
+
+    def close(self):
+        pass
+
+
+STORES = {
+    'netcdf': _NetCDFStore,
+    'zarr': _ZarrStore,
+}
+
+
+def materialize(var, dest, store='zarr', chunks=CHUNKS, bbox=None, start_date=None, end_date=None):
+    """Copy variable var (optionally a subset) into a local store at dest.
+
+    var is read from its configured source. bbox is (min lon, min lat,
+    max lon, max lat), dates are 'YYYY-MM-DD' strings. Data is copied in
+    blocks aligned to chunks, so each chunk of the store is written once.
+    """
+    log = logging.getLogger(__name__)
+    dataset = open_dataset(var, 'opendap')
+    try:
+        grid = dataset['data']
+        lats = np.asarray(dataset['lats'])
+        lons = np.asarray(dataset['lons'])
+        times = np.asarray(dataset['times'])
+        time_units = dataset.get('time_units') or 'seconds since 1970-01-01'
+
+        # subset to requested area and dates
+        y0, y1 = (0, len(lats)) if bbox is None else _index_range(lats, bbox[1], bbox[3])
+        x0, x1 = (0, len(lons)) if bbox is None else _index_range(lons, bbox[0], bbox[2])
+        t0, t1 = 0, len(times)
+        if start_date or end_date:
+            tdays = time_axis_days(times, dataset.get('time_units'))
+            first = (np.datetime64(start_date, 'D') - EPOCH).astype(np.int64) if start_date else tdays[0]
+            last = (np.datetime64(end_date, 'D') - EPOCH).astype(np.int64) if end_date else tdays[-1]
+            t0, t1 = _index_range(tdays, first, last)
+
+        shape = (t1 - t0, y1 - y0, x1 - x0)
+        chunks = tuple(min(c, n) for c, n in zip(chunks, shape))
+        dtype = np.dtype(getattr(grid.grid, 'dtype', np.float32))
+        axes = {'time': times[t0:t1], 'lat': lats[y0:y1], 'lon': lons[x0:x1]}
+        out = STORES[store](dest, VARIABLES[var]['variable'], axes, time_units, shape, chunks, dtype)
+        try:
+            # copy one chunk deep time band at a time, over as many chunk rows
+            # as fit into COPY_CELLS
+            rows = max(1, COPY_CELLS // (chunks[0] * chunks[1] * shape[2])) * chunks[1]
+            for bt in range(0, shape[0], chunks[0]):
+                for by in range(0, shape[1], rows):
+                    start = (bt, by, 0)
+                    stop = (min(bt + chunks[0], shape[0]), min(by + rows, shape[1]), shape[2])
+                    block = grid.read_slab((t0 + start[0], y0 + start[1], x0),
+                                           (t0 + stop[0], y0 + stop[1], x1))
+                    out.write(start, stop, block)
+                log.info('Copied {} of {} time steps'.format(min(bt + chunks[0], shape[0]), shape[0]))
+        finally:
+            out.close()
+    finally:
+        release_dataset(dataset)
+    return shape
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Copy an ANUClim variable into a local store chunked for point/time series access.')
+    parser.add_argument('variable', choices=sorted(VARIABLES.keys()))
+    parser.add_argument('dest', help='path of the store to create')
+    parser.add_argument('--store', choices=sorted(STORES.keys()),
+                        help='store format (default: zarr, or netcdf if dest ends with .nc)')
+    parser.add_argument('--chunks', default=','.join(str(c) for c in CHUNKS),
+                        help='time,lat,lon chunk shape (default: %(default)s)')
+    parser.add_argument('--bbox', help='min_lon,min_lat,max_lon,max_lat to copy a subset only')
+    parser.add_argument('--start-date', help='first date to copy (YYYY-MM-DD)')
+    parser.add_argument('--end-date', help='last date to copy (YYYY-MM-DD)')
+    parser.add_argument('--config', action='append', default=[],
+                        help='pywps.cfg to read variable sources and cache settings from')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    config.load_configuration(args.config)
+    store = args.store or ('netcdf' if args.dest.endswith('.nc') else 'zarr')
+    chunks = tuple(int(c) for c in args.chunks.split(','))
+    bbox = tuple(float(c) for c in args.bbox.split(',')) if args.bbox else None
+    shape = materialize(args.variable, args.dest, store, chunks, bbox, args.start_date, args.end_date)
+    print('Copied {} {} into {}'.format(args.variable, shape, args.dest))
+    print('Add to pywps.cfg to serve it from there:')
+    print('[anuclim:sources]')
+    print('{} = {}:{}'.format(args.variable, store, args.dest))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,153 @@
+import csv
+import importlib.util
+import shutil
+
+from pywps import Format
+
+from ecocloud_wps_demo.anuclim.batch import BUFFER_SIZE
+
+# columnar output formats are only offered if pyarrow is installed, it is
+# imported once such a format is written
+HAVE_PYARROW = importlib.util.find_spec('pyarrow') is not None
+
+
+PARQUET = 'application/vnd.apache.parquet'
+ARROW = 'application/vnd.apache.arrow.file'
+
+
+class CSVWriter(object):
+    """Write extracted rows as csv.
+
+    header is the full output header; the last nvars columns hold the
+    extracted values. If with_header is False only rows are written, which
+    is used for shards that are merged later on.
+    """
+
+    extension = 'csv'
+
+    def __init__(self, filename, header, nvars, with_header=True):
+        self.fp = open(filename, 'w', buffering=BUFFER_SIZE)
+        self.csv_writer = csv.writer(self.fp)
+        if with_header:
+            self.csv_writer.writerow(header)
+
+    def write(self, rows):
+        self.csv_writer.writerows(rows)
+
+    def close(self):
+        self.fp.close()
+
+    @classmethod
+    def merge(cls, filename, header, nvars, shards):
+        """Concatenate shard files (written without header) in order."""
+        with open(filename, 'w', buffering=BUFFER_SIZE) as fp:
+            csv.writer(fp).writerow(header)
+            for shard in shards:
+                with open(shard, 'r') as shard_fp:
+                    shutil.copyfileobj(shard_fp, fp, BUFFER_SIZE)
+
+
+def _import_pyarrow():
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+    return pyarrow
+
+
+class _ArrowWriter(object):
+    """Write extracted rows as record batches of typed columns.
+
+    Input csv columns are kept as strings, extracted values become float64
+    columns with nulls where no value could be extracted.
+    """
+
+    def __init__(self, filename, header, nvars, with_header=True):
+        self.ninput = len(header) - nvars
+        self.nvars = nvars
+        pa = _import_pyarrow()
+        self.schema = pa.schema(
+            [pa.field(name, pa.string()) for name in header[:self.ninput]] +
+            [pa.field(name, pa.float64()) for name in header[self.ninput:]]
+        )
+        self.writer = self._open(filename, self.schema)
+
+    def _batch(self, rows):
+        pa = _import_pyarrow()
+        ninput = self.ninput
+        arrays = []
+        for col in range(ninput):
+            arrays.append(pa.array([row[col] if col < len(row) - self.nvars else None for row in rows],
+                                   pa.string()))
+        for col in range(self.nvars):
+            # extracted values were appended to the end of each row
+            offset = col - self.nvars
+            arrays.append(pa.array([None if row[offset] == '' else float(row[offset]) for row in rows],
+                                   pa.float64()))
+        return pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+    def write(self, rows):
+        if rows:
+            self.writer.write_batch(self._batch(rows))
+
+    def close(self):
+        self.writer.close()
+
+    @classmethod
+    def merge(cls, filename, header, nvars, shards):
+        """Copy record batches of all shard files in order into filename."""
+        writer = cls(filename, header, nvars)
+        try:
+            for shard in shards:
+                for batch in cls._read_batches(shard):
+                    writer.writer.write_batch(batch)
+        finally:
+            writer.close()
+
+
+class ParquetWriter(_ArrowWriter):
+
+    extension = 'parquet'
+
+    def _open(self, filename, schema):
+        return _import_pyarrow().parquet.ParquetWriter(filename, schema)
+
+    @staticmethod
+    def _read_batches(filename):
+        return _import_pyarrow().parquet.ParquetFile(filename).iter_batches()
+
+
+class ArrowWriter(_ArrowWriter):
+
+    extension = 'arrow'
+
+    def _open(self, filename, schema):
+        return _import_pyarrow().ipc.new_file(filename, schema)
+
+    @staticmethod
+    def _read_batches(filename):
+        pa = _import_pyarrow()
+        with pa.memory_map(filename) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i)
+
+
+WRITERS = {
+    'text/csv': CSVWriter,
+}
+
+OUTPUT_FORMATS = [Format('text/csv')]
+
+if HAVE_PYARROW:
+    WRITERS[PARQUET] = ParquetWriter
+    WRITERS[ARROW] = ArrowWriter
+    OUTPUT_FORMATS += [Format(PARQUET, extension='.parquet'),
+                       Format(ARROW, extension='.arrow')]
+
+
+def get_writer(mime_type):
+    """Return the writer class for output format mime_type."""
+    try:
+        return WRITERS[mime_type]
+    except KeyError:
+        raise Exception('Unsupported output format: {}'.format(mime_type))
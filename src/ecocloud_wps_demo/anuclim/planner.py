@@ -0,0 +1,201 @@
+from collections import namedtuple
+import logging
+import threading
+
+import numpy as np
+
+from pywps import configuration as config
+
+from ecocloud_wps_demo.anuclim.batch import read_points
+
+
+# default maximum number of grid cells fetched in one hyperslab request
+# (1MB for float32 data)
+MAX_SLAB_CELLS = 256 * 1024
+
+
+# start and stop are (time, lat, lon) index tuples, stop is exclusive
+# members are the positions of the points covered by this slab
+Slab = namedtuple('Slab', ['start', 'stop', 'members'])
+
+
+def get_max_slab_cells():
+    return int(config.get_config_value('anuclim', 'max_slab_cells') or MAX_SLAB_CELLS)
+
+
+def plan_reads(tidx, yidx, xidx, max_cells=MAX_SLAB_CELLS):
+    """Group (time, lat, lon) points into rectangular hyperslabs.
+
+    The bounding box of all points is recursively split along its longest
+    axis, until each box holds at most max_cells grid cells. Splits are
+    placed at the largest gap between points in the middle half of the
+    sorted coordinates, which keeps clusters of nearby points together
+    and the recursion balanced.
+
+    Returns a list of Slab tuples sorted by start index.
+    """
+    points = np.stack([tidx, yidx, xidx], axis=1).astype(np.intp)
+    if not len(points):
+        return []
+    max_cells = max(1, max_cells)
+    slabs = []
+    stack = [np.arange(len(points))]
+    while stack:
+        members = stack.pop()
+        coords = points[members]
+        start = coords.min(axis=0)
+        stop = coords.max(axis=0) + 1
+        extent = stop - start
+        if np.prod(extent) <= max_cells:
+            slabs.append(Slab(tuple(start.tolist()), tuple(stop.tolist()), members))
+            continue
+        # split along the longest axis
+        dim = int(np.argmax(extent))
+        order = np.argsort(coords[:, dim], kind='stable')
+        values = coords[order, dim]
+        count = len(values)
+        lo = count // 4
+        hi = max(lo + 1, (3 * count) // 4)
+        split = lo + int(np.argmax(np.diff(values)[lo:hi])) + 1
+        stack.append(members[order[split:]])
+        stack.append(members[order[:split]])
+    slabs.sort(key=lambda slab: slab.start)
+    return slabs
+
+
+class SlabReader(object):
+    """Read points from a grid via coalesced hyperslab requests.
+
+    Can be used as read_points callable for BatchExtractor.
+
+    read_slab(grid, start, stop) has to return a (masked) numpy array for
+    the given hyperslab. If a slab read fails, the points within it are
+    read one by one with read_value(grid, t, y, x) instead, so that only
+    points that really can't be read end up empty.
+    """
+
+    def __init__(self, read_slab, read_value, max_cells=MAX_SLAB_CELLS):
+        self.read_slab = read_slab
+        self.read_value = read_value
+        self.max_cells = max_cells
+        # number of slabs / points read so far
+        self.reads = 0
+        self.points = 0
+        # guards the counters, as variables may be read concurrently
+        self._lock = threading.Lock()
+
+    def __call__(self, grid, tidx, yidx, xidx):
+        log = logging.getLogger(__name__)
+        values = np.full(len(tidx), '', dtype=object)
+        failed = np.zeros(len(tidx), dtype=bool)
+        slabs = plan_reads(tidx, yidx, xidx, self.max_cells)
+        reads = 0
+        for slab in slabs:
+            members = slab.members
+            t = tidx[members] - slab.start[0]
+            y = yidx[members] - slab.start[1]
+            x = xidx[members] - slab.start[2]
+            try:
+                data = self.read_slab(grid, slab.start, slab.stop)
+            except Exception as e:
+                log.warn('Failed to read slab {} - {}, reading points one by one: {}'.format(
+                    slab.start, slab.stop, e))
+                values[members], failed[members] = read_points(
+                    self.read_value, grid, tidx[members], yidx[members], xidx[members])
+                reads += len(members)
+                continue
+            reads += 1
+            # scatter slab values back to points, masked cells have no data
+            values[members] = np.ma.getdata(data)[t, y, x]
+            values[members[np.ma.getmaskarray(data)[t, y, x]]] = ''
+        with self._lock:
+            self.reads += reads
+            self.points += len(tidx)
+        log.debug('Read {} points with {} slab requests'.format(len(tidx), len(slabs)))
+        return values, failed
+
+
+# statistics available to reduce a time window to a single value
+WINDOW_STATS = {
+    'mean': np.ma.mean,
+    'min': np.ma.min,
+    'max': np.ma.max,
+    'sum': np.ma.sum,
+}
+
+
+class WindowReader(object):
+    """Read a statistic over a time window per point via coalesced hyperslabs.
+
+    Can be used as read_points callable for BatchExtractor.
+
+    For a point at time index t the window covers the length time steps
+    ending offset steps before t, i.e. t - offset - length + 1 ... t - offset.
+    Points are planned as with SlabReader on their window start, and each
+    slab is extended by the window length along the time axis, so every
+    cluster of points is read as one contiguous time slab. Windows are then
+    reduced with stat (see WINDOW_STATS), ignoring masked cells.
+
+    Points whose window is not fully within the time axis can't be read.
+    """
+
+    def __init__(self, read_slab, length, offset=0, stat='mean', max_cells=MAX_SLAB_CELLS):
+        self.read_slab = read_slab
+        self.length = length
+        self.offset = offset
+        self.stat = WINDOW_STATS[stat]
+        self.max_cells = max_cells
+        # number of slabs / points read so far
+        self.reads = 0
+        self.points = 0
+        # guards the counters, as variables may be read concurrently
+        self._lock = threading.Lock()
+
+    def _reduce(self, windows):
+        # windows is a (points, length) masked array
+        result = self.stat(windows, axis=1)
+        values = np.ma.getdata(result).astype(object)
+        values[np.ma.getmaskarray(result)] = ''
+        return values
+
+    def __call__(self, grid, tidx, yidx, xidx):
+        log = logging.getLogger(__name__)
+        values = np.full(len(tidx), '', dtype=object)
+        failed = np.zeros(len(tidx), dtype=bool)
+        start = tidx - self.offset - self.length + 1
+        inside = (start >= 0) & (start + self.length <= grid.shape[0])
+        failed[~inside] = True
+        points = np.flatnonzero(inside)
+        slabs = plan_reads(start[points], yidx[points], xidx[points],
+                           max(1, self.max_cells // self.length))
+        steps = np.arange(self.length)
+        reads = 0
+        for slab in slabs:
+            members = points[slab.members]
+            slab_stop = (slab.stop[0] + self.length - 1, slab.stop[1], slab.stop[2])
+            t = start[members] - slab.start[0]
+            y = yidx[members] - slab.start[1]
+            x = xidx[members] - slab.start[2]
+            try:
+                data = np.ma.asarray(self.read_slab(grid, slab.start, slab_stop))
+                reads += 1
+                values[members] = self._reduce(
+                    data[t[:, None] + steps, y[:, None], x[:, None]])
+            except Exception as e:
+                log.warn('Failed to read slab {} - {}, reading windows one by one: {}'.format(
+                    slab.start, slab_stop, e))
+                for point in members:
+                    t0, y0, x0 = start[point], yidx[point], xidx[point]
+                    try:
+                        data = np.ma.asarray(self.read_slab(
+                            grid, (t0, y0, x0), (t0 + self.length, y0 + 1, x0 + 1)))
+                        values[point] = self._reduce(data.reshape(1, self.length))[0]
+                    except Exception as e:
+                        log.warn('Failed to read window at {}: {}'.format((t0, y0, x0), e))
+                        failed[point] = True
+                    reads += 1
+        with self._lock:
+            self.reads += reads
+            self.points += len(tidx)
+        log.debug('Read {} windows with {} slab requests'.format(len(tidx), len(slabs)))
+        return values, failed
@@ -0,0 +1,45 @@
+from math import ceil
+
+from pywps import configuration as config
+
+from ecocloud_wps_demo.exploratory import stats
+from ecocloud_wps_demo.exploratory.render import new_figure
+
+
+def summarise(read_chunks, variables):
+    # Summarise columns chunk by chunk, rather than loading them into
+    # memory to sort them
+    error = float(config.get_config_value('exploratory', 'box_quantile_error')
+                  or stats.QUANTILE_ERROR)
+    return stats.chunked_box_stats(read_chunks, variables, error)
+
+
+def describe(box_stats, variables):
+    return {var: box_stats[var] for var in variables}
+
+
+def draw(box_stats, variables, title):
+    variables_count = len(variables)
+
+    # Plot into subplots, one per variable
+    figure = new_figure()
+
+    # Set title where provided
+    if title is not None:
+        figure.suptitle(title)
+
+    # Subplot grid is maximum 2 columns wide, with plots in a Z arrangement
+    subplot_cols = 2 if variables_count > 1 else 1
+    subplot_rows = ceil(variables_count / 2)
+
+    for idx, var in enumerate(variables):
+        # Draw subplot from precomputed statistics (without NA/NaNs)
+        axes = figure.add_subplot(subplot_rows, subplot_cols, idx + 1)
+        axes.set_title(var)
+        axes.bxp([box_stats[var]])
+
+        # Clean up plot by removing unnecessary stuff
+        axes.tick_params(axis='x', which='both',
+                         bottom=False, labelbottom=False)
+
+    return figure
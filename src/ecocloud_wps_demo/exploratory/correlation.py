@@ -0,0 +1,129 @@
+import numpy as np
+
+from pywps import configuration as config
+
+from ecocloud_wps_demo.exploratory import stats
+from ecocloud_wps_demo.exploratory.csvcache import read_frame
+from ecocloud_wps_demo.exploratory.render import new_figure
+
+
+# default number of rows above which pairs are drawn as binned densities
+# instead of scatter plots
+MAX_SCATTER_ROWS = 20000
+
+# default number of bins along each axis of binned panels
+PANEL_BINS = 50
+
+# size of each panel in inches, same as sns.pairplot
+PANEL_SIZE = 2.5
+
+
+def summarise(read_chunks, variables):
+    """Compute Pearson and Spearman coefficients over all rows, and
+    binned densities of each column and pair of columns.
+
+    Inputs of up to correlation_max_scatter_rows rows are kept as well,
+    and drawn as scatter plots.
+    """
+    csv_df = read_frame(read_chunks)
+    max_rows = config.get_config_value('exploratory', 'correlation_max_scatter_rows')
+    max_rows = MAX_SCATTER_ROWS if max_rows in ('', None) else int(max_rows)
+    bins = int(config.get_config_value('exploratory', 'correlation_bins') or PANEL_BINS)
+
+    names = list(csv_df.columns)
+    columns = [csv_df[name].values for name in names]
+    pairs = {}
+    for i in range(len(names)):
+        for j in range(i + 1, len(names)):
+            pairs[i, j] = stats.histogram2d(columns[i], columns[j], bins)
+    return {
+        'names': names,
+        'pearson': stats.correlation(columns, 'pearson'),
+        'spearman': stats.correlation(columns, 'spearman'),
+        'histograms': [stats.histogram(values, bins) for values in columns],
+        'pairs': pairs,
+        'data': csv_df if len(csv_df) <= max_rows else None,
+    }
+
+
+def describe(summary, variables):
+    names = summary['names']
+    return {
+        'variables': names,
+        'pearson': summary['pearson'],
+        'spearman': summary['spearman'],
+        'histograms': {
+            name: {'counts': counts, 'edges': edges}
+            for name, (counts, edges) in zip(names, summary['histograms'])
+        },
+        'pairs': [
+            {'x': names[i], 'y': names[j], 'counts': counts,
+             'x_edges': xedges, 'y_edges': yedges}
+            for (i, j), (counts, xedges, yedges) in sorted(summary['pairs'].items())
+        ],
+    }
+
+
+def draw(summary, variables, title):
+    if summary['data'] is None:
+        figure = _draw_binned(summary)
+    else:
+        # seaborn imports pyplot, so only load it when drawing
+        import seaborn as sns
+        # Generating a pair plot through `seaborn`
+        pairplot = sns.pairplot(summary['data'])
+        figure = pairplot.fig
+
+    # Set title where provided
+    if title is not None:
+        figure.suptitle(title)
+
+    return figure
+
+
+def _draw_binned(summary):
+    """Draw a pair plot of binned densities, annotated with Pearson (r)
+    and Spearman (rho) coefficients over all rows.
+
+    Panels are drawn from bin counts, so the cost of drawing doesn't
+    depend on the number of rows.
+    """
+    from matplotlib.colors import LogNorm
+
+    names = summary['names']
+    pearson = summary['pearson']
+    spearman = summary['spearman']
+
+    count = len(names)
+    figure = new_figure(figsize=(PANEL_SIZE * count, PANEL_SIZE * count))
+    for row in range(count):
+        for col in range(count):
+            axes = figure.add_subplot(count, count, row * count + col + 1)
+            if row == col:
+                counts, edges = summary['histograms'][col]
+                axes.hist(edges[:-1], bins=edges, weights=counts)
+            else:
+                if col < row:
+                    counts, xedges, yedges = summary['pairs'][col, row]
+                else:
+                    counts, yedges, xedges = summary['pairs'][row, col]
+                    counts = counts.T
+                counts = np.ma.masked_equal(counts, 0)
+                if counts.count():
+                    axes.pcolormesh(xedges, yedges, counts.T, cmap='Blues', norm=LogNorm())
+                axes.text(
+                    0.03, 0.97,
+                    'r = {:.2f}\nrho = {:.2f}'.format(pearson[row, col], spearman[row, col]),
+                    transform=axes.transAxes, va='top', fontsize='small')
+            # Label outer panels only, like sns.pairplot
+            if row == count - 1:
+                axes.set_xlabel(names[col])
+            else:
+                axes.tick_params(labelbottom=False)
+            if col == 0:
+                axes.set_ylabel(names[row])
+            else:
+                axes.tick_params(labelleft=False)
+    # leave room for the title
+    figure.tight_layout(rect=(0, 0, 1, 0.95))
+    return figure
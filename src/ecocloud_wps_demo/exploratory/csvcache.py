@@ -0,0 +1,341 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import os.path
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from pywps import configuration as config
+
+
+# default size limit of the parsed csv cache in MB
+CACHE_SIZE_MB = 512
+
+# block size used to hash input files
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# default number of rows per chunk when reading csv files in chunks
+CHUNK_ROWS = 100000
+
+
+def get_csv_cache():
+    """Return the CSVCache configured in pywps.cfg, or None if disabled.
+
+    The cache lives in [exploratory] csv_cache_dir (default: a folder within
+    the pywps workdir) and is limited to csv_cache_size_mb. A size of 0
+    disables the cache.
+    """
+    size_mb = config.get_config_value('exploratory', 'csv_cache_size_mb')
+    size_mb = CACHE_SIZE_MB if size_mb in ('', None) else int(size_mb)
+    if size_mb <= 0:
+        return None
+    path = config.get_config_value('exploratory', 'csv_cache_dir')
+    if not path:
+        path = os.path.join(config.get_config_value('server', 'workdir'), 'exploratory_csv')
+    return CSVCache(path, size_mb * 1024 * 1024)
+
+
+def parse_csv(filename, columns):
+    """Read columns from csv file, with non numeric values coerced to NaN."""
+    return pd.read_csv(filename, usecols=columns).apply(pd.to_numeric, errors='coerce')
+
+
+def read_csv(filename, columns, digest=None):
+    """Read numeric columns from csv file, through the csv cache if enabled.
+
+    digest is the file_digest of filename, if already known.
+    """
+    cache = get_csv_cache()
+    if cache is None:
+        return parse_csv(filename, columns)
+    return cache.read(filename, columns, digest)
+
+
+def get_chunk_rows():
+    return int(config.get_config_value('exploratory', 'chunk_rows') or CHUNK_ROWS)
+
+
+def iter_csv(filename, columns, digest=None, chunk_rows=None):
+    """Yield numeric columns of csv file as DataFrames of chunk_rows rows.
+
+    Columns in the csv cache are read from there (memory mapped), others
+    are parsed chunk by chunk, so memory use doesn't depend on the size of
+    the file. Parsed columns are added to the cache once all chunks have
+    been read, so another pass over the file reads them from there.
+    """
+    chunk_rows = chunk_rows or get_chunk_rows()
+    cache = get_csv_cache()
+    if cache is not None:
+        digest = digest or file_digest(filename)
+    cached = cache.load(filename, columns, digest) if cache is not None else None
+    if cached is None:
+        chunks = (chunk.apply(pd.to_numeric, errors='coerce')
+                  for chunk in pd.read_csv(filename, usecols=columns, chunksize=chunk_rows))
+        if cache is not None:
+            chunks = cache.spool(filename, chunks, digest)
+        yield from chunks
+        return
+    names = list(cached)
+    rows = len(cached[names[0]]) if names else 0
+    for start in range(0, rows, chunk_rows):
+        yield pd.DataFrame({name: np.array(cached[name][start:start + chunk_rows])
+                            for name in names}, columns=names)
+
+
+def read_frame(read_chunks):
+    """Return the chunks of read_chunks() as a single DataFrame."""
+    chunks = list(read_chunks())
+    if len(chunks) == 1:
+        return chunks[0]
+    return pd.concat(chunks, ignore_index=True)
+
+
+def frame_reader(csv_df, chunked=False):
+    """Return a read_chunks function over csv_df, in the chunks iter_csv
+    would yield if chunked."""
+    if not chunked:
+        return lambda: iter([csv_df])
+    chunk_rows = get_chunk_rows()
+    return lambda: (csv_df.iloc[start:start + chunk_rows]
+                    for start in range(0, len(csv_df), chunk_rows))
+
+
+def file_digest(filename):
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as fp:
+        for block in iter(lambda: fp.read(HASH_BLOCK_SIZE), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+class _ColumnSpool(object):
+    # values of a column, written chunk by chunk to a temporary file
+
+    def __init__(self, entry):
+        fd, self.name = tempfile.mkstemp(dir=entry, suffix='.tmp')
+        self.fp = os.fdopen(fd, 'w+b')
+        self.segments = []
+
+    def add(self, values):
+        if not len(values):
+            return 0
+        values = np.ascontiguousarray(values)
+        self.fp.write(values.tobytes())
+        self.segments.append((values.dtype, len(values)))
+        return values.nbytes
+
+    def save(self, fp):
+        # write as .npy, in the common type of all chunks (as parse_csv
+        # would return for the whole column)
+        dtype = np.result_type(*[dtype for dtype, count in self.segments])
+        np.lib.format.write_array_header_1_0(fp, {
+            'descr': np.lib.format.dtype_to_descr(dtype),
+            'fortran_order': False,
+            'shape': (sum(count for dtype, count in self.segments),),
+        })
+        self.fp.seek(0)
+        for segment_dtype, count in self.segments:
+            values = np.frombuffer(self.fp.read(count * segment_dtype.itemsize), dtype=segment_dtype)
+            fp.write(values.astype(dtype).tobytes())
+
+    def close(self):
+        self.fp.close()
+        os.unlink(self.name)
+
+
+class CSVCache(object):
+    """Disk backed LRU cache of parsed, numeric csv columns.
+
+    Entries are keyed by a hash of the csv file content, so the same data
+    uploaded again for another plot is found regardless of its file name.
+    Each entry is a folder holding the csv header and one .npy file per
+    parsed column; columns are parsed on first use only.
+
+    Access times are tracked via folder mtime, and when the cache grows
+    beyond max_bytes the least recently used entries are removed. Files are
+    written to a temporary name and renamed into place, and eviction holds
+    an exclusive lock, so the cache can be shared between processes.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def _column_file(self, entry, column):
+        digest = hashlib.sha1(column.encode('utf-8')).hexdigest()
+        return os.path.join(entry, '{}.npy'.format(digest))
+
+    def _store(self, entry, filename, save):
+        fd, tmpname = tempfile.mkstemp(dir=entry, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                save(fp)
+            os.replace(tmpname, filename)
+        except Exception:
+            os.unlink(tmpname)
+            raise
+
+    def _header(self, entry, filename):
+        header_file = os.path.join(entry, 'header.json')
+        try:
+            with open(header_file, 'r') as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            pass
+        header = list(pd.read_csv(filename, nrows=0).columns)
+        self._store(entry, header_file, lambda fp: fp.write(json.dumps(header).encode('utf-8')))
+        return header
+
+    def read(self, filename, columns, digest=None):
+        """Return a DataFrame of numeric columns of csv file filename.
+
+        Behaves like parse_csv, but columns parsed before from a file with
+        the same content are loaded from the cache.
+        """
+        log = logging.getLogger(__name__)
+        entry = os.path.join(self.path, digest or file_digest(filename))
+        try:
+            os.makedirs(entry, exist_ok=True)
+            # mark as recently used
+            os.utime(entry)
+            header = self._header(entry, filename)
+        except Exception as e:
+            # caching is best effort
+            log.warn('Failed to use csv cache {}: {}'.format(entry, e))
+            return parse_csv(filename, columns)
+
+        data = {}
+        missing = []
+        for column in columns:
+            if column in data or column in missing:
+                continue
+            try:
+                data[column] = np.load(self._column_file(entry, column))
+            except FileNotFoundError:
+                missing.append(column)
+            except Exception as e:
+                log.warn('Failed to load cached column {}: {}'.format(column, e))
+                missing.append(column)
+        if missing:
+            # raises like parse_csv if columns are not in the file
+            parsed = parse_csv(filename, missing)
+            for column in missing:
+                values = parsed[column].values
+                data[column] = values
+                try:
+                    self._store(entry, self._column_file(entry, column),
+                                lambda fp: np.save(fp, values))
+                except Exception as e:
+                    log.warn('Failed to cache column {}: {}'.format(column, e))
+            self.evict()
+        log.info('CSV cache: {} columns cached, {} parsed'.format(len(data) - len(missing), len(missing)))
+        # same column order as pd.read_csv(usecols=...)
+        ordered = sorted(data, key=header.index)
+        return pd.DataFrame({column: data[column] for column in ordered}, columns=ordered)
+
+    def spool(self, filename, chunks, digest=None):
+        """Yield chunks, DataFrames of numeric columns of csv file filename,
+        and cache their columns once all chunks have been read.
+
+        Columns are written to temporary files chunk by chunk, so memory
+        use doesn't depend on the size of the file. Nothing is cached if
+        the columns don't fit into the cache, or iteration stops early.
+        """
+        log = logging.getLogger(__name__)
+        entry = os.path.join(self.path, digest or file_digest(filename))
+        try:
+            os.makedirs(entry, exist_ok=True)
+            # mark as recently used
+            os.utime(entry)
+            self._header(entry, filename)
+        except Exception as e:
+            # caching is best effort
+            log.warn('Failed to use csv cache {}: {}'.format(entry, e))
+            yield from chunks
+            return
+
+        spools = {}
+        size = 0
+        try:
+            for chunk in chunks:
+                if spools is not None:
+                    try:
+                        for column in chunk.columns:
+                            if column not in spools:
+                                spools[column] = _ColumnSpool(entry)
+                            size += spools[column].add(chunk[column].values)
+                    except Exception as e:
+                        log.warn('Failed to spool columns to csv cache {}: {}'.format(entry, e))
+                        size = None
+                    if size is None or size > self.max_bytes:
+                        for spool in spools.values():
+                            spool.close()
+                        spools = None
+                yield chunk
+            for column, spool in (spools or {}).items():
+                if not spool.segments:
+                    # no rows
+                    continue
+                try:
+                    self._store(entry, self._column_file(entry, column), spool.save)
+                except Exception as e:
+                    log.warn('Failed to cache column {}: {}'.format(column, e))
+            if spools:
+                log.info('CSV cache: {} columns parsed'.format(len(spools)))
+                self.evict()
+        finally:
+            for spool in (spools or {}).values():
+                spool.close()
+
+    def load(self, filename, columns, digest=None):
+        """Return memory mapped cached columns by name, in file order, or
+        None unless all columns are cached."""
+        entry = os.path.join(self.path, digest or file_digest(filename))
+        try:
+            with open(os.path.join(entry, 'header.json'), 'r') as fp:
+                header = json.load(fp)
+            data = {column: np.load(self._column_file(entry, column), mmap_mode='r')
+                    for column in set(columns)}
+            # mark as recently used
+            os.utime(entry)
+        except (OSError, ValueError):
+            return None
+        return {column: data[column] for column in sorted(data, key=header.index)}
+
+    def evict(self):
+        """Remove least recently used entries until the cache is within max_bytes.
+
+        Removes entries down to 90% of max_bytes, so that eviction doesn't
+        run on every single store.
+        """
+        log = logging.getLogger(__name__)
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, '.lock'), 'w') as lockfp:
+            fcntl.flock(lockfp, fcntl.LOCK_EX)
+            entries = []
+            total = 0
+            for name in os.listdir(self.path):
+                entry = os.path.join(self.path, name)
+                if not os.path.isdir(entry):
+                    continue
+                try:
+                    size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+                    entries.append((os.stat(entry).st_mtime, size, entry))
+                except OSError:
+                    continue
+                total += size
+            if total <= self.max_bytes:
+                return
+            evicted = 0
+            for mtime, size, entry in sorted(entries):
+                if total <= self.max_bytes * 0.9:
+                    break
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
+                evicted += 1
+            log.debug('Evicted {} entries from csv cache {}'.format(evicted, self.path))
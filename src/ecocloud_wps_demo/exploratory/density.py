@@ -0,0 +1,68 @@
+from math import ceil
+
+from pywps import configuration as config
+
+from ecocloud_wps_demo.exploratory import stats
+from ecocloud_wps_demo.exploratory.csvcache import read_frame
+from ecocloud_wps_demo.exploratory.render import new_figure
+
+
+# default bandwidth rule, 'scott', 'silverman' or a factor
+BANDWIDTH = 'scott'
+
+# default number of values up to which the density is evaluated exactly
+EXACT_MAX_ROWS = 10000
+
+
+def get_bandwidth():
+    bandwidth = config.get_config_value('exploratory', 'density_bandwidth') or BANDWIDTH
+    if bandwidth in ('scott', 'silverman'):
+        return bandwidth
+    return float(bandwidth)
+
+
+def summarise(read_chunks, variables):
+    csv_df = read_frame(read_chunks)
+    bandwidth = get_bandwidth()
+    exact_max_rows = config.get_config_value('exploratory', 'density_exact_max_rows')
+    exact_max_rows = EXACT_MAX_ROWS if exact_max_rows in ('', None) else int(exact_max_rows)
+
+    densities = {}
+    for var in variables:
+        # Drop NA/NaNs which poison the plot or cause it to throw
+        column_data = csv_df[var].dropna()
+        # Gaussian KDE like pandas' density plot, evaluated exactly for
+        # small columns and via binning and FFT for large ones
+        densities[var] = stats.kde(column_data.values, bandwidth,
+                                   exact=len(column_data) <= exact_max_rows)
+    return densities
+
+
+def describe(densities, variables):
+    return {var: {'x': densities[var][0], 'density': densities[var][1]}
+            for var in variables}
+
+
+def draw(densities, variables, title):
+    variables_count = len(variables)
+
+    # Plot into subplots, one per variable
+    figure = new_figure()
+
+    # Set title where provided
+    if title is not None:
+        figure.suptitle(title)
+
+    # Subplot grid is maximum 2 columns wide, with plots in a Z arrangement
+    subplot_cols = 2 if variables_count > 1 else 1
+    subplot_rows = ceil(variables_count / 2)
+
+    for idx, var in enumerate(variables):
+        # Draw subplot
+        axes = figure.add_subplot(subplot_rows, subplot_cols, idx + 1)
+        axes.set_title(var)
+        x, density = densities[var]
+        axes.plot(x, density)
+        axes.set_ylabel('Density')
+
+    return figure
@@ -0,0 +1,41 @@
+from math import ceil
+
+from ecocloud_wps_demo.exploratory import stats
+from ecocloud_wps_demo.exploratory.render import new_figure
+
+
+def summarise(read_chunks, variables):
+    # Count values per bin chunk by chunk, rather than loading whole
+    # columns into memory
+    return stats.chunked_histograms(read_chunks, variables)
+
+
+def describe(histograms, variables):
+    return {var: {'counts': histograms[var][0], 'edges': histograms[var][1]}
+            for var in variables}
+
+
+def draw(histograms, variables, title):
+    variables_count = len(variables)
+
+    # Plot into subplots, one per variable
+    figure = new_figure()
+
+    # Set title where provided
+    if title is not None:
+        figure.suptitle(title)
+
+    # Subplot grid is maximum 2 columns wide, with plots in a Z arrangement
+    subplot_cols = 2 if variables_count > 1 else 1
+    subplot_rows = ceil(variables_count / 2)
+
+    for idx, var in enumerate(variables):
+        # Bins are the equivalent of bins='auto', computed without NA/NaNs
+        counts, edges = histograms[var]
+
+        # Draw subplot
+        axes = figure.add_subplot(subplot_rows, subplot_cols, idx + 1)
+        axes.set_title(var)
+        axes.hist(edges[:-1], bins=edges, weights=counts)
+
+    return figure
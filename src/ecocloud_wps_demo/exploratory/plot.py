@@ -0,0 +1,129 @@
+import importlib
+import json
+import logging
+import os
+
+from pywps import Format
+from pywps import configuration as config
+
+from ecocloud_wps_demo.exploratory.rendercache import get_render_cache, render_key
+
+
+PNG = 'image/png'
+JSON = 'application/json'
+
+# output formats of the plot processes, JSON returns the data that would
+# be plotted instead of drawing it
+PLOT_FORMATS = [Format(PNG), Format(JSON)]
+
+
+class PlotMixin(object):
+    """Shared handler for the exploratory plot processes.
+
+    The plotting itself lives in plot_module, which is imported on first
+    use, so that process metadata is available without loading pandas,
+    matplotlib and friends. The module implements
+
+    - summarise(read_chunks, variables), which computes what is plotted
+      from the DataFrames returned by read_chunks(),
+    - draw(summary, variables, title), which returns the matplotlib figure
+      to write (see render.new_figure), and
+    - describe(summary, variables), which returns the summary as json
+      serialisable data.
+
+    Processes that summarise chunk by chunk set chunked, and get the csv
+    file in chunks rather than as a single DataFrame.
+
+    Plots are rendered on the render pool, and rendered plots are memoized
+    by process, input data, variables, title and the [exploratory]
+    settings listed in cache_settings, so repeated requests for the same
+    plot are served from the render cache. If the output is requested as
+    JSON, the summary is described instead, without drawing.
+    """
+
+    plot_module = None
+    chunked = False
+    # [exploratory] settings that change the plot
+    cache_settings = ()
+
+    def _plotter(self):
+        return importlib.import_module(self.plot_module)
+
+    def _summarise(self, read_chunks, variables):
+        return self._plotter().summarise(read_chunks, variables)
+
+    def _draw(self, summary, variables, title):
+        return self._plotter().draw(summary, variables, title)
+
+    def _describe(self, summary, variables):
+        return self._plotter().describe(summary, variables)
+
+    def _cache_params(self):
+        """Return the settings that change the plot, as part of its cache key."""
+        return {name: config.get_config_value('exploratory', name) for name in self.cache_settings}
+
+    def _reader(self, csv_filepath, variables, digest=None):
+        from ecocloud_wps_demo.exploratory.csvcache import frame_reader, iter_csv, read_csv
+        if self.chunked:
+            return lambda: iter_csv(csv_filepath, variables, digest=digest)
+        # Read only the columns we need from the CSV, or load them from
+        # the cache if this data has been plotted before
+        csv_df = read_csv(csv_filepath, variables, digest=digest)
+        return frame_reader(csv_df)
+
+    def _plot(self, csv_df, variables, title):
+        from ecocloud_wps_demo.exploratory.csvcache import frame_reader
+        summary = self._summarise(frame_reader(csv_df, self.chunked), variables)
+        return self._draw(summary, variables, title)
+
+    def _figure(self, csv_filepath, variables, title, digest=None):
+        summary = self._summarise(self._reader(csv_filepath, variables, digest), variables)
+        return self._draw(summary, variables, title)
+
+    def _write_json(self, csv_filepath, variables, digest, output_path):
+        from ecocloud_wps_demo.exploratory.stats import jsonable
+        summary = self._summarise(self._reader(csv_filepath, variables, digest), variables)
+        with open(output_path, 'w') as fp:
+            json.dump(jsonable(self._describe(summary, variables)), fp)
+        return output_path
+
+    def _handler(self, request, response):
+        from ecocloud_wps_demo.exploratory.csvcache import file_digest
+        from ecocloud_wps_demo.exploratory.render import render, render_plot
+
+        log = logging.getLogger(__name__)
+        # Extract inputs
+        csv_filepath = request.inputs['csv'][0].file
+        variables = [v.data for v in request.inputs['variable']]
+
+        try:
+            title = request.inputs['title'][0].data
+        except:
+            title = None
+
+        data_only = response.outputs['output'].data_format.mime_type == JSON
+        extension = 'json' if data_only else 'png'
+        output_path = os.path.join(self.workdir, 'output.{}'.format(extension))
+
+        # Serve identical requests from the render cache
+        render_cache = get_render_cache()
+        digest = file_digest(csv_filepath)
+        key = render_key(self.identifier, self.version, digest, variables, title, self._cache_params())
+        if render_cache is not None and render_cache.get(key, extension, output_path):
+            log.info('Serving {} from render cache'.format(self.identifier))
+            response.outputs['output'].file = output_path
+            return response
+
+        if data_only:
+            # Nothing is drawn, so there is no need for a render worker
+            self._write_json(csv_filepath, variables, digest, output_path)
+        else:
+            # Plot and write the overall figure with subplots into output file
+            render(render_plot, type(self), csv_filepath, variables, title, digest, output_path)
+        if render_cache is not None:
+            render_cache.put(key, extension, output_path)
+
+        # Finish up by providing the path to the file
+        response.outputs['output'].file = output_path
+
+        return response
@@ -0,0 +1,219 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+
+from pywps import configuration as config
+
+from ecocloud_wps_demo.pywps.processing import get_worker_config, init_worker
+
+
+# default number of worker processes rendering plots
+RENDER_WORKERS = 2
+
+# default number of plots a worker renders before it is replaced
+WORKER_TASKS = 500
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# set in forked children (e.g. asynchronous pywps jobs), which are short
+# lived and render within their own process
+_forked = False
+
+# process this module was loaded in, to detect forked children without
+# fork hooks (Python < 3.7)
+_pid = os.getpid()
+
+# pyplot (used by seaborn) is not thread safe, so renders within the
+# server process are serialised
+_render_lock = threading.Lock()
+
+
+def new_figure(**kwargs):
+    """Return a new matplotlib Figure drawn on an Agg canvas.
+
+    Unlike plt.figure() the figure is not registered with pyplot, so it is
+    freed as soon as it is no longer referenced.
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    figure = Figure(**kwargs)
+    FigureCanvasAgg(figure)
+    return figure
+
+
+def close_figure(figure):
+    """Release all resources held by figure.
+
+    Figures created via pyplot (e.g. by seaborn) are removed from pyplot's
+    figure manager as well.
+    """
+    if getattr(figure.canvas, 'manager', None) is not None:
+        import matplotlib.pyplot as plt
+        plt.close(figure)
+    figure.clear()
+
+
+def save_figure(figure, output_path):
+    """Write figure to output_path and release it."""
+    try:
+        figure.savefig(output_path)
+    finally:
+        close_figure(figure)
+    return output_path
+
+
+def render_plot(process_class, csv_filepath, variables, title, digest, output_path):
+    """Plot the data via process_class._figure and save the figure."""
+    figure = process_class()._figure(csv_filepath, variables, title, digest)
+    return save_figure(figure, output_path)
+
+
+def _init_worker(worker_config):
+    # spawned workers don't inherit the configuration of the service
+    init_worker(worker_config)
+    _warm_worker()
+
+
+def _warm_worker():
+    # import plotting libraries and fill font caches before the first plot
+    import matplotlib
+    matplotlib.use('Agg')
+    import seaborn  # noqa: F401
+    figure = new_figure()
+    figure.add_subplot(1, 1, 1).set_title('warm up')
+    figure.canvas.draw()
+    close_figure(figure)
+
+
+def _noop():
+    return os.getpid()
+
+
+def get_render_pool():
+    """Return the process wide RenderPool, or None if disabled.
+
+    [exploratory] render_workers sets the number of worker processes (0
+    renders within the calling process), render_worker_tasks the number
+    of plots after which a worker is replaced. The pool serves the server
+    process, i.e. synchronous requests and asynchronous jobs run in
+    threads; forked children (asynchronous jobs in multiprocessing mode)
+    don't use a pool.
+    """
+    global _pool
+    _check_fork()
+    workers = config.get_config_value('exploratory', 'render_workers')
+    workers = RENDER_WORKERS if workers in ('', None) else int(workers)
+    if workers <= 0 or _forked:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            tasks = int(config.get_config_value('exploratory', 'render_worker_tasks') or WORKER_TASKS)
+            _pool = RenderPool(workers, tasks)
+        return _pool
+
+
+def _reset_pool():
+    # worker processes belong to the parent
+    global _pool, _pool_lock, _render_lock, _forked, _pid
+    _pool = None
+    _forked = True
+    _pid = os.getpid()
+    _pool_lock = threading.Lock()
+    _render_lock = threading.Lock()
+
+
+def _check_fork():
+    # without fork hooks, children notice the fork by their pid
+    if os.getpid() != _pid:
+        _reset_pool()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_pool)
+
+
+class RenderPool(object):
+    """Small pool of pre-warmed worker processes that render plots.
+
+    Rendering in separate processes keeps pyplot state and matplotlib
+    memory out of the long lived server process, and lets plots render
+    concurrently. Workers import matplotlib and seaborn on start (the
+    server process itself doesn't), and are replaced after max_tasks
+    renders where supported (Python >= 3.11).
+
+    Workers are spawned with the pywps configuration of the service
+    where supported (Python >= 3.7), and forked otherwise.
+    """
+
+    def __init__(self, max_workers=RENDER_WORKERS, max_tasks=WORKER_TASKS):
+        self.max_workers = max_workers
+        self.max_tasks = max_tasks
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                if sys.version_info < (3, 7):
+                    # no worker initializer, workers are forked and warmed
+                    # by their first task
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                    warm = _warm_worker
+                else:
+                    kwargs = {}
+                    if sys.version_info >= (3, 11):
+                        kwargs['max_tasks_per_child'] = self.max_tasks
+                    # spawned workers don't inherit server state (threads,
+                    # locks, open connections), and are required for
+                    # max_tasks_per_child
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers, initializer=_init_worker,
+                        initargs=(get_worker_config(),),
+                        mp_context=multiprocessing.get_context('spawn'), **kwargs)
+                    warm = _noop
+                # start all workers now, so that they are warm for the first plot
+                for _ in range(self.max_workers):
+                    self._executor.submit(warm)
+            return self._executor
+
+    def warm(self):
+        self._get_executor()
+
+    def render(self, func, *args):
+        """Run func(*args) on a worker and return its result.
+
+        func has to be a module level function, so that workers can
+        import it.
+        """
+        executor = self._get_executor()
+        try:
+            return executor.submit(func, *args).result()
+        except BrokenProcessPool:
+            # a worker died (e.g. out of memory), start over with a new pool
+            logging.getLogger(__name__).warn('Render pool broken, restarting workers')
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            raise
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+def render(func, *args):
+    """Run func(*args), e.g. render_plot, on the render pool if enabled."""
+    pool = get_render_pool()
+    if pool is not None:
+        return pool.render(func, *args)
+    # after get_render_pool, so that a forked child uses its own lock
+    with _render_lock:
+        return func(*args)
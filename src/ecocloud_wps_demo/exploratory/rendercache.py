@@ -0,0 +1,137 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import os.path
+import shutil
+import tempfile
+import time
+
+from pywps import configuration as config
+
+
+# default size limit of the render cache in MB
+CACHE_SIZE_MB = 256
+
+# default number of seconds a rendered plot is served from the cache
+CACHE_TTL = 24 * 3600
+
+
+def get_render_cache():
+    """Return the RenderCache configured in pywps.cfg, or None if disabled.
+
+    The cache lives in [exploratory] render_cache_dir (default: a folder
+    within the pywps workdir), is limited to render_cache_size_mb and
+    entries expire after render_cache_ttl seconds. A size of 0 disables
+    the cache.
+    """
+    size_mb = config.get_config_value('exploratory', 'render_cache_size_mb')
+    size_mb = CACHE_SIZE_MB if size_mb in ('', None) else int(size_mb)
+    if size_mb <= 0:
+        return None
+    path = config.get_config_value('exploratory', 'render_cache_dir')
+    if not path:
+        path = os.path.join(config.get_config_value('server', 'workdir'), 'exploratory_render')
+    ttl = float(config.get_config_value('exploratory', 'render_cache_ttl') or CACHE_TTL)
+    return RenderCache(path, size_mb * 1024 * 1024, ttl)
+
+
+def render_key(identifier, version, digest, *params):
+    """Return the cache key of a plot of data digest rendered by a process."""
+    key = json.dumps([identifier, version, digest] + list(params), sort_keys=True, default=str)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+class RenderCache(object):
+    """Disk backed cache of rendered plots.
+
+    Files are stored by key; their mtime is the time they were rendered and
+    is used to expire entries after ttl seconds, while the atime is set on
+    every hit and used to evict least recently used entries once the cache
+    grows beyond max_bytes.
+    """
+
+    def __init__(self, path, max_bytes, ttl=CACHE_TTL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+    def _filename(self, key, extension):
+        return os.path.join(self.path, '{}.{}'.format(key, extension))
+
+    def get(self, key, extension, dest):
+        """Copy the cached result for key to dest, returns False if there is none."""
+        filename = self._filename(key, extension)
+        try:
+            stat = os.stat(filename)
+            if time.time() - stat.st_mtime > self.ttl:
+                return False
+            shutil.copyfile(filename, dest)
+            # mark as recently used, keep render time
+            os.utime(filename, (time.time(), stat.st_mtime))
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logging.getLogger(__name__).warn('Failed to load cached plot {}: {}'.format(filename, e))
+            return False
+        return True
+
+    def put(self, key, extension, source):
+        """Store a copy of file source as result for key."""
+        log = logging.getLogger(__name__)
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            fd, tmpname = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as fp, open(source, 'rb') as src:
+                    shutil.copyfileobj(src, fp)
+                os.replace(tmpname, self._filename(key, extension))
+            except Exception:
+                os.unlink(tmpname)
+                raise
+            self.evict()
+        except Exception as e:
+            # caching is best effort
+            log.warn('Failed to cache plot {}: {}'.format(key, e))
+
+    def evict(self):
+        """Remove expired entries, and least recently used ones until the
+        cache is within max_bytes.
+
+        Removes entries down to 90% of max_bytes, so that eviction doesn't
+        run on every single store.
+        """
+        log = logging.getLogger(__name__)
+        with open(os.path.join(self.path, '.lock'), 'w') as lockfp:
+            fcntl.flock(lockfp, fcntl.LOCK_EX)
+            now = time.time()
+            files = []
+            total = 0
+            evicted = 0
+            for name in os.listdir(self.path):
+                if name.startswith('.') or name.endswith('.tmp'):
+                    continue
+                filename = os.path.join(self.path, name)
+                try:
+                    stat = os.stat(filename)
+                    if now - stat.st_mtime > self.ttl:
+                        os.unlink(filename)
+                        evicted += 1
+                        continue
+                except OSError:
+                    continue
+                files.append((max(stat.st_atime, stat.st_mtime), stat.st_size, filename))
+                total += stat.st_size
+            if total > self.max_bytes:
+                for atime, size, filename in sorted(files):
+                    if total <= self.max_bytes * 0.9:
+                        break
+                    try:
+                        os.unlink(filename)
+                    except OSError:
+                        continue
+                    total -= size
+                    evicted += 1
+            if evicted:
+                log.debug('Evicted {} plots from render cache {}'.format(evicted, self.path))
@@ -0,0 +1,421 @@
+import numpy as np
+from scipy.stats import gaussian_kde, rankdata
+
+
+# number of points the density curve is evaluated at, same as pandas
+KDE_POINTS = 1000
+
+# minimum size of the grid data is binned onto for the FFT density
+KDE_GRID_SIZE = 2 ** 14
+
+# maximum size of the FFT density grid
+KDE_MAX_GRID_SIZE = 2 ** 22
+
+# number of values kept by a Sample
+SAMPLE_SIZE = 100000
+
+# default normalised rank error of QuantileSketch
+QUANTILE_ERROR = 0.001
+
+# number of smallest and largest values kept to find whiskers and outliers
+TAIL_SIZE = 1000
+
+
+def jsonable(value):
+    """Return value with numpy types converted for json, and NaN as None."""
+    if isinstance(value, dict):
+        return {str(key): jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [jsonable(item) for item in value]
+    if isinstance(value, (np.integer, np.bool_)):
+        return value.item()
+    if isinstance(value, (float, np.floating)):
+        return float(value) if np.isfinite(value) else None
+    return value
+
+
+def _pearson(x, y):
+    if len(x) < 2:
+        return np.nan
+    x = x - x.mean()
+    y = y - y.mean()
+    denominator = np.sqrt(np.dot(x, x) * np.dot(y, y))
+    if denominator == 0:
+        return np.nan
+    return float(np.dot(x, y) / denominator)
+
+
+def correlation(columns, method='pearson'):
+    """Return the matrix of correlation coefficients between columns.
+
+    columns is a list of float arrays of equal length; NaNs are ignored
+    pairwise, like DataFrame.corr. method is 'pearson' or 'spearman'
+    (Pearson coefficient of the average ranks).
+    """
+    if method not in ('pearson', 'spearman'):
+        raise ValueError('Unknown correlation method {}'.format(method))
+    columns = [np.asarray(values, dtype=float) for values in columns]
+    valid = [np.isfinite(values) for values in columns]
+    # ranks over all valid values of a column, reused for every pair that
+    # doesn't drop any of them
+    ranks = {}
+
+    def values(i, mask):
+        if method == 'pearson':
+            return columns[i][mask]
+        if np.array_equal(mask, valid[i]):
+            if i not in ranks:
+                ranks[i] = rankdata(columns[i][mask])
+            return ranks[i]
+        return rankdata(columns[i][mask])
+
+    count = len(columns)
+    matrix = np.eye(count)
+    for i in range(count):
+        for j in range(i + 1, count):
+            mask = valid[i] & valid[j]
+            matrix[i, j] = matrix[j, i] = _pearson(values(i, mask), values(j, mask))
+    return matrix
+
+
+def histogram(values, bins):
+    """Return counts and bin edges of the finite values."""
+    values = np.asarray(values, dtype=float)
+    values = values[np.isfinite(values)]
+    if not len(values):
+        return np.zeros(bins, dtype=np.int64), np.linspace(0, 1, bins + 1)
+    counts, edges = np.histogram(values, bins=bins)
+    return counts, edges
+
+
+def histogram2d(x, y, bins):
+    """Return counts, x edges and y edges of pairs where x and y are finite."""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    mask = np.isfinite(x) & np.isfinite(y)
+    if not mask.any():
+        edges = np.linspace(0, 1, bins + 1)
+        return np.zeros((bins, bins), dtype=np.int64), edges, edges
+    counts, xedges, yedges = np.histogram2d(x[mask], y[mask], bins=bins)
+    return counts.astype(np.int64), xedges, yedges
+
+
+def kde_bandwidth(values, bw_method='scott'):
+    """Return the kernel standard deviation for values, like gaussian_kde.
+
+    bw_method is 'scott', 'silverman' or a number, which is used as the
+    factor the standard deviation of values is multiplied with.
+    """
+    count = len(values)
+    if bw_method in (None, 'scott'):
+        factor = count ** (-1. / 5)
+    elif bw_method == 'silverman':
+        factor = (count * 3. / 4) ** (-1. / 5)
+    else:
+        factor = float(bw_method)
+    return factor * np.std(values, ddof=1)
+
+
+def kde(values, bw_method='scott', exact=False, points=KDE_POINTS):
+    """Return x and y of the Gaussian kernel density curve of the finite values.
+
+    The curve spans the range of values plus half of it on either side, like
+    Series.plot(kind='density'). With exact the density is evaluated
+    directly by scipy's gaussian_kde, which costs O(len(values) * points);
+    otherwise values are linearly binned onto a fine grid and convolved
+    with the kernel by FFT, which costs O(len(values)) and gives the same
+    curve up to binning error.
+    """
+    values = np.asarray(values, dtype=float)
+    values = values[np.isfinite(values)]
+    if len(values) < 2:
+        raise ValueError('Density estimation needs at least 2 values')
+    vmin, vmax = values.min(), values.max()
+    x = np.linspace(vmin - 0.5 * (vmax - vmin), vmax + 0.5 * (vmax - vmin), points)
+    if exact:
+        return x, gaussian_kde(values, bw_method=bw_method)(x)
+
+    bandwidth = kde_bandwidth(values, bw_method)
+    if not bandwidth > 0:
+        raise ValueError('Density estimation needs values that are not all equal')
+    # grid covering the curve plus the kernel's tails, with several grid
+    # points per bandwidth
+    lo = x[0] - 4 * bandwidth
+    hi = x[-1] + 4 * bandwidth
+    size = KDE_GRID_SIZE
+    while size < KDE_MAX_GRID_SIZE and (hi - lo) / (size - 1) > bandwidth / 8:
+        size *= 2
+    step = (hi - lo) / (size - 1)
+
+    # linear binning: every value is split between its two nearest grid points
+    position = (values - lo) / step
+    index = np.floor(position).astype(np.int64)
+    weight = position - index
+    grid = (np.bincount(index, 1 - weight, size + 1) + np.bincount(index + 1, weight, size + 1))[:size]
+
+    # kernel over the whole grid width, zero padded so the convolution
+    # doesn't wrap around
+    offsets = np.arange(-(size - 1), size) * step
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2) / (bandwidth * np.sqrt(2 * np.pi))
+    length = 4 * size
+    density = np.fft.irfft(np.fft.rfft(grid, length) * np.fft.rfft(kernel, length), length)
+    density = density[size - 1:2 * size - 1] / len(values)
+    return x, np.interp(x, lo + np.arange(size) * step, density)
+
+
+class Sample(object):
+    """Uniform random sample of at most size finite values from a stream.
+
+    Every value gets a random key, and the values with the smallest keys
+    are kept, which is a uniform sample without replacement of all values
+    added. The random generator is seeded, so the same data gives the
+    same sample.
+    """
+
+    def __init__(self, size=SAMPLE_SIZE, seed=0):
+        self.size = size
+        self.count = 0
+        self.values = np.empty(0)
+        self._keys = np.empty(0)
+        self._random = np.random.RandomState(seed)
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[np.isfinite(values)]
+        self.count += len(values)
+        keys = np.concatenate([self._keys, self._random.random_sample(len(values))])
+        values = np.concatenate([self.values, values])
+        if len(values) > self.size:
+            keep = np.argpartition(keys, self.size)[:self.size]
+            keys, values = keys[keep], values[keep]
+        self._keys, self.values = keys, values
+
+
+def auto_bin_edges(count, vmin, vmax, iqr):
+    """Return bin edges like np.histogram_bin_edges(values, 'auto').
+
+    count, vmin, vmax and iqr are the number, minimum, maximum and
+    interquartile range of the (finite) values.
+    """
+    width = 0
+    if count > 0 and vmax > vmin:
+        # the smaller of the Freedman Diaconis and Sturges bin widths
+        width = (vmax - vmin) / (np.log2(count) + 1.0)
+        fd_width = 2.0 * iqr * count ** (-1.0 / 3.0)
+        if fd_width:
+            width = min(width, fd_width)
+    if vmin == vmax:
+        # a single bin around a constant column
+        vmin, vmax = vmin - 0.5, vmax + 0.5
+    bins = int(np.ceil((vmax - vmin) / width)) if width else 1
+    return np.linspace(vmin, vmax, bins + 1)
+
+
+def chunked_histograms(read_chunks, columns):
+    """Return counts and bin edges of each of columns, in two passes over chunks.
+
+    read_chunks() returns an iterator over DataFrames holding columns. The
+    first pass finds count and range of each column, and a sample to
+    estimate its interquartile range for 'auto' bins (see auto_bin_edges);
+    the second counts values per bin. Memory use doesn't depend on the
+    number of rows.
+    """
+    samples = {column: Sample() for column in columns}
+    vmin = dict.fromkeys(columns, np.inf)
+    vmax = dict.fromkeys(columns, -np.inf)
+    for chunk in read_chunks():
+        for column in columns:
+            values = chunk[column].values
+            values = values[np.isfinite(values)]
+            if len(values):
+                samples[column].add(values)
+                vmin[column] = min(vmin[column], values.min())
+                vmax[column] = max(vmax[column], values.max())
+
+    edges = {}
+    for column in columns:
+        sample = samples[column]
+        if not sample.count:
+            # same as np.histogram of no values
+            edges[column] = np.linspace(0, 1, 2)
+            continue
+        q1, q3 = np.percentile(sample.values, [25, 75])
+        edges[column] = auto_bin_edges(sample.count, vmin[column], vmax[column], q3 - q1)
+
+    counts = {column: np.zeros(len(edges[column]) - 1, dtype=np.int64) for column in columns}
+    for chunk in read_chunks():
+        for column in columns:
+            values = chunk[column].values
+            # equal width bins, so numpy computes bin indices instead of
+            # searching the edges
+            counts[column] += np.histogram(
+                values[np.isfinite(values)], bins=len(edges[column]) - 1,
+                range=(edges[column][0], edges[column][-1]))[0]
+    return {column: (counts[column], edges[column]) for column in columns}
+
+
+class QuantileSketch(object):
+    """KLL sketch of approximate quantiles of a stream of values.
+
+    Values are kept in a stack of compactors, where values at level h
+    stand for 2**h values each. When a level grows beyond its capacity, it
+    is sorted and every other value (starting at a random offset) moves up
+    a level. Capacities shrink by 2/3 per level below the top, so memory is
+    O(1 / error) regardless of the number of values, and a quantile is off
+    by about error * count in rank. Until the first compaction all values
+    are kept and quantiles are exact.
+    """
+
+    def __init__(self, error=QUANTILE_ERROR, seed=0):
+        # rank error of KLL is about 1.65 / k (99% confidence)
+        self.k = max(8, int(np.ceil(1.65 / error)))
+        self.count = 0
+        self.levels = [np.empty(0)]
+        self._random = np.random.RandomState(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(np.ceil(self.k * (2.0 / 3.0) ** depth)))
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[np.isfinite(values)]
+        self.count += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # an odd item out stays at this level
+                keep = items[:len(items) % 2]
+                items = items[len(items) % 2:]
+                promoted = items[self._random.randint(2)::2]
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    @property
+    def exact(self):
+        return len(self.levels) == 1
+
+    def quantiles(self, qs):
+        """Return the values at quantiles qs (0 to 1), interpolated like
+        np.percentile while the sketch holds all values."""
+        if not self.count:
+            return np.full(len(qs), np.nan)
+        if self.exact:
+            return np.percentile(self.levels[0], np.asarray(qs) * 100)
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2 ** level)
+                                  for level, items in enumerate(self.levels)])
+        order = np.argsort(values)
+        values = values[order]
+        ranks = np.cumsum(weights[order])
+        index = np.searchsorted(ranks, np.asarray(qs) * ranks[-1])
+        return values[np.minimum(index, len(values) - 1)]
+
+    def values(self):
+        """Return a sorted sample of the values, with their weights."""
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2 ** level)
+                                  for level, items in enumerate(self.levels)])
+        order = np.argsort(values)
+        return values[order], weights[order]
+
+
+class Tails(object):
+    """The size smallest and size largest values of a stream of values."""
+
+    def __init__(self, size=TAIL_SIZE):
+        self.size = size
+        self.low = np.empty(0)
+        self.high = np.empty(0)
+
+    def add(self, values):
+        low = np.concatenate([self.low, values])
+        high = np.concatenate([self.high, values])
+        if len(low) > self.size:
+            low = np.partition(low, self.size - 1)[:self.size]
+            high = np.partition(high, len(high) - self.size)[-self.size:]
+        self.low = np.sort(low)
+        self.high = np.sort(high)
+
+
+def chunked_box_stats(read_chunks, columns, error=QUANTILE_ERROR, whis=1.5):
+    """Return box plot statistics of each of columns, for Axes.bxp.
+
+    Statistics are those of matplotlib.cbook.boxplot_stats, computed in a
+    single pass over the DataFrames returned by read_chunks(). Quartiles
+    come from a QuantileSketch with the given rank error (exact for small
+    columns). The mean is exact, whiskers are exact as long as no more
+    than TAIL_SIZE values lie beyond them (and come from the sketch
+    otherwise). Fliers are the (at most TAIL_SIZE) most extreme outliers on
+    either side, plus the outliers within a random sample of the values.
+    """
+    sketches = {column: QuantileSketch(error) for column in columns}
+    tails = {column: Tails() for column in columns}
+    samples = {column: Sample(10 * TAIL_SIZE) for column in columns}
+    sums = dict.fromkeys(columns, 0.0)
+    for chunk in read_chunks():
+        for column in columns:
+            values = chunk[column].values
+            values = values[np.isfinite(values)]
+            if len(values):
+                sketches[column].add(values)
+                tails[column].add(values)
+                samples[column].add(values)
+                sums[column] += values.sum()
+
+    result = {}
+    for column in columns:
+        sketch, low, high = sketches[column], tails[column].low, tails[column].high
+        if not sketch.count:
+            result[column] = {
+                'mean': np.nan, 'med': np.nan, 'q1': np.nan, 'q3': np.nan,
+                'iqr': np.nan, 'cilo': np.nan, 'cihi': np.nan,
+                'whislo': np.nan, 'whishi': np.nan, 'fliers': np.empty(0),
+            }
+            continue
+        q1, med, q3 = sketch.quantiles([0.25, 0.5, 0.75])
+        iqr = q3 - q1
+        loval = q1 - whis * iqr
+        hival = q3 + whis * iqr
+
+        # high whisker is the largest value within hival, which is among
+        # the largest values unless they all lie beyond it
+        within = high[high <= hival]
+        if len(within):
+            whishi = within[-1]
+        else:
+            sketched, _ = sketch.values()
+            within = sketched[sketched <= hival]
+            whishi = within[-1] if len(within) else q3
+        whishi = max(whishi, q3)
+        within = low[low >= loval]
+        if len(within):
+            whislo = within[0]
+        else:
+            sketched, _ = sketch.values()
+            within = sketched[sketched >= loval]
+            whislo = within[0] if len(within) else q1
+        whislo = min(whislo, q1)
+
+        # the most extreme outliers, and a sample of the others
+        sample = samples[column].values
+        outliers = sample[(sample < whislo) | (sample > whishi)]
+
+        notch = 1.57 * iqr / np.sqrt(sketch.count)
+        result[column] = {
+            'mean': sums[column] / sketch.count,
+            'med': med, 'q1': q1, 'q3': q3, 'iqr': iqr,
+            'cilo': med - notch, 'cihi': med + notch,
+            'whislo': whislo, 'whishi': whishi,
+            'fliers': np.unique(np.concatenate([low[low < whislo], high[high > whishi], outliers])),
+        }
+    return result
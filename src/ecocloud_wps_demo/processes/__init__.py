@@ -0,0 +1,33 @@
+"""Registry of the processes offered by the service.
+
+Process modules only describe processes (identifier, inputs, outputs),
+the libraries their handlers need (pandas, matplotlib, netCDF4, pydap,
+rasterio, ocgis, ...) are imported on first Execute. So GetCapabilities
+and DescribeProcess are served without loading them, and server workers
+start quickly and stay small until they run a process.
+"""
+import importlib
+
+
+# process classes offered by the service, in order of GetCapabilities
+PROCESSES = [
+    'ecocloud_wps_demo.processes.anuclim_daily_extract.ANUClimDailyExtract',
+    'ecocloud_wps_demo.processes.anuclim_daily_extract_netcdf4.ANUClimDailyExtractNetCDF4',
+    'ecocloud_wps_demo.processes.anuclim_daily_timeseries.ANUClimDailyTimeseries',
+    'ecocloud_wps_demo.processes.spatial_subset_geotiff.SpatialSubsetGeotiff',
+    'ecocloud_wps_demo.processes.spatial_subset_netcdf.SpatialSubsetNetcdf',
+    'ecocloud_wps_demo.processes.exploratory_data_box.ExploratoryDataBox',
+    'ecocloud_wps_demo.processes.exploratory_data_histogram.ExploratoryDataHistogram',
+    'ecocloud_wps_demo.processes.exploratory_data_density.ExploratoryDataDensity',
+    'ecocloud_wps_demo.processes.exploratory_data_correlation.ExploratoryDataCorrelation',
+    'ecocloud_wps_demo.processes.exploratory_data_summary.ExploratoryDataSummary',
+]
+
+
+def get_processes(names=PROCESSES):
+    """Return instances of the process classes named by dotted path."""
+    processes = []
+    for name in names:
+        module, cls = name.rsplit('.', 1)
+        processes.append(getattr(importlib.import_module(module), cls)())
+    return processes
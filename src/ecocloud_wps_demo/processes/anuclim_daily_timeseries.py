@@ -0,0 +1,246 @@
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import logging
+import os
+
+import numpy as np
+
+from pywps import Process
+from pywps import ComplexInput, ComplexOutput, LiteralInput, Format
+from pywps.validator.mode import MODE
+
+from ecocloud_wps_demo.anuclim import backends
+from ecocloud_wps_demo.anuclim.backends import VARIABLES
+from ecocloud_wps_demo.anuclim.batch import BUFFER_SIZE, get_max_workers
+from ecocloud_wps_demo.anuclim.dates import EPOCH, time_axis_days
+from ecocloud_wps_demo.anuclim.extract import ExtractMixin
+from ecocloud_wps_demo.anuclim.grid import GridIndex
+
+
+# Reuses the dataset access of the extract processes, but reads whole time
+# series at a few sites instead of single values at many points.
+class ANUClimDailyTimeseries(ExtractMixin, Process):
+
+    backend = 'opendap'
+
+    def __init__(self):
+        inputs = [
+            LiteralInput(
+                'variables', 'Variables to extract',
+                data_type='string', min_occurs=1, max_occurs=len(VARIABLES),
+                mode=MODE.SIMPLE, allowed_values=list(VARIABLES.keys()),
+            ),
+            ComplexInput(
+                'csv', 'CSV sites with lat/lon columns',
+                supported_formats=[Format('text/csv')],
+                min_occurs=1, max_occurs=1,
+                # There is no CSV validator, so we have to use None
+                mode=MODE.NONE
+            ),
+            LiteralInput(
+                'start_date', 'First date of time series (default: start of data)',
+                data_type='date', min_occurs=0, max_occurs=1,
+                mode=MODE.SIMPLE,
+            ),
+            LiteralInput(
+                'end_date', 'Last date of time series (default: end of data)',
+                data_type='date', min_occurs=0, max_occurs=1,
+                mode=MODE.SIMPLE,
+            ),
+        ]
+
+        outputs = [
+            ComplexOutput('output', 'Site time series',
+                          as_reference=True,
+                          supported_formats=[Format('text/csv'),
+                                             Format('application/x-netcdf')]),
+        ]
+
+        super().__init__(
+            self._handler,
+            identifier='anuclim_daily_timeseries',
+            title='ANUClim daily climate time series extract.',
+            abstract="Extracts daily time series of env variables at given sites from ANUClimate daily climate grids.",
+            version='1',
+            metadata=[],
+            inputs=inputs,
+            outputs=outputs,
+            store_supported=True,
+            status_supported=True)
+
+    def _read_series(self, dataset, index, lat, lon, days):
+        """Read the time series of one variable at lat/lon for days.
+
+        The series is read as a single contiguous time slice. Returns a
+        masked array with one value per day, masked where there is no data.
+        """
+        tdays, yindex, xindex = index
+        series = np.ma.masked_all(len(days), dtype=np.float64)
+        y = int(yindex([lat])[0])
+        x = int(xindex([lon])[0])
+        if y < 0 or x < 0:
+            return series
+        t0 = int(np.searchsorted(tdays, days[0], 'left'))
+        t1 = int(np.searchsorted(tdays, days[-1], 'right'))
+        if t0 >= t1:
+            return series
+        values = self._read_slab(dataset['data'], (t0, y, x), (t1, y + 1, x + 1))
+        # place values by date, in case the time axis has gaps
+        series[(tdays[t0:t1] - days[0]).astype(np.intp)] = values[:, 0, 0]
+        return series
+
+    def _handler(self, request, response):
+        log = logging.getLogger(__name__)
+        variables = [v.data for v in request.inputs['variables']]  # Note that all input parameters require index access
+        sites_csv = request.inputs['csv'][0]
+        start_date = request.inputs['start_date'][0].data if 'start_date' in request.inputs else None
+        end_date = request.inputs['end_date'][0].data if 'end_date' in request.inputs else None
+        output = response.outputs['output']
+        as_netcdf = output.data_format.mime_type == 'application/x-netcdf'
+
+        # there are only few sites, so read them all
+        with open(sites_csv.file, 'r') as csv_fp:
+            csv_reader = csv.reader(csv_fp)
+            csv_header = next(csv_reader)
+            sites = list(csv_reader)
+        if any(col not in csv_header for col in ('lat', 'lon')):
+            raise Exception('Bad site data: Missing lat/lon column')
+        lat_col, lon_col = csv_header.index('lat'), csv_header.index('lon')
+        coords = []
+        for site in sites:
+            try:
+                coords.append((float(site[lat_col]), float(site[lon_col])))
+            except Exception as e:
+                log.warn('Filling Site with empty values: {}'.format(e))
+                coords.append((np.nan, np.nan))
+
+        with ThreadPoolExecutor(max_workers=min(get_max_workers(), len(variables))) as executor:
+            with self._borrow_datasets(executor, variables) as datasets:
+                indexes = {}
+                for var in variables:
+                    tdays = time_axis_days(datasets[var]['times'], datasets[var].get('time_units'))
+                    indexes[var] = (tdays, GridIndex(datasets[var]['lats']), GridIndex(datasets[var]['lons']))
+                # output covers requested dates within the union of all time axes
+                first = min(index[0][0] for index in indexes.values())
+                last = max(index[0][-1] for index in indexes.values())
+                if start_date is not None:
+                    first = max(first, (np.datetime64(start_date, 'D') - EPOCH).astype(np.int64))
+                if end_date is not None:
+                    last = min(last, (np.datetime64(end_date, 'D') - EPOCH).astype(np.int64))
+                if first > last:
+                    raise Exception('Requested dates outside data area')
+                days = np.arange(first, last + 1)
+
+                def read_site(var, lat, lon):
+                    try:
+                        return self._read_series(datasets[var], indexes[var], lat, lon, days)
+                    except Exception as e:
+                        log.warn('Filling {} at {}/{} with empty values: {}'.format(var, lat, lon, e))
+                        return np.ma.masked_all(len(days), dtype=np.float64)
+
+                if as_netcdf:
+                    out_file = os.path.join(self.workdir, 'out.nc')
+                    writer = _NetCDFWriter(out_file, variables, csv_header, sites, coords, days)
+                else:
+                    out_file = os.path.join(self.workdir, 'out.csv')
+                    writer = _CSVWriter(out_file, csv_header, variables, sites, days)
+                try:
+                    next_update = 0
+                    for site_idx, (lat, lon) in enumerate(coords):
+                        # one contiguous read per variable, all variables concurrently
+                        series = list(executor.map(lambda var: read_site(var, lat, lon), variables))
+                        writer.write(site_idx, series)
+                        # don't re-generate status doc after every single site
+                        percent = int((site_idx + 1) / len(coords) * 100)
+                        if percent >= next_update:
+                            next_update = percent + 5
+                            response.update_status(
+                                'Processed sites {} of {} so far...'.format(site_idx + 1, len(coords)),
+                                percent
+                            )
+                finally:
+                    writer.close()
+        # set output file
+        # NOTE: assigning to output.file needs to be done after output file
+        #       is finished. Assignment here copies the file to the outputs
+        #       folder.
+        output.file = out_file
+        return response
+
+
+class _CSVWriter(object):
+    """Write site time series as long format csv, one row per site and date."""
+
+    def __init__(self, filename, header, variables, sites, days):
+        self.sites = sites
+        self.dates = [str(EPOCH + int(day)) for day in days]
+        self.fp = open(filename, 'w', buffering=BUFFER_SIZE)
+        self.csv_writer = csv.writer(self.fp)
+        self.csv_writer.writerow(header + ['date'] + variables)
+
+    def write(self, site_idx, series):
+        site = self.sites[site_idx]
+        columns = [s.astype(object).filled('').tolist() for s in series]
+        self.csv_writer.writerows(
+            site + [date] + list(values)
+            for date, values in zip(self.dates, zip(*columns))
+        )
+
+    def close(self):
+        self.fp.close()
+
+
+class _NetCDFWriter(object):
+    """Write site time series as CF point time series (featureType timeSeries).
+
+    Sites are identified by the site variable (cf_role timeseries_id),
+    which holds the site column of the csv if there is one, else the row
+    number of the site. Other columns of the csv (except lat/lon) are kept
+    as string variables along the site dimension.
+    """
+
+    def __init__(self, filename, variables, header, sites, coords, days):
+        from netCDF4 import Dataset
+        self.variables = variables
+        columns = {name: [row[col] if col < len(row) else '' for row in sites]
+                   for col, name in enumerate(header) if name not in ('lat', 'lon')}
+        site_ids = columns.pop('site', [str(idx) for idx in range(len(sites))])
+        with backends.netcdf_lock:
+            self.ds = Dataset(filename, 'w')
+            self.ds.Conventions = 'CF-1.6'
+            self.ds.featureType = 'timeSeries'
+            self.ds.createDimension('site', len(coords))
+            self.ds.createDimension('time', len(days))
+            time = self.ds.createVariable('time', 'i4', ('time',))
+            time.units = 'days since 1970-01-01'
+            time.calendar = 'standard'
+            time[:] = days
+            for name, values, units in (('lat', [c[0] for c in coords], 'degrees_north'),
+                                        ('lon', [c[1] for c in coords], 'degrees_east')):
+                coord = self.ds.createVariable(name, 'f8', ('site',))
+                coord.units = units
+                coord[:] = values
+            site = self.ds.createVariable('site', str, ('site',))
+            site.cf_role = 'timeseries_id'
+            site[:] = np.array(site_ids, dtype=object)
+            for name, values in columns.items():
+                if name == 'time' or name in variables:
+                    logging.getLogger(__name__).warn(
+                        'Dropping site column {}, which clashes with an output variable'.format(name))
+                    continue
+                column = self.ds.createVariable(name, str, ('site',))
+                column[:] = np.array(values, dtype=object)
+            for var in variables:
+                ncvar = self.ds.createVariable(
+                    var, 'f4', ('site', 'time'),
+                    fill_value=np.float32(-9999), chunksizes=(1, len(days)))
+                ncvar.coordinates = 'time lat lon'
+
+    def write(self, site_idx, series):
+        with backends.netcdf_lock:
+            for var, values in zip(self.variables, series):
+                self.ds[var][site_idx, :] = values
+
+    def close(self):
+        with backends.netcdf_lock:
+            self.ds.close()
@@ -1,16 +1,14 @@
-import logging
-import os
-
 from pywps import Process
 from pywps import ComplexInput, LiteralInput, ComplexOutput, Format
 from pywps.validator.mode import MODE
 
-import pandas as pd
-import matplotlib
-import matplotlib.pyplot as plt
-import seaborn as sns
+from ecocloud_wps_demo.exploratory.plot import PLOT_FORMATS, PlotMixin
+
+
+class ExploratoryDataCorrelation(PlotMixin, Process):
+    plot_module = 'ecocloud_wps_demo.exploratory.correlation'
+    cache_settings = ('correlation_max_scatter_rows', 'correlation_bins')
 
-class ExploratoryDataCorrelation(Process):
     def __init__(self):
         inputs = [
             ComplexInput(
@@ -35,7 +33,7 @@ class ExploratoryDataCorrelation(Process):
         outputs = [
             ComplexOutput('output', 'Output data',
                           as_reference=True,
-                          supported_formats=[Format('image/png')]),
+                          supported_formats=PLOT_FORMATS),
         ]
 
         super(ExploratoryDataCorrelation, self).__init__(
@@ -49,35 +47,3 @@ class ExploratoryDataCorrelation(Process):
             outputs=outputs,
             store_supported=True,
             status_supported=True)
-
-    def _handler(self, request, response):
-        # Extract inputs
-        csv_filepath = request.inputs['csv'][0].file
-        variables = [v.data for v in request.inputs['variable']]
-        variables_count = len(variables)
-
-        try:
-            title = request.inputs['title'][0].data
-        except:
-            title = None
-
-        # Read only the columns we need from the CSV
-        csv_df = pd.read_csv(csv_filepath, usecols=variables).apply(
-            pd.to_numeric, errors='coerce')
-
-        # Generating a pair plot through `seaborn`
-        pairplot = sns.pairplot(csv_df)
-        figure = pairplot.fig
-
-        # Set title where provided
-        if title is not None:
-            figure.suptitle(title)
-
-        # Write the overall figure with subplots into output file
-        output_path = os.path.join(self.workdir, "output.png")
-        figure.savefig(output_path)
-
-        # Finish up by providing the path to the file
-        response.outputs['output'].file = output_path
-
-        return response
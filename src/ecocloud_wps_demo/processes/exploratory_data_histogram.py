@@ -1,17 +1,14 @@
-import logging
-import os
-from math import ceil
-
 from pywps import Process
 from pywps import ComplexInput, LiteralInput, ComplexOutput, Format
 from pywps.validator.mode import MODE
 
-import pandas as pd
-import matplotlib
-import matplotlib.pyplot as plt
+from ecocloud_wps_demo.exploratory.plot import PLOT_FORMATS, PlotMixin
+
 
+class ExploratoryDataHistogram(PlotMixin, Process):
+    plot_module = 'ecocloud_wps_demo.exploratory.histogram'
+    chunked = True
 
-class ExploratoryDataHistogram(Process):
     def __init__(self):
         inputs = [
             ComplexInput(
@@ -36,7 +33,7 @@ class ExploratoryDataHistogram(Process):
         outputs = [
             ComplexOutput('output', 'Output data',
                           as_reference=True,
-                          supported_formats=[Format('image/png')]),
+                          supported_formats=PLOT_FORMATS),
         ]
 
         super(ExploratoryDataHistogram, self).__init__(
@@ -50,47 +47,3 @@ class ExploratoryDataHistogram(Process):
             outputs=outputs,
             store_supported=True,
             status_supported=True)
-
-    def _handler(self, request, response):
-        # Extract inputs
-        csv_filepath = request.inputs['csv'][0].file
-        variables = [v.data for v in request.inputs['variable']]
-        variables_count = len(variables)
-
-        try:
-            title = request.inputs['title'][0].data
-        except:
-            title = None
-
-        # Plot into subplots, one per variable
-        figure = plt.figure()
-
-        # Set title where provided
-        if title is not None:
-            figure.suptitle(title)
-
-        # Read only the columns we need from the CSV
-        csv_df = pd.read_csv(csv_filepath, usecols=variables).apply(
-            pd.to_numeric, errors='coerce')
-
-        # Subplot grid is maximum 2 columns wide, with plots in a Z arrangement
-        subplot_cols = 2 if variables_count > 1 else 1
-        subplot_rows = ceil(variables_count / 2)
-
-        for idx, var in enumerate(variables):
-            # Drop NA/NaNs which poison the plot or cause it to throw
-            column_data = csv_df[var].dropna()
-
-            # Draw subplot
-            axes = figure.add_subplot(subplot_rows, subplot_cols, idx + 1)
-            axes.set_title(var)
-            axes.hist(column_data, bins='auto')
-
-        # Write the overall figure with subplots into output file
-        output_path = os.path.join(self.workdir, "output.png")
-        figure.savefig(output_path)
-
-        # Finish up by providing the path to the file
-        response.outputs['output'].file = output_path
-
-        return response
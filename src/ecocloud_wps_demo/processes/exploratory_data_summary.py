@@ -0,0 +1,144 @@
+import json
+import logging
+import os
+
+from pywps import Process
+from pywps import ComplexInput, LiteralInput, ComplexOutput, Format
+from pywps.validator.mode import MODE
+
+from ecocloud_wps_demo.exploratory.rendercache import get_render_cache, render_key
+from ecocloud_wps_demo.processes.exploratory_data_box import ExploratoryDataBox
+from ecocloud_wps_demo.processes.exploratory_data_correlation import ExploratoryDataCorrelation
+from ecocloud_wps_demo.processes.exploratory_data_density import ExploratoryDataDensity
+from ecocloud_wps_demo.processes.exploratory_data_histogram import ExploratoryDataHistogram
+
+
+# plot processes by output identifier
+PLOTS = [
+    ('box', ExploratoryDataBox),
+    ('histogram', ExploratoryDataHistogram),
+    ('density', ExploratoryDataDensity),
+    ('correlation', ExploratoryDataCorrelation),
+]
+
+
+def render_summary(csv_filepath, variables, title, digest, workdir):
+    """Read the csv file once and write every plot and the stats document
+    into workdir, returns the file names by output identifier."""
+    from ecocloud_wps_demo.exploratory.csvcache import frame_reader, read_csv
+    from ecocloud_wps_demo.exploratory.render import save_figure
+    from ecocloud_wps_demo.exploratory.stats import jsonable
+
+    # Read only the columns we need from the CSV, or load them from
+    # the cache if this data has been plotted before
+    csv_df = read_csv(csv_filepath, variables, digest=digest)
+    outputs = {}
+    document = {'rows': len(csv_df), 'variables': variables}
+    for name, process_class in PLOTS:
+        process = process_class()
+        summary = process._summarise(frame_reader(csv_df, process.chunked), variables)
+        document[name] = process._describe(summary, variables)
+        outputs[name] = save_figure(process._draw(summary, variables, title),
+                                    os.path.join(workdir, '{}.png'.format(name)))
+    outputs['stats'] = os.path.join(workdir, 'stats.json')
+    with open(outputs['stats'], 'w') as fp:
+        json.dump(jsonable(document), fp)
+    return outputs
+
+
+class ExploratoryDataSummary(Process):
+    def __init__(self):
+        inputs = [
+            ComplexInput(
+                'csv', 'Data in CSV format, with variables in the first row',
+                supported_formats=[Format('text/csv')],
+                min_occurs=1, max_occurs=1,
+                # There is no CSV validator, so we have to use None
+                mode=MODE.NONE
+            ),
+            LiteralInput(
+                'variable', 'Variable to plot',
+                data_type='string', min_occurs=1, max_occurs=4,
+                mode=MODE.SIMPLE
+            ),
+            LiteralInput(
+                'title', 'Title of plots',
+                data_type='string', min_occurs=0, max_occurs=1,
+                mode=MODE.SIMPLE
+            ),
+        ]
+
+        outputs = [
+            ComplexOutput('box', 'Box plot',
+                          as_reference=True,
+                          supported_formats=[Format('image/png')]),
+            ComplexOutput('histogram', 'Histogram plot',
+                          as_reference=True,
+                          supported_formats=[Format('image/png')]),
+            ComplexOutput('density', 'Density plot',
+                          as_reference=True,
+                          supported_formats=[Format('image/png')]),
+            ComplexOutput('correlation', 'Correlation plot',
+                          as_reference=True,
+                          supported_formats=[Format('image/png')]),
+            ComplexOutput('stats', 'Summary statistics of all plots',
+                          as_reference=True,
+                          supported_formats=[Format('application/json')]),
+        ]
+
+        super(ExploratoryDataSummary, self).__init__(
+            self._handler,
+            identifier='exploratory_data_summary',
+            title='Exploratory data: Summary plots',
+            abstract='Generates box, histogram, density and correlation plots, and their statistics, from one or more variables in the provided CSV dataset, reading it only once',
+            version='1',
+            metadata=[],
+            inputs=inputs,
+            outputs=outputs,
+            store_supported=True,
+            status_supported=True)
+
+    def _handler(self, request, response):
+        from ecocloud_wps_demo.exploratory.csvcache import file_digest
+        from ecocloud_wps_demo.exploratory.render import render
+
+        log = logging.getLogger(__name__)
+        # Extract inputs
+        csv_filepath = request.inputs['csv'][0].file
+        variables = [v.data for v in request.inputs['variable']]
+
+        try:
+            title = request.inputs['title'][0].data
+        except:
+            title = None
+
+        # Plots are cached under the keys of the single plot processes, so
+        # they are shared with those
+        render_cache = get_render_cache()
+        digest = file_digest(csv_filepath)
+        keys = {}
+        settings = {}
+        for name, process_class in PLOTS:
+            process = process_class()
+            params = process._cache_params()
+            settings.update(params)
+            keys[name] = (render_key(process.identifier, process.version, digest, variables, title, params), 'png')
+        keys['stats'] = (render_key(self.identifier, self.version, digest, variables, title, settings), 'json')
+        outputs = {
+            name: os.path.join(self.workdir, '{}.{}'.format(name, ext))
+            for name, (key, ext) in keys.items()
+        }
+        if render_cache is not None and all(
+                render_cache.get(key, ext, outputs[name]) for name, (key, ext) in keys.items()):
+            log.info('Serving {} from render cache'.format(self.identifier))
+        else:
+            response.update_status('Plotting', 10)
+            outputs = render(render_summary, csv_filepath, variables, title, digest, self.workdir)
+            if render_cache is not None:
+                for name, (key, ext) in keys.items():
+                    render_cache.put(key, ext, outputs[name])
+
+        for name, filename in outputs.items():
+            response.outputs[name].file = filename
+
+        return response
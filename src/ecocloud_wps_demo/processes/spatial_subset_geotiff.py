@@ -7,10 +7,6 @@ from pywps import Process
 from pywps import ComplexInput, LiteralInput, ComplexOutput, Format
 from pywps.validator.mode import MODE
 
-import fiona
-import rasterio
-import rasterio.mask
-
 class SpatialSubsetGeotiff(Process):
     def __init__(self):
         inputs = [
@@ -45,6 +41,11 @@ class SpatialSubsetGeotiff(Process):
             status_supported=True)
 
     def _handler(self, request, response):
+        # imported on first use, so that the service starts without loading them
+        import fiona
+        import rasterio
+        import rasterio.mask
+
         # Get the GeoTIFF file
         # Note that all input parameters require index access
         file_input = request.inputs['file'][0]
@@ -7,8 +7,6 @@ from pywps import Process
 from pywps import ComplexInput, LiteralInput, ComplexOutput, Format
 from pywps.validator.mode import MODE
 
-import ocgis
-
 class SpatialSubsetNetcdf(Process):
     def __init__(self):
         inputs = [
@@ -44,6 +42,9 @@ class SpatialSubsetNetcdf(Process):
             status_supported=True)
 
     def _handler(self, request, response):
+        # imported on first use, so that the service starts without loading them
+        import ocgis
+
         # Get the NetCDF file
         # Note that all input parameters require index access
         dataset_input = request.inputs['dataset'][0]
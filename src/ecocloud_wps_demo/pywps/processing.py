@@ -1,6 +1,35 @@
+import logging
+
+from pywps import configuration as config
 from pywps.processing import Processing
 
 
+def get_worker_config():
+    """Return the pywps configuration and logging setup of this process.
+
+    Worker processes started via spawn or forkserver inherit neither, pass
+    this to init_worker there (e.g. as initializer of a process pool).
+    """
+    if not config.CONFIG:
+        config.load_configuration()
+    root = logging.getLogger()
+    formatters = [handler.formatter for handler in root.handlers if handler.formatter]
+    return {
+        'config': {section: dict(config.CONFIG.items(section, raw=True))
+                   for section in config.CONFIG.sections()},
+        'log_level': root.level,
+        'log_format': formatters[0]._fmt if formatters else None,
+    }
+
+
+def init_worker(worker_config):
+    """Load configuration and set up logging as returned by get_worker_config."""
+    config.load_configuration()
+    config.CONFIG.read_dict(worker_config['config'])
+    # log to stderr, like the console handler of the service
+    logging.basicConfig(level=worker_config['log_level'], format=worker_config['log_format'])
+
+
 class ThreadProcessing(Processing):
     """
     :class:`MultiProcessing` is the default implementation to run jobs using the
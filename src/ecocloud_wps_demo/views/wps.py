@@ -3,29 +3,12 @@ from pyramid.wsgi import wsgiapp2
 
 from pywps import Service
 
-from ecocloud_wps_demo.processes.anuclim_daily_extract import ANUClimDailyExtract
-from ecocloud_wps_demo.processes.anuclim_daily_extract_netcdf4 import ANUClimDailyExtractNetCDF4
-from ecocloud_wps_demo.processes.spatial_subset_geotiff import SpatialSubsetGeotiff
-from ecocloud_wps_demo.processes.spatial_subset_netcdf import SpatialSubsetNetcdf
-from ecocloud_wps_demo.processes.exploratory_data_box import ExploratoryDataBox
-from ecocloud_wps_demo.processes.exploratory_data_histogram import ExploratoryDataHistogram
-from ecocloud_wps_demo.processes.exploratory_data_density import ExploratoryDataDensity
-from ecocloud_wps_demo.processes.exploratory_data_correlation import ExploratoryDataCorrelation
+from ecocloud_wps_demo.processes import get_processes
 
 
-processes = [
-    ANUClimDailyExtract(),
-    ANUClimDailyExtractNetCDF4(),
-    SpatialSubsetGeotiff(),
-    SpatialSubsetNetcdf(),
-    ExploratoryDataBox(),
-    ExploratoryDataHistogram(),
-    ExploratoryDataDensity(),
-    ExploratoryDataCorrelation(),
-]
-
-
-service = Service(processes, ['/etc/ecocloud/pywps.cfg'])
+# process modules are light, handlers import their dependencies on first
+# Execute (see ecocloud_wps_demo.processes)
+service = Service(get_processes(), ['/etc/ecocloud/pywps.cfg'])
 
 
 @view_config(route_name='wps')
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from pywps import configuration as config
+
+from ecocloud_wps_demo.anuclim import handles
+
+
+# days since 1970-01-01 of the first time step of test grids
+FIRST_DAY = 3652
+
+
+@pytest.fixture(autouse=True)
+def pywps_config(tmp_path):
+    """Default pywps configuration, with the workdir in a temporary folder."""
+    config.load_configuration()
+    config.CONFIG.set('server', 'workdir', str(tmp_path))
+    for section in ('anuclim', 'anuclim:sources', 'exploratory'):
+        if not config.CONFIG.has_section(section):
+            config.CONFIG.add_section(section)
+    yield config.CONFIG
+    config.load_configuration()
+
+
+@pytest.fixture(autouse=True)
+def handle_pool():
+    """A fresh process wide handle pool for every test."""
+    handles._reset_pool()
+    yield handles.get_handle_pool()
+    handles.get_handle_pool().clear()
+    handles._reset_pool()
+
+
+def grid_values(shape, seed=0):
+    """Masked (time, lat, lon) test data, with a masked corner."""
+    values = np.random.RandomState(seed).uniform(-10, 40, shape).astype(np.float32)
+    values = np.ma.masked_array(values, np.zeros(shape, dtype=bool))
+    values[:, :3, :3] = np.ma.masked
+    return values
+
+
+class ArrayGrid(object):
+    """Grid read from an in memory masked array."""
+
+    def __init__(self, values):
+        self.values = values
+        self.shape = values.shape
+        self.slabs = []
+
+    def read_slab(self, grid, start, stop):
+        self.slabs.append((start, stop))
+        return self.values[start[0]:stop[0], start[1]:stop[1], start[2]:stop[2]]
+
+    def read_value(self, grid, t, y, x):
+        value = self.values[t, y, x]
+        return '' if value is np.ma.masked else value.item()
+
+
+def write_grid(filename, variable, values, lat0=-10.0, lon0=140.0, step=0.01):
+    """Write values as a daily ANUClim like NetCDF file, descending lats."""
+    netCDF4 = pytest.importorskip('netCDF4')
+    ntime, nlat, nlon = values.shape
+    with netCDF4.Dataset(filename, 'w') as ds:
+        for name, size in (('time', ntime), ('lat', nlat), ('lon', nlon)):
+            ds.createDimension(name, size)
+        time = ds.createVariable('time', 'f8', ('time',))
+        time.units = 'days since 1970-01-01 12:00:00'
+        time[:] = FIRST_DAY + np.arange(ntime)
+        ds.createVariable('lat', 'f8', ('lat',))[:] = lat0 - step * np.arange(nlat)
+        ds.createVariable('lon', 'f8', ('lon',))[:] = lon0 + step * np.arange(nlon)
+        grid = ds.createVariable(variable, 'f4', ('time', 'lat', 'lon'), zlib=True, fill_value=-999.0)
+        grid[:] = values
+    return filename
@@ -0,0 +1,95 @@
+import os
+
+import numpy as np
+import pytest
+
+from ecocloud_wps_demo.anuclim import backends, extract, handles
+
+from .conftest import grid_values, write_grid
+
+
+class DictGrid(backends._PooledGrid):
+    """Pooled grid of plain dicts, standing in for another library."""
+
+    opened = []
+    closed = []
+
+    def _open(self):
+        ds = {'air_temperature': np.zeros((1, 1, 1))}
+        self.opened.append(ds)
+        return ds
+
+    def _close(self, ds):
+        self.closed.append(ds)
+
+    def _get_grid(self, ds):
+        return ds[self.variable]
+
+
+@pytest.fixture(autouse=True)
+def reset_dict_grid():
+    DictGrid.opened = []
+    DictGrid.closed = []
+
+
+def test_backends_pool_handles_separately(tmp_path, handle_pool):
+    pytest.importorskip('netCDF4')
+    filename = write_grid(str(tmp_path / 'grid.nc'), 'air_temperature', grid_values((2, 5, 5)))
+    dataset = backends.open_netcdf(filename, 'air_temperature')
+    backends.release_dataset(dataset)
+    # same location, other library
+    grid = DictGrid(filename, 'air_temperature')
+    assert isinstance(grid.ds, dict)
+    grid.release()
+    # each backend reuses its own handle
+    dataset = backends.open_netcdf(filename, 'air_temperature')
+    assert dataset['ds'] is not grid.ds
+    backends.release_dataset(dataset)
+    assert handle_pool.stats()['opened'] == 2
+    assert handle_pool.stats()['reused'] == 1
+
+
+def test_failed_grid_returns_handle(handle_pool):
+    with pytest.raises(KeyError):
+        DictGrid('location', 'missing')
+    # nothing holds on to the handle, so it can be closed
+    handle_pool.clear()
+    assert DictGrid.closed == DictGrid.opened
+
+
+def test_stale_handle_reconnects(handle_pool):
+    class StaleGrid(DictGrid):
+        def _get_grid(self, ds):
+            if ds is self.opened[0]:
+                raise OSError('connection reset')
+            return super()._get_grid(ds)
+
+    grid = StaleGrid('location', 'air_temperature')
+    assert grid.ds is StaleGrid.opened[1]
+    assert StaleGrid.closed == [StaleGrid.opened[0]]
+    grid.release()
+    assert handle_pool.stats()['reconnects'] == 1
+
+
+class ShardProcess(object):
+
+    def _extract_shard(self):
+        return handles.get_handle_pool(), backends.netcdf_lock
+
+
+def test_forked_shard_workers_start_with_empty_pool(monkeypatch, handle_pool):
+    # Python < 3.7 forks shard workers without fork hooks
+    monkeypatch.delattr(os, 'register_at_fork', raising=False)
+    grid = DictGrid('location', 'air_temperature')
+    parent_lock = backends.netcdf_lock
+    parent_lock.acquire()
+    try:
+        pool, lock = extract._extract_shard(ShardProcess)
+    finally:
+        parent_lock.release()
+    assert pool is not handle_pool
+    assert pool.stats()['open'] == 0
+    assert lock is not parent_lock and not lock.locked()
+    # inherited handles are left alone, they belong to the parent
+    assert DictGrid.closed == []
+    grid.release()
@@ -0,0 +1,105 @@
+import csv
+import io
+
+import numpy as np
+
+from ecocloud_wps_demo.anuclim.batch import (
+    BatchExtractor, CSVInput, read_chunks, read_header, shard_file, unique_points)
+from ecocloud_wps_demo.anuclim.planner import SlabReader
+
+from .conftest import FIRST_DAY, ArrayGrid, grid_values
+
+
+def write_csv(path, rows, header=('lat', 'lon', 'date', 'name')):
+    with open(str(path), 'w', newline='') as fp:
+        writer = csv.writer(fp)
+        writer.writerow(header)
+        writer.writerows(rows)
+    return str(path)
+
+
+def test_unique_points():
+    random = np.random.RandomState(0)
+    tidx, yidx, xidx = (random.randint(0, 4, 500) for _ in range(3))
+    first, inverse = unique_points(tidx, yidx, xidx)
+    points = np.stack([tidx, yidx, xidx], axis=1)
+    assert len(first) == len(np.unique(points, axis=0))
+    assert np.array_equal(points[first][inverse], points)
+
+
+def test_unique_points_empty():
+    empty = np.zeros(0, dtype=np.intp)
+    first, inverse = unique_points(empty, empty, empty)
+    assert len(first) == len(inverse) == 0
+
+
+def test_read_header(tmp_path):
+    filename = write_csv(tmp_path / 'in.csv', [['1', '2', '2000-01-01', 'x']])
+    header, start = read_header(filename)
+    assert header == ['lat', 'lon', 'date', 'name']
+    assert start == len('lat,lon,date,name\r\n')
+
+
+def test_shards_hold_all_lines_once(tmp_path):
+    rows = [[str(i), str(i * 2), '2000-01-01', 'row with some text {}'.format(i)] for i in range(1000)]
+    filename = write_csv(tmp_path / 'in.csv', rows)
+    header, start = read_header(filename)
+    for count in (1, 3, 7, 2000):
+        shards = shard_file(filename, start, count)
+        assert shards[0][0] == start
+        lines = []
+        for shard_start, shard_stop in shards:
+            csv_input = CSVInput(filename, shard_start, shard_stop, bufsize=64)
+            lines.extend(csv.reader(csv_input))
+            assert csv_input.consumed == shard_stop - shard_start
+            csv_input.close()
+        assert lines == rows
+
+
+def test_read_chunks():
+    reader = csv.reader(io.StringIO('\n'.join(str(i) for i in range(25))))
+    assert [len(rows) for rows in read_chunks(reader, 10)] == [10, 10, 5]
+
+
+def dataset(values, lat0=-10.0, lon0=140.0, step=0.01):
+    ntime, nlat, nlon = values.shape
+    return {
+        'data': ArrayGrid(values),
+        'times': FIRST_DAY + np.arange(ntime),
+        'time_units': 'days since 1970-01-01',
+        'lats': lat0 - step * np.arange(nlat),
+        'lons': lon0 + step * np.arange(nlon),
+    }
+
+
+def test_batch_extractor():
+    values = grid_values((10, 20, 30))
+    datasets = {'a': dataset(values), 'b': dataset(values * 2)}
+    random = np.random.RandomState(0)
+    points = [(random.randint(10), random.randint(20), random.randint(30)) for _ in range(200)]
+    rows = [['{:.4f}'.format(-10.0 - 0.01 * y), '{:.4f}'.format(140.0 + 0.01 * x),
+             str(np.datetime64('1970-01-01') + FIRST_DAY + t), 'x'] for t, y, x in points]
+    # out of area, bad date, repeated point
+    rows.append(['0.0', '140.0', '1980-01-01', 'x'])
+    rows.append(['-10.0', '140.0', 'not a date', 'x'])
+    rows.append(list(rows[0][:4]))
+
+    # each variable is read from its own ArrayGrid
+    reader = SlabReader(lambda grid, start, stop: grid.read_slab(grid, start, stop),
+                        lambda grid, t, y, x: grid.read_value(grid, t, y, x))
+    extractor = BatchExtractor(datasets, ['a', 'b'], reader)
+    header_idx = {'lat': 0, 'lon': 1, 'date': 2, 'name': 3}
+    extractor.extract(rows, header_idx)
+
+    for row, (t, y, x) in zip(rows, points):
+        for col, scale in ((4, 1), (5, 2)):
+            value = values[t, y, x]
+            if value is np.ma.masked:
+                assert row[col] == ''
+            else:
+                assert row[col] == float(value * scale)
+    assert rows[-3][4:] == ['', '']
+    assert rows[-2][4:] == ['', '']
+    assert rows[-1][4:] == rows[0][4:]
+    assert extractor.points == 2 * 201
+    assert extractor.unique_points < extractor.points
@@ -0,0 +1,109 @@
+import os
+
+import numpy as np
+import pytest
+
+from ecocloud_wps_demo.anuclim import backends
+from ecocloud_wps_demo.anuclim.axiscache import AxisCache
+from ecocloud_wps_demo.anuclim.chunkcache import ChunkCache, get_chunk_cache
+from ecocloud_wps_demo.anuclim.extract import ExtractMixin
+
+from .conftest import ArrayGrid, grid_values, write_grid
+
+
+def read_slab(grid, start, stop):
+    return grid.read_slab(grid, start, stop)
+
+
+def test_chunk_cache_serves_slabs(tmp_path):
+    values = grid_values((20, 50, 70))
+    grid = ArrayGrid(values)
+    cache = ChunkCache(str(tmp_path), 10 * 1024 * 1024, block_shape=(4, 16, 16))
+    random = np.random.RandomState(0)
+    for _ in range(50):
+        start = [random.randint(0, size) for size in values.shape]
+        stop = [random.randint(a + 1, size + 1) for a, size in zip(start, values.shape)]
+        result = cache.read('grid', read_slab, grid, start, stop)
+        wanted = values[start[0]:stop[0], start[1]:stop[1], start[2]:stop[2]]
+        assert np.array_equal(np.ma.getdata(result)[~wanted.mask], wanted.compressed())
+        assert np.array_equal(np.ma.getmaskarray(result), np.ma.getmaskarray(wanted))
+    # every block is fetched once at most
+    fetched = len(grid.slabs)
+    cache.read('grid', read_slab, grid, (0, 0, 0), values.shape)
+    cache.read('grid', read_slab, grid, (0, 0, 0), values.shape)
+    assert len(grid.slabs) <= fetched + 1
+    assert cache.stats()['hits'] > 0
+
+
+def test_chunk_cache_evicts(tmp_path):
+    values = grid_values((16, 64, 64))
+    grid = ArrayGrid(values)
+    max_bytes = 100 * 1024
+    cache = ChunkCache(str(tmp_path), max_bytes, block_shape=(4, 16, 16))
+    cache.read('grid', read_slab, grid, (0, 0, 0), values.shape)
+    size = sum(os.path.getsize(os.path.join(dirpath, name))
+               for dirpath, dirnames, names in os.walk(cache.path)
+               for name in names if name.endswith('.npz'))
+    assert size <= max_bytes
+    assert cache.stats()['evictions'] > 0
+
+
+def test_chunk_cache_refetches_changed_grids(tmp_path):
+    netCDF4 = pytest.importorskip('netCDF4')
+    filename = str(tmp_path / 'grid.nc')
+    values = grid_values((4, 16, 16))
+    write_grid(filename, 'air_temperature', values)
+    dataset = backends.open_netcdf(filename, 'air_temperature')
+    grid = dataset['data']
+    assert grid.meta['shape'] == [4, 16, 16]
+    assert grid.meta['attributes']['_FillValue'] == -999.0
+    cache = ChunkCache(str(tmp_path / 'cache'), 10 * 1024 * 1024, block_shape=(4, 16, 16))
+    fetched = []
+
+    def read_slab(grid, start, stop):
+        fetched.append(start)
+        return grid.read_slab(start, stop)
+
+    cached_read_slab = cache.reader(read_slab, ExtractMixin()._grid_key)
+    first = cached_read_slab(grid, (0, 0, 0), (4, 16, 16))
+    cached_read_slab(grid, (0, 0, 0), (4, 16, 16))
+    assert len(fetched) == 1
+    backends.release_dataset(dataset)
+    backends.get_handle_pool().clear()
+
+    # the grid is republished at the same location, with new values and attributes
+    write_grid(filename, 'air_temperature', values + 1)
+    with netCDF4.Dataset(filename, 'a') as ds:
+        ds['air_temperature'].history = 'republished'
+    dataset = backends.open_netcdf(filename, 'air_temperature')
+    second = cached_read_slab(dataset['data'], (0, 0, 0), (4, 16, 16))
+    backends.release_dataset(dataset)
+    assert len(fetched) == 2
+    assert np.ma.allclose(second, first + 1)
+
+
+def test_chunk_cache_disabled_by_default(pywps_config):
+    pywps_config.remove_option('anuclim', 'chunk_cache_size_mb')
+    assert get_chunk_cache() is None
+    pywps_config.set('anuclim', 'chunk_cache_size_mb', '10')
+    assert get_chunk_cache().max_bytes == 10 * 1024 * 1024
+
+
+def test_axis_cache_refetches_changed_axes(tmp_path):
+    cache = AxisCache(str(tmp_path))
+    fetched = []
+
+    def fetch(values):
+        def fetch():
+            fetched.append(values)
+            return np.asarray(values)
+        return fetch
+
+    meta = {'shape': [3], 'dtype': 'float64', 'attributes': {'units': 'degrees_north'}}
+    assert cache.get('url', 'lat', meta, fetch([1.0, 2.0, 3.0])).tolist() == [1, 2, 3]
+    assert cache.get('url', 'lat', meta, fetch([0.0])).tolist() == [1, 2, 3]
+    assert len(fetched) == 1
+    # the remote axis changed
+    meta = dict(meta, shape=[2])
+    assert cache.get('url', 'lat', meta, fetch([4.0, 5.0])).tolist() == [4, 5]
+    assert len(fetched) == 2
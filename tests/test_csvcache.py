@@ -0,0 +1,80 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from ecocloud_wps_demo.exploratory.csvcache import (
+    CSVCache, file_digest, get_csv_cache, iter_csv, parse_csv, read_csv)
+
+
+def write_csv(path, rows=1000):
+    random = np.random.RandomState(0)
+    b = random.randint(0, 100, rows).astype(object)
+    # a non numeric value becomes NaN
+    b[rows // 2] = 'n/a'
+    frame = pd.DataFrame({'a': random.normal(size=rows), 'b': b, 'c': ['x'] * rows})
+    frame.to_csv(str(path), index=False)
+    return str(path)
+
+
+def test_read_csv_through_cache(tmp_path, pywps_config):
+    filename = write_csv(tmp_path / 'data.csv')
+    expected = parse_csv(filename, ['b', 'a'])
+    assert np.isnan(expected['b'][500])
+    for _ in range(2):
+        pd.testing.assert_frame_equal(read_csv(filename, ['b', 'a']), expected)
+    assert get_csv_cache().load(filename, ['a', 'b']) is not None
+
+
+def test_read_csv_without_cache(tmp_path, pywps_config):
+    pywps_config.set('exploratory', 'csv_cache_size_mb', '0')
+    assert get_csv_cache() is None
+    filename = write_csv(tmp_path / 'data.csv')
+    pd.testing.assert_frame_equal(read_csv(filename, ['a']), parse_csv(filename, ['a']))
+
+
+def test_cache_is_keyed_by_content(tmp_path):
+    cache = CSVCache(str(tmp_path / 'cache'), 10 * 1024 * 1024)
+    first = write_csv(tmp_path / 'first.csv')
+    copy = tmp_path / 'copy.csv'
+    copy.write_bytes(open(first, 'rb').read())
+    cache.read(first, ['a'])
+    assert file_digest(first) == file_digest(str(copy))
+    assert cache.load(str(copy), ['a']) is not None
+
+
+def test_iter_csv_fills_cache(tmp_path, pywps_config):
+    filename = write_csv(tmp_path / 'data.csv', rows=2500)
+    expected = parse_csv(filename, ['a', 'b'])
+    for _ in range(2):
+        chunks = list(iter_csv(filename, ['a', 'b'], chunk_rows=1000))
+        assert [len(chunk) for chunk in chunks] == [1000, 1000, 500]
+        result = pd.concat(chunks, ignore_index=True)
+        pd.testing.assert_frame_equal(result, expected)
+        cached = get_csv_cache().load(filename, ['a', 'b'])
+        assert cached is not None
+        assert cached['b'].dtype == expected['b'].dtype
+        assert isinstance(cached['a'], np.memmap)
+
+
+def test_iter_csv_stopped_early_caches_nothing(tmp_path, pywps_config):
+    filename = write_csv(tmp_path / 'data.csv', rows=2500)
+    chunks = iter_csv(filename, ['a'], chunk_rows=1000)
+    next(chunks)
+    chunks.close()
+    cache = get_csv_cache()
+    assert cache.load(filename, ['a']) is None
+    for dirpath, dirnames, names in os.walk(cache.path):
+        assert not [name for name in names if name.endswith('.tmp')]
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = CSVCache(str(tmp_path / 'cache'), 30 * 1024)
+    files = [write_csv(tmp_path / 'data{}.csv'.format(i)) for i in range(3)]
+    for i, filename in enumerate(files):
+        # make every file distinct
+        with open(filename, 'a') as fp:
+            fp.write('{},{},x\n'.format(i, i))
+        cache.read(filename, ['a', 'b'])
+    assert cache.load(files[-1], ['a', 'b']) is not None
+    assert cache.load(files[0], ['a', 'b']) is None
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from ecocloud_wps_demo.anuclim.dates import DateParser, time_axis_days
+
+
+def days(date):
+    return (np.datetime64(date, 'D') - np.datetime64('1970-01-01', 'D')).astype(int)
+
+
+def test_time_axis_days_maps_steps_to_their_day():
+    times = np.array([0, 0.5, 1, 365])
+    result = time_axis_days(times, 'days since 1800-01-01 00:00:00')
+    assert result.tolist() == [days('1800-01-01'), days('1800-01-01'), days('1800-01-02'), days('1801-01-01')]
+
+
+def test_time_axis_days_noon_origin():
+    result = time_axis_days([0, 1, 2], 'days since 2000-01-01 12:00:00')
+    assert result.tolist() == [days('2000-01-01'), days('2000-01-02'), days('2000-01-03')]
+
+
+def test_time_axis_days_hours_and_rounding():
+    # just below midnight due to float rounding still counts as next day
+    result = time_axis_days([23.99999999, 24, 47], 'hours since 2000-01-01')
+    assert result.tolist() == [days('2000-01-02'), days('2000-01-02'), days('2000-01-02')]
+
+
+def test_time_axis_days_defaults_to_seconds_since_epoch():
+    assert time_axis_days([86400 * 3 + 10], None).tolist() == [3]
+
+
+def test_time_axis_days_masked_input():
+    times = np.ma.masked_array([0, 1], mask=[False, False])
+    assert time_axis_days(times, 'days since 1970-01-01').tolist() == [0, 1]
+
+
+def test_time_axis_days_unsupported_units():
+    with pytest.raises(ValueError):
+        time_axis_days([0], 'months since 2000-01-01')
+
+
+def test_date_parser():
+    parse = DateParser()
+    result, errors = parse(['2000-01-02', 'nonsense', '2000-01-02', ' 1970-01-01 '])
+    assert result[[0, 2, 3]].tolist() == [days('2000-01-02'), days('2000-01-02'), 0]
+    assert np.isnan(result[1])
+    assert errors[0] is None and errors[3] is None
+    assert errors[1] is not None
+    # memoized across calls
+    result, errors = parse(['2000-01-02'])
+    assert result.tolist() == [days('2000-01-02')]
+
+
+def test_date_parser_limits_memo():
+    parse = DateParser(maxsize=2)
+    for day in range(1, 20):
+        result, errors = parse(['2000-01-{:02d}'.format(day)])
+        assert result.tolist() == [days('2000-01-{:02d}'.format(day))]
+    assert len(parse._cache) <= 3
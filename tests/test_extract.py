@@ -0,0 +1,117 @@
+import csv
+import types
+
+import numpy as np
+import pytest
+
+from .conftest import FIRST_DAY, grid_values, write_grid
+
+pytest.importorskip('netCDF4')
+
+
+class Input(object):
+
+    def __init__(self, data=None, file=None):
+        self.data = data
+        self.file = file
+
+
+class Response(object):
+
+    def __init__(self, mime_type='text/csv'):
+        self.outputs = {'output': types.SimpleNamespace(
+            file=None, data_format=types.SimpleNamespace(mime_type=mime_type))}
+        self.status = []
+
+    def update_status(self, message, percent):
+        self.status.append((message, percent))
+
+
+SHAPE = (30, 40, 50)
+
+
+@pytest.fixture
+def sources(tmp_path, pywps_config):
+    """temp_max and temp_min served from local NetCDF files."""
+    values = {}
+    for seed, var in enumerate(('temp_max', 'temp_min')):
+        values[var] = grid_values(SHAPE, seed)
+        filename = write_grid(str(tmp_path / '{}.nc'.format(var)), 'air_temperature', values[var])
+        pywps_config.set('anuclim:sources', var, 'netcdf:{}'.format(filename))
+    return values
+
+
+@pytest.fixture
+def occurrences(tmp_path):
+    random = np.random.RandomState(0)
+    points = [tuple(random.randint(0, size) for size in SHAPE) for _ in range(3000)]
+    filename = str(tmp_path / 'occurrences.csv')
+    with open(filename, 'w', newline='') as fp:
+        writer = csv.writer(fp)
+        writer.writerow(['species', 'lat', 'lon', 'date'])
+        for i, (t, y, x) in enumerate(points):
+            writer.writerow(['species {}'.format(i % 7), '{:.4f}'.format(-10.0 - 0.01 * y),
+                             '{:.4f}'.format(140.0 + 0.01 * x),
+                             str(np.datetime64('1970-01-01') + FIRST_DAY + t)])
+    return filename, points
+
+
+def extract(tmp_path, csv_file, variables, **inputs):
+    from ecocloud_wps_demo.processes.anuclim_daily_extract_netcdf4 import ANUClimDailyExtractNetCDF4
+    process = ANUClimDailyExtractNetCDF4()
+    process.workdir = str(tmp_path)
+    request = types.SimpleNamespace(inputs={
+        'csv': [Input(file=csv_file)],
+        'variables': [Input(var) for var in variables],
+    })
+    for name, value in inputs.items():
+        request.inputs[name] = [Input(value)]
+    response = Response()
+    process._handler(request, response)
+    with open(response.outputs['output'].file, newline='') as fp:
+        return list(csv.reader(fp)), response
+
+
+def test_extract_values(tmp_path, sources, occurrences):
+    csv_file, points = occurrences
+    rows, response = extract(tmp_path, csv_file, ['temp_max', 'temp_min'])
+    assert rows[0] == ['species', 'lat', 'lon', 'date', 'temp_max', 'temp_min']
+    assert len(rows) == len(points) + 1
+    for row, (t, y, x) in zip(rows[1:], points):
+        for col, var in ((4, 'temp_max'), (5, 'temp_min')):
+            value = sources[var][t, y, x]
+            if value is np.ma.masked:
+                assert row[col] == ''
+            else:
+                assert float(row[col]) == float(value)
+    assert response.status[-1][1] == 100
+
+
+def test_sharded_extract_equals_single_pass(tmp_path, pywps_config, sources, occurrences):
+    csv_file, points = occurrences
+    single, _ = extract(tmp_path, csv_file, ['temp_max', 'temp_min'])
+    pywps_config.set('anuclim', 'processes', '2')
+    pywps_config.set('anuclim', 'shard_min_size_mb', '0')
+    sharded, response = extract(tmp_path, csv_file, ['temp_max', 'temp_min'])
+    assert sharded == single
+    assert 'shards' in response.status[-1][0]
+
+
+def test_extract_windows(tmp_path, sources, occurrences):
+    csv_file, points = occurrences
+    rows, _ = extract(tmp_path, csv_file, ['temp_max'], window_length=3, window_offset=1, window_stat='max')
+    assert rows[0] == ['species', 'lat', 'lon', 'date', 'temp_max_max_3d_off1']
+    values = sources['temp_max']
+    for row, (t, y, x) in zip(rows[1:], points):
+        start = t - 3
+        if start < 0:
+            assert row[4] == ''
+            continue
+        window = values[start:start + 3, y, x].max()
+        assert row[4] == ('' if window is np.ma.masked else str(float(window)))
+
+
+def test_extract_window_column_without_offset(tmp_path, sources, occurrences):
+    csv_file, _ = occurrences
+    rows, _ = extract(tmp_path, csv_file, ['temp_max', 'temp_min'], window_length=5)
+    assert rows[0][4:] == ['temp_max_mean_5d', 'temp_min_mean_5d']
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from ecocloud_wps_demo.anuclim.grid import GridIndex, nearest_index
+
+
+def argmin_index(axis, values):
+    return np.array([np.abs(axis - value).argmin() for value in values])
+
+
+def inside_values(axis, count=2000, seed=0):
+    # values within half a cell of the axis, including exact axis values
+    step = np.abs(np.diff(axis)).min()
+    lo, hi = axis.min() - step / 2 * 0.99, axis.max() + step / 2 * 0.99
+    values = np.random.RandomState(seed).uniform(lo, hi, count)
+    return np.concatenate([values, axis[::7]])
+
+
+AXES = {
+    'regular': -10 - 0.01 * np.arange(500),
+    'ascending': 140 + 0.01 * np.arange(700),
+    'float32': (140 + 0.01 * np.arange(700)).astype(np.float32),
+    'irregular': np.cumsum(np.random.RandomState(1).uniform(0.5, 2.0, 300)),
+    'irregular descending': -np.cumsum(np.random.RandomState(2).uniform(0.5, 2.0, 300)),
+    # steps vary by 0.05% only, but add up to several cells along the axis
+    'drift': np.cumsum(0.01 * (1 + 0.0005 * np.sin(np.arange(2000) / 50.0))),
+}
+
+
+@pytest.mark.parametrize('name', sorted(AXES))
+def test_grid_index_matches_argmin(name):
+    axis = np.asarray(AXES[name], dtype=np.float64)
+    values = inside_values(axis)
+    index = GridIndex(AXES[name])
+    assert np.array_equal(index(values), argmin_index(axis, values))
+
+
+def test_grid_index_regular_axes_use_arithmetic():
+    assert GridIndex(AXES['regular']).regular
+    assert not GridIndex(AXES['irregular']).regular
+    assert not GridIndex(AXES['drift']).regular
+
+
+def test_grid_index_out_of_bounds():
+    index = GridIndex(AXES['regular'])
+    values = [-10 + 0.006, -10 + 0.004, -10 - 0.01 * 499 - 0.004, -10 - 0.01 * 499 - 0.006, np.nan]
+    assert index(values).tolist() == [-1, 0, 499, -1, -1]
+
+
+def test_grid_index_single_value_axis():
+    index = GridIndex([5.0])
+    assert index([5.0, 4.0]).tolist() == [0, -1]
+
+
+def test_nearest_index_prefers_lower_index_on_tie():
+    assert nearest_index([0.0, 1.0, 2.0], [0.5, 1.5]).tolist() == [0, 1]
+    assert nearest_index([2.0, 1.0, 0.0], [0.5, 1.5]).tolist() == [1, 0]
@@ -0,0 +1,89 @@
+import time
+
+from ecocloud_wps_demo.anuclim.handles import HandlePool
+
+
+class Opener(object):
+    """Opens numbered handles and records closed ones."""
+
+    def __init__(self):
+        self.opened = 0
+        self.closed = []
+
+    def open(self):
+        self.opened += 1
+        return 'handle{}'.format(self.opened)
+
+    def close(self, handle):
+        self.closed.append(handle)
+
+
+def test_reuses_released_handles():
+    pool = HandlePool()
+    opener = Opener()
+    a = pool.acquire('url', opener.open, opener.close)
+    b = pool.acquire('url', opener.open, opener.close)
+    assert a == b == 'handle1'
+    pool.release('url', a)
+    pool.release('url', b)
+    assert pool.acquire('url', opener.open, opener.close) == 'handle1'
+    assert pool.acquire('other', opener.open, opener.close) == 'handle2'
+    assert pool.stats()['opened'] == 2
+    assert pool.stats()['reused'] == 2
+    assert opener.closed == []
+
+
+def test_closes_idle_handles():
+    pool = HandlePool(idle_timeout=0.01)
+    opener = Opener()
+    handle = pool.acquire('a', opener.open, opener.close)
+    pool.release('a', handle)
+    time.sleep(0.02)
+    # expired handles are closed on the next acquire or release
+    pool.acquire('b', opener.open, opener.close)
+    assert opener.closed == ['handle1']
+    assert pool.acquire('a', opener.open, opener.close) == 'handle3'
+
+
+def test_limits_open_handles():
+    pool = HandlePool(max_size=2)
+    opener = Opener()
+    for url in ('a', 'b', 'c'):
+        pool.release(url, pool.acquire(url, opener.open, opener.close))
+    # least recently used first
+    assert opener.closed == ['handle1']
+    assert pool.stats()['open'] == 2
+
+
+def test_handles_in_use_are_kept():
+    pool = HandlePool(max_size=1)
+    opener = Opener()
+    a = pool.acquire('a', opener.open, opener.close)
+    pool.release('b', pool.acquire('b', opener.open, opener.close))
+    assert opener.closed == ['handle2']
+    pool.release('a', a)
+    assert opener.closed == ['handle2']
+
+
+def test_discard_reconnects():
+    pool = HandlePool()
+    opener = Opener()
+    first = pool.acquire('url', opener.open, opener.close)
+    other_user = pool.acquire('url', opener.open, opener.close)
+    pool.discard('url', first)
+    # next acquire reconnects, the failed handle is closed after its last use
+    assert pool.acquire('url', opener.open, opener.close) == 'handle2'
+    assert opener.closed == []
+    pool.release('url', other_user)
+    assert opener.closed == ['handle1']
+    assert pool.stats()['reconnects'] == 1
+
+
+def test_clear_closes_unused_handles():
+    pool = HandlePool()
+    opener = Opener()
+    used = pool.acquire('a', opener.open, opener.close)
+    pool.release('b', pool.acquire('b', opener.open, opener.close))
+    pool.clear()
+    assert opener.closed == ['handle2']
+    pool.release('a', used)
@@ -0,0 +1,54 @@
+import csv
+
+import pytest
+
+from ecocloud_wps_demo.anuclim.output import CSVWriter, get_writer
+
+
+HEADER = ['lat', 'lon', 'date', 'temp_max', 'rainfall']
+
+SHARDS = [
+    [['-10.0', '140.0', '2000-01-01', 25.5, 0.0]],
+    [['-10.1', '140.1', '2000-01-02', '', 1.25], ['-10.2', '140.2', '2000-01-03', 20.0, '']],
+]
+
+
+def write_shards(tmp_path, writer):
+    filenames = []
+    for i, rows in enumerate(SHARDS):
+        filename = str(tmp_path / 'shard{}.{}'.format(i, writer.extension))
+        out = writer(filename, HEADER, 2, with_header=False)
+        out.write([list(row) for row in rows])
+        out.close()
+        filenames.append(filename)
+    out_file = str(tmp_path / 'out.{}'.format(writer.extension))
+    writer.merge(out_file, HEADER, 2, filenames)
+    return out_file
+
+
+def test_csv_writer_merges_shards_in_order(tmp_path):
+    out_file = write_shards(tmp_path, CSVWriter)
+    with open(out_file, newline='') as fp:
+        rows = list(csv.reader(fp))
+    assert rows[0] == HEADER
+    assert rows[1:] == [[str(value) for value in row] for shard in SHARDS for row in shard]
+
+
+@pytest.mark.parametrize('mime_type', ['application/vnd.apache.parquet', 'application/vnd.apache.arrow.file'])
+def test_columnar_writers(tmp_path, mime_type):
+    pytest.importorskip('pyarrow')
+    writer = get_writer(mime_type)
+    out_file = write_shards(tmp_path, writer)
+    table = None
+    for batch in writer._read_batches(out_file):
+        table = batch.to_pydict() if table is None else {
+            key: table[key] + value for key, value in batch.to_pydict().items()}
+    assert list(table) == HEADER
+    assert table['lat'] == ['-10.0', '-10.1', '-10.2']
+    assert table['temp_max'] == [25.5, None, 20.0]
+    assert table['rainfall'] == [0.0, 1.25, None]
+
+
+def test_unsupported_format():
+    with pytest.raises(Exception):
+        get_writer('application/x-unknown')
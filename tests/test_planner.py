@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from ecocloud_wps_demo.anuclim.planner import SlabReader, WindowReader, plan_reads
+
+from .conftest import ArrayGrid, grid_values
+
+
+def random_points(shape, count, seed=0):
+    random = np.random.RandomState(seed)
+    return tuple(random.randint(0, size, count) for size in shape)
+
+
+def expected(values, tidx, yidx, xidx):
+    result = np.ma.getdata(values)[tidx, yidx, xidx].astype(object)
+    result[np.ma.getmaskarray(values)[tidx, yidx, xidx]] = ''
+    return result
+
+
+@pytest.mark.parametrize('max_cells', [1, 64, 4096, 10 ** 6])
+def test_plan_reads_covers_points(max_cells):
+    tidx, yidx, xidx = random_points((50, 40, 60), 500)
+    slabs = plan_reads(tidx, yidx, xidx, max_cells)
+    members = np.sort(np.concatenate([slab.members for slab in slabs]))
+    assert members.tolist() == list(range(500))
+    for slab in slabs:
+        extent = np.subtract(slab.stop, slab.start)
+        assert np.prod(extent) <= max_cells
+        for axis, idx in enumerate((tidx, yidx, xidx)):
+            assert (idx[slab.members] >= slab.start[axis]).all()
+            assert (idx[slab.members] < slab.stop[axis]).all()
+
+
+def test_plan_reads_no_points():
+    empty = np.zeros(0, dtype=np.intp)
+    assert plan_reads(empty, empty, empty) == []
+
+
+def test_slab_reader_values():
+    values = grid_values((20, 30, 40))
+    grid = ArrayGrid(values)
+    tidx, yidx, xidx = random_points(values.shape, 300)
+    reader = SlabReader(grid.read_slab, grid.read_value, max_cells=500)
+    result, failed = reader(grid, tidx, yidx, xidx)
+    assert not failed.any()
+    assert result.tolist() == expected(values, tidx, yidx, xidx).tolist()
+    assert reader.reads == len(grid.slabs) < 300
+    assert reader.points == 300
+
+
+def test_slab_reader_falls_back_to_points():
+    values = grid_values((5, 10, 10))
+    grid = ArrayGrid(values)
+
+    def broken_slab(grid, start, stop):
+        raise OSError('connection reset')
+
+    tidx, yidx, xidx = random_points(values.shape, 50)
+    reader = SlabReader(broken_slab, grid.read_value)
+    result, failed = reader(grid, tidx, yidx, xidx)
+    assert not failed.any()
+    assert result.tolist() == expected(values, tidx, yidx, xidx).tolist()
+
+
+@pytest.mark.parametrize('stat', ['mean', 'min', 'max', 'sum'])
+@pytest.mark.parametrize('offset', [0, 2])
+def test_window_reader(stat, offset):
+    values = grid_values((40, 20, 20))
+    grid = ArrayGrid(values)
+    tidx, yidx, xidx = random_points(values.shape, 200)
+    length = 5
+    reader = WindowReader(grid.read_slab, length, offset, stat, max_cells=2000)
+    result, failed = reader(grid, tidx, yidx, xidx)
+
+    reduce = getattr(np.ma, stat)
+    for i, (t, y, x) in enumerate(zip(tidx, yidx, xidx)):
+        start = t - offset - length + 1
+        if start < 0:
+            assert failed[i]
+            continue
+        assert not failed[i]
+        window = reduce(values[start:start + length, y, x])
+        if window is np.ma.masked:
+            assert result[i] == ''
+        else:
+            assert result[i] == pytest.approx(float(window), rel=1e-6)
@@ -0,0 +1,48 @@
+import os
+import sys
+
+import pytest
+
+from pywps import configuration as config
+
+from ecocloud_wps_demo.exploratory import render
+
+
+def worker_state():
+    return os.getpid(), config.get_config_value('exploratory', 'density_bandwidth')
+
+
+@pytest.fixture
+def render_state(monkeypatch):
+    """Restore the process wide render pool state after a test."""
+    for name in ('_pool', '_pool_lock', '_render_lock', '_forked', '_pid'):
+        monkeypatch.setattr(render, name, getattr(render, name))
+
+
+def test_render_in_process(render_state, pywps_config):
+    pywps_config.set('exploratory', 'render_workers', '0')
+    assert render.get_render_pool() is None
+    assert render.render(worker_state)[0] == os.getpid()
+
+
+@pytest.mark.parametrize('version_info', [sys.version_info, (3, 6, 7)])
+def test_render_pool_workers_use_service_config(render_state, pywps_config, monkeypatch, version_info):
+    monkeypatch.setattr(render.sys, 'version_info', version_info)
+    pywps_config.set('exploratory', 'density_bandwidth', '0.25')
+    pool = render.RenderPool(max_workers=1)
+    try:
+        pool.warm()
+        pid, bandwidth = pool.render(worker_state)
+    finally:
+        pool.shutdown()
+    assert pid != os.getpid()
+    assert bandwidth == '0.25'
+
+
+def test_forked_children_render_in_process(render_state, pywps_config):
+    pywps_config.set('exploratory', 'render_workers', '1')
+    # a child forked without fork hooks (Python < 3.7) has another pid
+    render._pid = -1
+    assert render.get_render_pool() is None
+    assert render._forked
+    assert render.render(worker_state)[0] == os.getpid()
@@ -0,0 +1,48 @@
+import os
+import time
+
+from ecocloud_wps_demo.exploratory.rendercache import RenderCache, render_key
+
+
+def test_render_key():
+    key = render_key('process', '1', 'digest', ['a', 'b'], 'title', {'setting': '1'})
+    assert key == render_key('process', '1', 'digest', ['a', 'b'], 'title', {'setting': '1'})
+    assert key != render_key('process', '1', 'digest', ['a', 'b'], 'title', {'setting': '2'})
+    assert key != render_key('process', '1', 'digest', ['b', 'a'], 'title', {'setting': '1'})
+
+
+def test_render_cache(tmp_path):
+    cache = RenderCache(str(tmp_path / 'cache'), 1024 * 1024)
+    source = tmp_path / 'plot.png'
+    source.write_bytes(b'png')
+    dest = str(tmp_path / 'out.png')
+    assert not cache.get('key', 'png', dest)
+    cache.put('key', 'png', str(source))
+    assert cache.get('key', 'png', dest)
+    assert open(dest, 'rb').read() == b'png'
+    assert not cache.get('key', 'json', dest)
+
+
+def test_render_cache_expires(tmp_path):
+    cache = RenderCache(str(tmp_path / 'cache'), 1024 * 1024, ttl=60)
+    source = tmp_path / 'plot.png'
+    source.write_bytes(b'png')
+    cache.put('key', 'png', str(source))
+    filename = os.path.join(cache.path, 'key.png')
+    rendered = time.time() - 120
+    os.utime(filename, (rendered, rendered))
+    assert not cache.get('key', 'png', str(tmp_path / 'out.png'))
+
+
+def test_render_cache_evicts_least_recently_used(tmp_path):
+    cache = RenderCache(str(tmp_path / 'cache'), 2500)
+    source = tmp_path / 'plot.png'
+    source.write_bytes(b'x' * 1000)
+    now = time.time()
+    for i, key in enumerate(('a', 'b')):
+        cache.put(key, 'png', str(source))
+        os.utime(os.path.join(cache.path, key + '.png'), (now - 100 + i, now - 100 + i))
+    # a was used last
+    assert cache.get('a', 'png', str(tmp_path / 'out.png'))
+    cache.put('c', 'png', str(source))
+    assert sorted(name for name in os.listdir(cache.path) if not name.startswith('.')) == ['a.png', 'c.png']
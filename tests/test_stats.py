@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from ecocloud_wps_demo.exploratory import stats
+
+
+def chunks_of(values, size=1000, column='v'):
+    frame = pd.DataFrame({column: values})
+    return lambda: (frame.iloc[start:start + size] for start in range(0, len(frame), size))
+
+
+def test_quantile_sketch_rank_error():
+    values = np.random.RandomState(0).standard_normal(300000)
+    error = 0.01
+    sketch = stats.QuantileSketch(error)
+    for start in range(0, len(values), 7000):
+        sketch.add(values[start:start + 7000])
+    assert not sketch.exact
+    ordered = np.sort(values)
+    qs = np.linspace(0.01, 0.99, 99)
+    ranks = np.searchsorted(ordered, sketch.quantiles(qs)) / len(values)
+    assert np.abs(ranks - qs).max() <= 2 * error
+    # memory doesn't grow with the number of values
+    assert sum(len(level) for level in sketch.levels) < 20 / error
+
+
+def test_quantile_sketch_exact_while_small():
+    values = np.random.RandomState(1).uniform(size=100)
+    sketch = stats.QuantileSketch(0.001)
+    sketch.add(np.append(values, np.nan))
+    assert sketch.exact
+    assert sketch.count == 100
+    assert np.allclose(sketch.quantiles([0.25, 0.5, 0.75]), np.percentile(values, [25, 50, 75]))
+
+
+def test_box_stats_match_matplotlib():
+    cbook = pytest.importorskip('matplotlib.cbook')
+    # few enough values for exact quartiles
+    values = np.random.RandomState(2).lognormal(size=1000)
+    result = stats.chunked_box_stats(chunks_of(values), ['v'])['v']
+    expected = cbook.boxplot_stats(values)[0]
+    for key in ('mean', 'med', 'q1', 'q3', 'whislo', 'whishi'):
+        assert result[key] == pytest.approx(expected[key]), key
+    assert sorted(result['fliers']) == sorted(expected['fliers'])
+
+
+def test_box_stats_of_large_columns():
+    values = np.random.RandomState(3).standard_normal(100000)
+    error = 0.005
+    result = stats.chunked_box_stats(chunks_of(values, 10000), ['v'], error)['v']
+    ordered = np.sort(values)
+    for key, q in (('q1', 0.25), ('med', 0.5), ('q3', 0.75)):
+        assert abs(np.searchsorted(ordered, result[key]) / len(values) - q) <= 2 * error
+    assert result['mean'] == pytest.approx(values.mean())
+    # fewer than TAIL_SIZE values beyond the whiskers, so they are exact
+    hival = result['q3'] + 1.5 * (result['q3'] - result['q1'])
+    assert result['whishi'] == values[values <= hival].max()
+
+
+def test_box_stats_without_values():
+    result = stats.chunked_box_stats(chunks_of([np.nan] * 10), ['v'])['v']
+    assert np.isnan(result['med'])
+    assert len(result['fliers']) == 0
+
+
+def test_auto_bin_edges_match_numpy():
+    for seed in range(5):
+        values = np.random.RandomState(seed).gamma(2.0, size=1000 * (seed + 1))
+        q1, q3 = np.percentile(values, [25, 75])
+        edges = stats.auto_bin_edges(len(values), values.min(), values.max(), q3 - q1)
+        assert np.allclose(edges, np.histogram_bin_edges(values, 'auto'))
+    assert np.allclose(stats.auto_bin_edges(3, 1.0, 1.0, 0.0), np.histogram_bin_edges([1.0] * 3, 'auto'))
+
+
+def test_chunked_histograms_match_numpy():
+    values = np.random.RandomState(3).normal(size=20000)
+    values[::100] = np.nan
+    counts, edges = stats.chunked_histograms(chunks_of(values), ['v'])['v']
+    finite = values[np.isfinite(values)]
+    expected_counts, expected_edges = np.histogram(finite, 'auto')
+    assert np.allclose(edges, expected_edges)
+    assert counts.tolist() == expected_counts.tolist()
+
+
+def test_fft_kde_matches_exact():
+    values = np.random.RandomState(4).normal(size=5000)
+    for bw_method in ('scott', 'silverman', 0.3):
+        x, exact = stats.kde(values, bw_method, exact=True)
+        x2, fft = stats.kde(values, bw_method)
+        assert np.array_equal(x, x2)
+        assert np.abs(fft - exact).max() < 1e-3 * exact.max()
+
+
+def test_kde_needs_distinct_values():
+    with pytest.raises(ValueError):
+        stats.kde([1.0, 1.0, 1.0])
+    with pytest.raises(ValueError):
+        stats.kde([1.0])
+
+
+def test_correlation_matches_pandas():
+    random = np.random.RandomState(5)
+    frame = pd.DataFrame(random.normal(size=(500, 3)), columns=['a', 'b', 'c'])
+    frame['b'] += frame['a']
+    frame.loc[::7, 'c'] = np.nan
+    columns = [frame[name].values for name in frame.columns]
+    for method in ('pearson', 'spearman'):
+        assert np.allclose(stats.correlation(columns, method), frame.corr(method).values)
+
+
+def test_sample_is_uniform_and_bounded():
+    sample = stats.Sample(size=1000)
+    for start in range(0, 100000, 10000):
+        sample.add(np.arange(start, start + 10000, dtype=float))
+    assert sample.count == 100000
+    assert len(sample.values) == 1000
+    assert len(np.unique(sample.values)) == 1000
+    assert abs(np.median(sample.values) - 50000) < 5000
+
+
+def test_jsonable():
+    value = {1: np.arange(2), 'f': np.float32(1.5), 'nan': np.nan, 'b': np.bool_(True)}
+    assert stats.jsonable(value) == {'1': [0, 1], 'f': 1.5, 'nan': None, 'b': True}
@@ -0,0 +1,98 @@
+import csv
+import types
+
+import numpy as np
+import pytest
+
+from .conftest import FIRST_DAY, grid_values, write_grid
+from .test_extract import Input, Response
+
+netCDF4 = pytest.importorskip('netCDF4')
+
+
+SHAPE = (30, 40, 50)
+
+# name, lat, lon and (y, x) cell of each site, the last one outside the grid
+SITES = [
+    ('a', -10.05, 140.12, (5, 12)),
+    ('b', -10.31, 140.4, (31, 40)),
+    ('c', -50.0, 100.0, None),
+]
+
+
+@pytest.fixture
+def values(tmp_path, pywps_config):
+    """temp_max served from a local NetCDF file."""
+    values = grid_values(SHAPE, 0)
+    filename = write_grid(str(tmp_path / 'temp_max.nc'), 'air_temperature', values)
+    pywps_config.set('anuclim:sources', 'temp_max', 'netcdf:{}'.format(filename))
+    return values
+
+
+@pytest.fixture
+def sites_csv(tmp_path):
+    filename = str(tmp_path / 'sites.csv')
+    with open(filename, 'w', newline='') as fp:
+        writer = csv.writer(fp)
+        writer.writerow(['site', 'lat', 'lon', 'habitat'])
+        for name, lat, lon, _ in SITES:
+            writer.writerow([name, lat, lon, 'habitat {}'.format(name)])
+    return filename
+
+
+def timeseries(tmp_path, sites_csv, mime_type='text/csv'):
+    from ecocloud_wps_demo.processes.anuclim_daily_timeseries import ANUClimDailyTimeseries
+    process = ANUClimDailyTimeseries()
+    process.workdir = str(tmp_path)
+    request = types.SimpleNamespace(inputs={
+        'csv': [Input(file=sites_csv)],
+        'variables': [Input('temp_max')],
+    })
+    response = Response(mime_type)
+    process._handler(request, response)
+    return response
+
+
+def test_timeseries_csv(tmp_path, values, sites_csv):
+    response = timeseries(tmp_path, sites_csv)
+    with open(response.outputs['output'].file, newline='') as fp:
+        rows = list(csv.reader(fp))
+    assert rows[0] == ['site', 'lat', 'lon', 'habitat', 'date', 'temp_max']
+    assert len(rows) == len(SITES) * SHAPE[0] + 1
+    row = rows[1 + SHAPE[0] + 3]
+    assert row[0] == 'b'
+    assert row[4] == str(np.datetime64('1970-01-01') + FIRST_DAY + 3)
+    assert float(row[5]) == float(values[3, 31, 40])
+    assert [status[1] for status in response.status] == [33, 66, 100]
+
+
+def test_timeseries_netcdf(tmp_path, values, sites_csv):
+    response = timeseries(tmp_path, sites_csv, 'application/x-netcdf')
+    with netCDF4.Dataset(response.outputs['output'].file) as ds:
+        assert ds.featureType == 'timeSeries'
+        assert ds['site'].cf_role == 'timeseries_id'
+        assert list(ds['site'][:]) == [name for name, _, _, _ in SITES]
+        assert list(ds['habitat'][:]) == ['habitat {}'.format(name) for name, _, _, _ in SITES]
+        series = ds['temp_max'][:]
+        for idx, (_, _, _, cell) in enumerate(SITES):
+            if cell is None:
+                assert series[idx].mask.all()
+            else:
+                expected = values[:, cell[0], cell[1]]
+                assert np.ma.allclose(series[idx], expected)
+                assert (series[idx].mask == np.ma.getmaskarray(expected)).all()
+
+
+def test_timeseries_status_steps(tmp_path, values):
+    filename = str(tmp_path / 'many_sites.csv')
+    with open(filename, 'w', newline='') as fp:
+        writer = csv.writer(fp)
+        writer.writerow(['lat', 'lon'])
+        for i in range(200):
+            writer.writerow([-10.0 - 0.001 * i, 140.0 + 0.001 * i])
+    response = timeseries(tmp_path, filename, 'application/x-netcdf')
+    percents = [status[1] for status in response.status]
+    assert len(percents) <= 21
+    assert percents[-1] == 100
+    with netCDF4.Dataset(response.outputs['output'].file) as ds:
+        assert list(ds['site'][:]) == [str(i) for i in range(200)]